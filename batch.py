@@ -0,0 +1,662 @@
+"""
+Batched generation of names, advancing many words in lockstep.
+
+NumPy is an optional dependency: if it is installed, all words of a
+batch are advanced together using vectorized array operations,
+otherwise a pure Python fallback generates the words one after the
+other from the same tables.
+"""
+
+from __future__ import annotations
+
+import bisect
+import random
+from typing import TYPE_CHECKING, Any
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+import instrumentation
+from serialization import CountBuffer, KeyBuffer
+
+if TYPE_CHECKING:
+    from markov_model import MarkovChain, MarkovModel
+
+
+# largest context code for which NumPy int64 arithmetic cannot overflow
+MAX_NUMPY_CODE = 2 ** 62
+# largest number of possible contexts of an order for which the rows
+# are looked up in a dense array indexed by the context code, instead
+# of bisecting the sorted context codes
+MAX_DENSE_INDEX = 2 ** 22
+
+
+# names of the NumPy arrays of a vectorized ``OrderTable``
+TABLE_ARRAYS = (
+    "keys_array",
+    "offsets_array",
+    "chars_array",
+    "cumulative_array",
+    "guide_offsets_array",
+    "guide_array",
+    "prior_shares_array",
+    "totals_array",
+    "pair_keys_array",
+    "pair_counts_array",
+    "dense_index",
+)
+# names of the NumPy arrays of the start points of a vectorized
+# ``BatchGenerator``
+START_ARRAYS = (
+    "start_points", "start_cased", "start_codes_array", "start_ends"
+)
+
+
+class OrderTable:
+    """
+    Flattened sampling table for all contexts of one Markov chain.
+
+    The contexts are sorted by their packed code. The observed chars of
+    all contexts are stored in one flat array, together with their
+    cumulative weights. The cumulative weights of the context in row
+    ``r`` are normalized and shifted by ``r``, so that they lie in the
+    interval (r, r + 1] and all rows together form one sorted array.
+    Drawing a char for a uniform roll ``u`` in row ``r`` is then a
+    single bisection for ``r + u``, which can be vectorized over many
+    rows at once.
+
+    The vectorized methods do not bisect all rows, but start from a
+    guide table: every row of ``k`` chars is split into ``2 * k`` equal
+    buckets, and the guide of a bucket is the first char whose
+    cumulative weight exceeds the start of the bucket. A draw looks up
+    the guide of the bucket of its roll and only steps forward over the
+    few chars that end inside the bucket, which is much faster than
+    bisecting the whole array.
+
+    The prior is handled as in the ``MarkovChain``: every row stores
+    the share of the prior mass of its total mass, and rolls below that
+    share select a char uniformly from the support.
+    """
+
+    def __init__(
+        self,
+        chain: MarkovChain,
+        vectorized: bool,
+        arrays: dict[str, np.ndarray] | None = None,
+    ) -> None:
+        """
+        :param chain: The trained Markov chain to flatten.
+        :param vectorized: Whether to build the NumPy arrays for the
+            vectorized methods, or the lists for the scalar methods.
+        :param arrays: The NumPy arrays of the table, as returned by
+            ``arrays``, if they were already built for the same chain,
+            for instance in shared memory. Defaults to None, which
+            builds the table from the chain.
+        :raises ValueError: If the table is vectorized, but the context
+            codes of the chain do not fit in NumPy integers.
+        """
+        self.order = chain.order
+        self.base = chain.base
+        self.modulus = self.base ** chain.order
+        self.n_support = len(chain.support)
+        self.prior_mass = chain.prior_mass
+        self.n_contexts = len(chain.counts)
+        if arrays is not None:
+            self.dense_index = None
+            for name, values in arrays.items():
+                setattr(self, name, values)
+            return
+        if vectorized and self.modulus >= MAX_NUMPY_CODE:
+            raise ValueError(
+                f"Contexts of order {self.order} in base {self.base} do "
+                f"not fit in NumPy integers"
+            )
+        keys, offsets, pairs = chain.pack()
+        if vectorized:
+            self._build_arrays(keys, offsets, pairs, chain.prior_mass)
+        else:
+            self._build_lists(keys, offsets, pairs, chain.prior_mass)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """
+        Return the NumPy arrays of a vectorized table.
+
+        :return: Dictionary mapping the names in ``TABLE_ARRAYS`` to the
+            arrays of the table, omitting a missing dense index.
+        """
+        return {
+            name: getattr(self, name)
+            for name in TABLE_ARRAYS
+            if getattr(self, name) is not None
+        }
+
+    def _build_lists(
+        self,
+        keys: KeyBuffer,
+        offsets: CountBuffer,
+        pairs: CountBuffer,
+        prior_mass: float,
+    ) -> None:
+        """
+        Build the table as lists, for the scalar methods.
+
+        :param keys: Sorted codes of all contexts.
+        :param offsets: Offsets of the rows of the contexts in ``pairs``.
+        :param pairs: Rows of alternating char codes and counts.
+        :param prior_mass: The prior mass of every context.
+        :return: None.
+        """
+        self.index = {code: row for row, code in enumerate(keys)}
+        self.offsets = [offset // 2 for offset in offsets]
+        self.chars = list(pairs[::2])
+        counts = pairs[1::2]
+        self.cumulative = []
+        self.prior_shares = []
+        for row in range(self.n_contexts):
+            row_counts = counts[self.offsets[row]:self.offsets[row + 1]]
+            total = sum(row_counts)
+            running = 0
+            for count in row_counts:
+                running += count
+                self.cumulative.append(row + running / total)
+            self.cumulative[-1] = row + 1.0  # avoid rounding errors
+            self.prior_shares.append(prior_mass / (total + prior_mass))
+
+    def _build_arrays(
+        self,
+        keys: CountBuffer,
+        offsets: CountBuffer,
+        pairs: CountBuffer,
+        prior_mass: float,
+    ) -> None:
+        """
+        Build the table as NumPy arrays, for the vectorized methods.
+
+        :param keys: Sorted codes of all contexts.
+        :param offsets: Offsets of the rows of the contexts in ``pairs``.
+        :param pairs: Rows of alternating char codes and counts.
+        :param prior_mass: The prior mass of every context.
+        :return: None.
+        """
+        self.keys_array = np.frombuffer(keys, dtype=np.int64)
+        self.offsets_array = (
+            np.frombuffer(offsets, dtype=np.uint64).astype(np.int64) // 2
+        )
+        # counts may be quantized to fewer bits than the default 32
+        pairs = np.frombuffer(pairs, dtype=f"u{memoryview(pairs).itemsize}")
+        self.chars_array = pairs[0::2].astype(np.int64)
+        counts = pairs[1::2].astype(np.float64)
+        starts = self.offsets_array[:-1]
+        lengths = np.diff(self.offsets_array)
+        rows = np.repeat(np.arange(self.n_contexts), lengths)
+        totals = np.zeros(self.n_contexts)
+        running = np.cumsum(counts)
+        if self.n_contexts:
+            totals = np.add.reduceat(counts, starts)
+            # running sums restarting at every row
+            running -= (running - counts)[starts][rows]
+        self.cumulative_array = rows + running / totals[rows]
+        # avoid rounding errors at the end of every row
+        self.cumulative_array[self.offsets_array[1:] - 1] = (
+            np.arange(self.n_contexts) + 1.0
+        )
+        # guide tables of 2 * k buckets for the rows of k chars
+        buckets = 2 * lengths
+        self.guide_offsets_array = np.zeros(self.n_contexts + 1, np.int64)
+        np.cumsum(buckets, out=self.guide_offsets_array[1:])
+        bucket_rows = np.repeat(np.arange(self.n_contexts), buckets)
+        bucket_starts = bucket_rows + (
+            np.arange(len(bucket_rows))
+            - self.guide_offsets_array[bucket_rows]
+        ) / buckets[bucket_rows]
+        self.guide_array = np.searchsorted(
+            self.cumulative_array, bucket_starts, side="right"
+        )
+        self.prior_shares_array = prior_mass / (totals + prior_mass)
+        self.totals_array = totals
+        # sorted keys of all pairs of row and char, for probability_array
+        pair_keys = rows * self.base + self.chars_array
+        order = np.argsort(pair_keys)
+        self.pair_keys_array = pair_keys[order]
+        self.pair_counts_array = counts[order]
+        self.dense_index = None
+        if self.modulus <= MAX_DENSE_INDEX:
+            self.dense_index = np.full(self.modulus, -1, dtype=np.int64)
+            self.dense_index[self.keys_array] = np.arange(self.n_contexts)
+
+    def draw(self, row: int, roll: float) -> int:
+        """
+        Draw the code of the next char for a single context.
+
+        :param row: The row of the context in the table.
+        :param roll: A uniform random number in [0, 1).
+        :return: The code of the drawn char.
+        """
+        share = self.prior_shares[row]
+        if roll < share:
+            return 1 + min(int(roll / share * self.n_support),
+                           self.n_support - 1)
+        roll = (roll - share) / (1 - share)
+        pos = bisect.bisect_right(
+            self.cumulative,
+            row + roll,
+            self.offsets[row],
+            self.offsets[row + 1] - 1,
+        )
+        return self.chars[pos]
+
+    def lookup_array(self, codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows of many contexts of this order at once.
+
+        :param codes: Array of packed context codes of this order.
+        :return: Tuple of a boolean mask marking the codes that were
+            found and the rows of those codes.
+        """
+        if not self.n_contexts:
+            return np.zeros(len(codes), dtype=bool), codes[:0]
+        if self.dense_index is not None:
+            rows = self.dense_index[codes]
+            found = rows >= 0
+            return found, rows[found]
+        pos = np.searchsorted(self.keys_array, codes)
+        pos = np.minimum(pos, self.n_contexts - 1)
+        found = self.keys_array[pos] == codes
+        return found, pos[found]
+
+    def probability_array(
+        self, rows: np.ndarray, chars: np.ndarray
+    ) -> np.ndarray:
+        """
+        Return the probabilities of chars following many contexts at once.
+
+        :param rows: Array of the rows of the contexts.
+        :param chars: Array of the codes of the following chars, one for
+            every row. Code 0 is the end of the word.
+        :return: Array of the probabilities, including the prior.
+        """
+        keys = rows * self.base + chars
+        pos = np.searchsorted(self.pair_keys_array, keys)
+        pos = np.minimum(pos, len(self.pair_keys_array) - 1)
+        counts = np.where(
+            self.pair_keys_array[pos] == keys, self.pair_counts_array[pos], 0
+        )
+        # the end of the word has no prior
+        prior = np.where(chars > 0, self.prior_mass / self.n_support, 0)
+        return (counts + prior) / (self.totals_array[rows] + self.prior_mass)
+
+    def draw_array(self, rows: np.ndarray, rolls: np.ndarray) -> np.ndarray:
+        """
+        Draw the codes of the next chars for many contexts at once.
+
+        :param rows: Array of the rows of the contexts.
+        :param rolls: Array of uniform random numbers in [0, 1), one for
+            every row.
+        :return: Array of the codes of the drawn chars.
+        """
+        shares = self.prior_shares_array[rows]
+        in_prior = rolls < shares
+        chars = np.empty(len(rows), dtype=np.int64)
+        if in_prior.any():
+            picks = rolls[in_prior] / shares[in_prior] * self.n_support
+            chars[in_prior] = 1 + np.minimum(
+                picks.astype(np.int64), self.n_support - 1
+            )
+        observed = ~in_prior
+        obs_rows = rows[observed]
+        obs_shares = shares[observed]
+        fractions = (rolls[observed] - obs_shares) / (1 - obs_shares)
+        targets = obs_rows + fractions
+        # the first char whose cumulative weight exceeds the target
+        # follows the guide of the bucket of the target
+        guide_starts = self.guide_offsets_array[obs_rows]
+        n_buckets = self.guide_offsets_array[obs_rows + 1] - guide_starts
+        buckets = np.minimum(
+            (fractions * n_buckets).astype(np.int64), n_buckets - 1
+        )
+        pos = self.guide_array[guide_starts + buckets]
+        ends = self.offsets_array[obs_rows + 1] - 1
+        pos = np.minimum(pos, ends)
+        behind = np.flatnonzero(
+            (self.cumulative_array[pos] <= targets) & (pos < ends)
+        )
+        while len(behind):
+            pos[behind] += 1
+            ahead = pos[behind]
+            behind = behind[
+                (self.cumulative_array[ahead] <= targets[behind])
+                & (ahead < ends[behind])
+            ]
+        chars[observed] = self.chars_array[pos]
+        return chars
+
+
+class BatchGenerator:
+    """
+    Generator advancing a batch of words through a model in lockstep.
+    """
+
+    def __init__(
+        self,
+        model: MarkovModel,
+        state: dict[str, Any] | None = None,
+    ) -> None:
+        """
+        :param model: The trained model to generate words from.
+        :param state: The arrays of a vectorized generator of the same
+            model, as returned by ``state``, for instance in shared
+            memory. Defaults to None, which builds all arrays from the
+            model.
+        """
+        top_chain = model.model[model.order]
+        self.order = model.order
+        self.alphabet = top_chain.alphabet
+        self.codes = top_chain.codes
+        self.base = top_chain.base
+        self.vectorized = (
+            np is not None and self.base ** self.order < MAX_NUMPY_CODE
+        )
+        self.max_backoff = model.max_backoff
+        # tables of the back-off orders, from highest to lowest order
+        orders = range(model.order, model.max_backoff - 1, -1)
+        if not self.vectorized:
+            state = None
+        tables = [None] * len(orders) if state is None else state["tables"]
+        self.tables = []
+        # the back-off orders a lazy model has not trained yet get their
+        # tables when the look-ups first back off to them
+        self._model = model
+        self._untrained: list[int] = []
+        for order, arrays in zip(orders, tables):
+            if self._untrained or order not in model.model:
+                self._untrained.append(order)
+            else:
+                self.tables.append(
+                    OrderTable(model.model[order], self.vectorized, arrays)
+                )
+        self.startpoints = model.valid_startpoints
+        if state is None:
+            # chars unknown to the model get code 0, which never occurs
+            # in a context and hence makes every look-up containing it
+            # back off
+            self.start_codes = [
+                self._encode(startpoint)
+                for startpoint in self.startpoints.points
+            ]
+        if self.vectorized:
+            self._prepare_title_case(state)
+
+    def generate(
+        self, n: int, max_length: int, rng: random.Random
+    ) -> list[str]:
+        """
+        Generate a batch of random words.
+
+        :param n: The number of words to generate.
+        :param max_length: The maximum number of characters per word.
+        :param rng: The random number generator to draw from. When using
+            NumPy, it only seeds the NumPy generator of the batch.
+        :return: List of random words, inspired by the learned data.
+        """
+        if self.vectorized:
+            return self._generate_vectorized(n, max_length, rng)
+        return [self._generate_single(max_length, rng) for _ in range(n)]
+
+    def state(self) -> dict[str, Any]:
+        """
+        Return the arrays of a vectorized generator, to rebuild it.
+
+        :return: Dictionary mapping the names in ``START_ARRAYS`` to the
+            arrays of the start points, "tables" to the list of the
+            arrays of all tables, as returned by ``OrderTable.arrays``,
+            and "vectorized_title" to whether words are title-cased as
+            arrays.
+        """
+        while self._untrained:
+            self._add_table()
+        state = {name: getattr(self, name) for name in START_ARRAYS}
+        state["tables"] = [table.arrays() for table in self.tables]
+        state["vectorized_title"] = self.vectorized_title
+        return state
+
+    def _add_table(self) -> None:
+        """
+        Add the table of the highest back-off order that has none yet.
+
+        Looking up the chain of the order trains it, if the model has
+        not trained it yet.
+
+        :return: None.
+        """
+        order = self._untrained.pop(0)
+        self.tables.append(
+            OrderTable(self._model.model[order], self.vectorized)
+        )
+
+    def _prepare_title_case(self, state: dict[str, Any] | None) -> None:
+        """
+        Prepare the look-up tables to title-case words as code points.
+
+        Title-casing a word only depends on whether the preceding char is
+        cased, so it can be applied to all words at once, using tables
+        of the lower- and titlecase code points of every char. This is
+        only possible if all mappings yield single chars, otherwise the
+        words are title-cased one by one.
+
+        :param state: The arrays of the start points, as returned by
+            ``state``, or None to build them from the start points.
+        :return: None.
+        """
+        lower = [char.lower() for char in self.alphabet[1:]]
+        title = [char.title() for char in self.alphabet[1:]]
+        if state is not None:
+            for name in START_ARRAYS:
+                setattr(self, name, state[name])
+            self.vectorized_title = state["vectorized_title"]
+        else:
+            starts = self.startpoints.points
+            titled_starts = [start.title() for start in starts]
+            self.vectorized_title = all(
+                len(char) == 1 for char in lower + title
+            ) and all(len(start) == self.order for start in titled_starts)
+            if not self.vectorized_title:
+                titled_starts = starts
+            self.start_points = np.array(
+                [[ord(char) for char in start] for start in titled_starts],
+                dtype=np.uint32,
+            ).reshape(len(starts), self.order)
+            self.start_cased = np.array(
+                [_is_cased(start[-1:]) for start in titled_starts],
+                dtype=bool,
+            )
+            self.start_codes_array = np.array(
+                self.start_codes, dtype=np.int64
+            )
+            # the start points are drawn by their counts
+            self.start_ends = np.cumsum(
+                self.startpoints.counts, dtype=np.int64
+            )
+        self.lower_points = np.array(
+            [0] + [ord(char[0]) for char in lower], dtype=np.uint32
+        )
+        self.title_points = np.array(
+            [0] + [ord(char[0]) for char in title], dtype=np.uint32
+        )
+        self.cased = np.array(
+            [False] + [_is_cased(char) for char in lower], dtype=bool
+        )
+
+    def _encode(self, context: str) -> int:
+        """
+        Pack a context into an integer, using code 0 for unknown chars.
+
+        :param context: The context to encode.
+        :return: The packed code of the context.
+        """
+        code = 0
+        for char in context:
+            code = code * self.base + self.codes.get(char, 0)
+        return code
+
+    def _next_char(self, code: int, roll: float) -> int:
+        """
+        Draw the next char for a context, backing off where required.
+
+        :param code: The packed code of the context of the top order.
+        :param roll: A uniform random number in [0, 1).
+        :return: The code of the next char, 0 for the end of the word.
+        """
+        # the loop also runs over tables added while it runs
+        for table in self.tables:
+            row = table.index.get(code % table.modulus)
+            if row is not None:
+                if instrumentation.active is not None:
+                    self._record_lookups(table.order, 1)
+                return table.draw(row, roll)
+            if self._untrained and table is self.tables[-1]:
+                self._add_table()
+        if instrumentation.active is not None:
+            self._record_lookups(None, 1)
+        return 0
+
+    def _generate_single(self, max_length: int, rng: random.Random) -> str:
+        """
+        Generate a single word in pure Python.
+
+        :param max_length: The maximum number of characters in the word.
+        :param rng: The random number generator to draw from.
+        :return: A random word.
+        """
+        choice = self.startpoints.locate(rng.randrange(len(self.startpoints)))
+        word = [self.startpoints.points[choice]]
+        code = self.start_codes[choice]
+        modulus = self.base ** (self.order - 1)
+        truncated = False
+        for _ in range(max_length - self.order):
+            char = self._next_char(code, rng.random())
+            if char == 0:
+                break
+            word.append(self.alphabet[char])
+            code = code % modulus * self.base + char
+        else:
+            truncated = True
+        if instrumentation.active is not None:
+            instrumentation.active.record_names(1, truncated)
+        return "".join(word).title()
+
+    def _generate_vectorized(
+        self, n: int, max_length: int, rng: random.Random
+    ) -> list[str]:
+        """
+        Generate a batch of words in lockstep, using NumPy.
+
+        In every step, one random number is drawn for every unfinished
+        word and the next chars of all of them are determined at once.
+        Words that drew the end-of-word char are masked out of all
+        further steps.
+
+        :param n: The number of words to generate.
+        :param max_length: The maximum number of characters per word.
+        :param rng: The random number generator to seed NumPy with.
+        :return: List of random words.
+        """
+        generator = np.random.default_rng(rng.getrandbits(64))
+        choices = np.searchsorted(
+            self.start_ends,
+            generator.integers(len(self.startpoints), size=n),
+            side="right",
+        )
+        codes = self.start_codes_array[choices]
+        modulus = self.base ** (self.order - 1)
+        # codes of the generated chars, with 0 as padding after the end
+        width = max(max_length - self.order, 0)
+        generated = np.zeros((n, width), dtype=np.int64)
+        active = np.arange(n)
+        for step in range(width):
+            if len(active) == 0:
+                break
+            rolls = generator.random(len(active))
+            chars = self._next_chars(codes[active], rolls)
+            ongoing = chars != 0
+            active = active[ongoing]
+            chars = chars[ongoing]
+            generated[active, step] = chars
+            codes[active] = codes[active] % modulus * self.base + chars
+        if instrumentation.active is not None:
+            instrumentation.active.record_names(n, len(active))
+        if self.vectorized_title and width > 0:
+            # a char is title-cased if the preceding one is not cased
+            preceded_by_cased = np.empty((n, width), dtype=bool)
+            preceded_by_cased[:, 0] = self.start_cased[choices]
+            preceded_by_cased[:, 1:] = self.cased[generated[:, :-1]]
+            points = np.where(
+                preceded_by_cased,
+                self.lower_points[generated],
+                self.title_points[generated],
+            )
+        else:
+            points = self.lower_points[generated]
+        points = np.concatenate(
+            [self.start_points[choices], points], axis=1
+        ).astype(np.uint32)
+        if points.shape[1] == 0:
+            return [""] * n
+        # NumPy strips the trailing zero padding from unicode strings
+        words = points.view(f"<U{points.shape[1]}").ravel().tolist()
+        if self.vectorized_title:
+            return words
+        return [word.title() for word in words]
+
+    def _next_chars(self, codes: np.ndarray, rolls: np.ndarray) -> np.ndarray:
+        """
+        Vectorized version of ``_next_char`` for an array of contexts.
+
+        :param codes: Array of packed codes of contexts of the top order.
+        :param rolls: Array of uniform random numbers in [0, 1).
+        :return: Array of the codes of the next chars, 0 for the end
+            of the word.
+        """
+        chars = np.zeros(len(codes), dtype=np.int64)
+        pending = np.arange(len(codes))
+        for table in self.tables:
+            if len(pending) == 0:
+                break
+            found, rows = table.lookup_array(codes[pending] % table.modulus)
+            hits = pending[found]
+            chars[hits] = table.draw_array(rows, rolls[hits])
+            pending = pending[~found]
+            if instrumentation.active is not None:
+                self._record_lookups(table.order, len(hits))
+            if len(pending) and self._untrained and (
+                table is self.tables[-1]
+            ):
+                self._add_table()
+        if instrumentation.active is not None:
+            self._record_lookups(None, len(pending))
+        return chars
+
+    def _record_lookups(self, resolved: int | None, count: int) -> None:
+        """
+        Record look-ups of contexts in the active profile.
+
+        :param resolved: The order of the table that knew the contexts,
+            or None if none did.
+        :param count: The number of look-ups.
+        :return: None.
+        """
+        profile = instrumentation.active
+        profile.record_lookup(self.order, resolved, self.max_backoff, count)
+        if resolved is not None:
+            profile.record_samples(resolved, count)
+
+
+def _is_cased(char: str) -> bool:
+    """
+    Return whether the given char is cased, as understood by ``str.title``.
+
+    :param char: A single char, or an empty string.
+    :return: True if the char is an upper-, lower- or titlecase letter.
+    """
+    return char.isupper() or char.islower() or char.istitle()
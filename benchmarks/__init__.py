@@ -0,0 +1,15 @@
+"""
+Benchmark suite for the hot paths of training, sampling and generation.
+
+Run the suite from the root of the repository with
+
+    python -m benchmarks --output results.json
+
+and compare a later run against a stored baseline with
+
+    python -m benchmarks --compare results.json
+
+The suite only uses the standard library. All corpora are synthetic
+and reproducible, so results of different runs on the same machine are
+comparable.
+"""
@@ -0,0 +1,136 @@
+"""
+Runner of the benchmark suite.
+"""
+
+import argparse
+import sys
+
+from benchmarks import compare, suite
+
+
+def main(args: argparse.Namespace) -> int:
+    """
+    Run the benchmarks chosen in the args and report the results.
+
+    :param args: Namespace from the argument parser.
+    :return: The exit status, 1 if a regression against the baseline
+        was found, otherwise 0.
+    """
+    benchmarks = args.benchmarks or list(suite.BENCHMARKS.keys())
+    results = suite.run(
+        benchmarks, args.orders, args.sizes, args.repeat, print
+    )
+    if args.output is not None:
+        compare.save(results, args.output)
+    if args.compare is None:
+        return 0
+    changes = compare.compare(compare.load(args.compare), results)
+    print(f"Compared with {args.compare}:")
+    for change in changes:
+        print(compare.format_change(change, args.threshold))
+    regressions = [c for c in changes if c.is_regression(args.threshold)]
+    if regressions:
+        print(
+            f"{len(regressions)} of {len(changes)} metrics regressed by "
+            f"more than {args.threshold:.0%}"
+        )
+        return 1
+    return 0
+
+
+def _int_list(text: str) -> list[int]:
+    """
+    Parse a comma-separated list of integers and ranges like "1-6".
+
+    :param text: The text of the list.
+    :return: The integers.
+    """
+    values = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        values.extend(range(int(first), int(last or first) + 1))
+    return values
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark training, sampling and generation on synthetic "
+            "corpora"
+        ),
+        prog="python -m benchmarks",
+    )
+    parser.add_argument(
+        "benchmarks",
+        help="The benchmarks to run. Defaults to all.",
+        choices=list(suite.BENCHMARKS.keys()),
+        nargs="*",
+    )
+    parser.add_argument(
+        "--orders",
+        help="Comma-separated orders or ranges of orders. Defaults to 1-6.",
+        default=suite.ORDERS,
+        type=_int_list,
+    )
+    parser.add_argument(
+        "--sizes",
+        help=(
+            "Comma-separated numbers of words of the synthetic corpora. "
+            "Defaults to 1000,10000,100000. The full suite also runs "
+            "1000000,5000000, which takes much longer."
+        ),
+        default=suite.DEFAULT_SIZES,
+        type=_int_list,
+    )
+    parser.add_argument(
+        "--full",
+        help="Run all corpus sizes up to 5 million words.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help=(
+            "Number of repetitions of every measurement, of which the "
+            "fastest is reported. Defaults to 3."
+        ),
+        default=3,
+        type=int,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Write the results as JSON to the given path.",
+        default=None,
+    )
+    parser.add_argument(
+        "--compare",
+        help=(
+            "Compare the results with the baseline in the given JSON file "
+            "and exit with status 1 if any metric regressed."
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--threshold",
+        help=(
+            "Relative change of a metric that counts as a regression. "
+            f"Defaults to {compare.DEFAULT_THRESHOLD}."
+        ),
+        default=compare.DEFAULT_THRESHOLD,
+        type=float,
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    parser_ = build_parser()
+    args_ = parser_.parse_args()
+    if args_.full:
+        args_.sizes = suite.SIZES
+    try:
+        sys.exit(main(args_))
+    except (KeyError, ValueError) as error:
+        parser_.error(str(error))
+    except KeyboardInterrupt:
+        print("Execution forcefully stopped.")
@@ -0,0 +1,141 @@
+"""
+Storage of benchmark results and comparison against a baseline.
+"""
+
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from benchmarks.suite import Result
+
+
+FORMAT_VERSION = 1
+# relative change of a metric beyond which it counts as a regression
+DEFAULT_THRESHOLD = 0.1
+
+
+class Change(NamedTuple):
+    """
+    Change of a metric between a baseline and a new run.
+    """
+
+    baseline: Result
+    result: Result
+
+    @property
+    def ratio(self) -> float:
+        """
+        Return how much better the new value is, as a factor.
+
+        :return: The factor, above 1 for improvements and below 1 for
+            regressions, regardless of the direction of the metric.
+        """
+        old, new = self.baseline.value, self.result.value
+        if not old or not new:
+            return 1.0 if old == new else 0.0
+        return new / old if self.result.higher_is_better else old / new
+
+    def is_regression(self, threshold: float) -> bool:
+        """
+        Return whether the metric got worse by more than the threshold.
+
+        :param threshold: The tolerated relative change.
+        :return: Whether it is a regression.
+        """
+        return self.ratio < 1 - threshold
+
+
+def environment() -> dict[str, Any]:
+    """
+    Return a description of the machine and interpreter of a run.
+
+    :return: Dictionary of the Python version and implementation, the
+        platform, whether NumPy is available and the time of the run.
+    """
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:  # NumPy is optional
+        numpy_version = None
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "numpy": numpy_version,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def save(results: list[Result], filepath: str | Path) -> None:
+    """
+    Save results as a JSON file.
+
+    :param results: The results of a run.
+    :param filepath: The path of the file.
+    :return: None.
+    """
+    document = {
+        "version": FORMAT_VERSION,
+        "environment": environment(),
+        "results": [result._asdict() for result in results],
+    }
+    with open(filepath, "w", encoding="utf8") as file:
+        json.dump(document, file, indent=2)
+        file.write("\n")
+
+
+def load(filepath: str | Path) -> list[Result]:
+    """
+    Load results from a JSON file written by ``save``.
+
+    :param filepath: The path of the file.
+    :raises ValueError: If the file is of an unsupported version.
+    :return: The results.
+    """
+    with open(filepath, encoding="utf8") as file:
+        document = json.load(file)
+    if document.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported results version: {document.get('version')}"
+        )
+    return [Result(**result) for result in document["results"]]
+
+
+def compare(baseline: list[Result], results: list[Result]) -> list[Change]:
+    """
+    Pair the results of a run with those of a baseline.
+
+    Metrics that only one of the runs measured are skipped.
+
+    :param baseline: The results of the baseline.
+    :param results: The results of the new run.
+    :return: The changes of all metrics measured by both runs, in the
+        order of the new run.
+    """
+    old = {result.key: result for result in baseline}
+    return [
+        Change(old[result.key], result)
+        for result in results
+        if result.key in old
+    ]
+
+
+def format_change(change: Change, threshold: float) -> str:
+    """
+    Return a change as a line of text, marking regressions.
+
+    :param change: The change.
+    :param threshold: The tolerated relative change.
+    :return: The text.
+    """
+    result = change.result
+    order = "" if result.order is None else f" order {result.order}"
+    flag = "REGRESSION" if change.is_regression(threshold) else ""
+    return (
+        f"{result.benchmark}{order} ({result.words} words) {result.metric}: "
+        f"{change.baseline.value:.4g} -> {result.value:.4g} "
+        f"({change.ratio - 1:+.1%}) {flag}"
+    ).rstrip()
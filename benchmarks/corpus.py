@@ -0,0 +1,66 @@
+"""
+Synthetic, reproducible corpora of name-like words.
+"""
+
+import csv
+import random
+from pathlib import Path
+
+
+ONSETS = [
+    "", "b", "br", "d", "f", "g", "h", "k", "l", "m", "n", "p", "r", "s",
+    "st", "sch", "t", "th", "v", "w", "z",
+]
+VOWELS = ["a", "e", "i", "o", "u", "ei", "au", "ie", "ä", "ö", "ü"]
+CODAS = ["", "", "n", "r", "l", "m", "ng", "s", "ch", "rg", "nd", "ck"]
+SUFFIXES = ["", "", "", "burg", "berg", "stadt", "dorf", "heim", "hausen"]
+
+
+def synthetic_words(n: int, seed: int = 0) -> list[str]:
+    """
+    Return a corpus of random lowercase words built from syllables.
+
+    The syllables are drawn from skewed distributions, so that the
+    words have frequent and rare contexts like real names.
+
+    :param n: The number of words.
+    :param seed: The seed of the corpus. The same seed yields the same
+        words.
+    :return: The list of words.
+    """
+    rng = random.Random(seed)
+    onset_weights = [1 / (i + 1) for i in range(len(ONSETS))]
+    vowel_weights = [1 / (i + 1) for i in range(len(VOWELS))]
+    words = []
+    for _ in range(n):
+        syllables = [
+            rng.choices(ONSETS, onset_weights)[0]
+            + rng.choices(VOWELS, vowel_weights)[0]
+            + rng.choice(CODAS)
+            for _ in range(rng.randint(1, 3))
+        ]
+        words.append("".join(syllables) + rng.choice(SUFFIXES))
+    return words
+
+
+def write_cities_csv(words: list[str], filepath: str | Path) -> None:
+    """
+    Write words as a file in the format of the world cities dataset.
+
+    :param words: The words to write as city names.
+    :param filepath: The path of the file.
+    :return: None.
+    """
+    countries = ["DE", "AT", "CH", "US", "FR", "BR"]
+    with open(filepath, "w", newline="", encoding="utf8") as csvfile:
+        writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+        writer.writerow(
+            ["city", "city_ascii", "lat", "lng", "country", "iso2",
+             "admin_name", "population", "id"]
+        )
+        for i, word in enumerate(words):
+            name = word.title()
+            writer.writerow(
+                [name, name, "0.0", "0.0", "Country",
+                 countries[i % len(countries)], "Admin", "1000", str(i)]
+            )
@@ -0,0 +1,329 @@
+"""
+Benchmarks of the hot paths, and their results.
+
+Every benchmark takes a corpus and an order and returns the results of
+its metrics. Times are the best of several repetitions, which is the
+least disturbed by other processes, and are reported as throughputs or
+latencies per call.
+"""
+
+import gc
+import random
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+import loaders
+import markov_model
+from benchmarks import corpus
+
+
+# orders and corpus sizes in words of a full run
+ORDERS = (1, 2, 3, 4, 5, 6)
+SIZES = (1000, 10000, 100000, 1000000, 5000000)
+# corpus sizes of a default run, which takes a few minutes
+DEFAULT_SIZES = (1000, 10000, 100000)
+# number of updates, samples and names per measured call
+UPDATES = 100000
+SAMPLES = 100000
+NAMES = 10000
+MAX_LENGTH = 12
+# corpora larger than this are only processed once per measurement
+MAX_REPEATED_SIZE = 100000
+
+
+class Result(NamedTuple):
+    """
+    Result of one metric of a benchmark.
+    """
+
+    benchmark: str
+    order: int | None
+    words: int
+    metric: str
+    value: float
+    higher_is_better: bool
+
+    @property
+    def key(self) -> tuple[str, int | None, int, str]:
+        """
+        Return what identifies the result across runs.
+
+        :return: Tuple of the benchmark, order, size and metric.
+        """
+        return self.benchmark, self.order, self.words, self.metric
+
+
+class Fixture:
+    """
+    Corpus of a run and the models trained on it, built on first use.
+    """
+
+    def __init__(self, words: list[str]) -> None:
+        """
+        :param words: The training words.
+        """
+        self.words = words
+        self._models: dict[int, markov_model.MarkovModel] = dict()
+
+    def model(self, order: int) -> markov_model.MarkovModel:
+        """
+        Return the model of an order trained on the corpus.
+
+        :param order: The order of the model.
+        :return: The trained model.
+        """
+        if order not in self._models:
+            self._models[order] = markov_model.MarkovModel(
+                self.words, order, 0, rng=0
+            )
+        return self._models[order]
+
+    def contexts(self, order: int, n: int) -> list[str]:
+        """
+        Return contexts of the corpus, as seen when generating.
+
+        :param order: The length of the contexts.
+        :param n: The number of contexts.
+        :return: The list of contexts, drawn from the words of at least
+            the length of the contexts.
+        """
+        rng = random.Random(order)
+        words = [word for word in self.words if len(word) >= order]
+        contexts = []
+        for word in rng.choices(words, k=n):
+            end = rng.randint(order, len(word))
+            contexts.append(word[end - order:end])
+        return contexts
+
+
+def best_time(func: Callable[[], object], repeat: int) -> float:
+    """
+    Return the shortest time of several calls of a function.
+
+    :param func: The function to time.
+    :param repeat: The number of calls.
+    :return: The shortest time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_learn(fixture: Fixture, order: int, repeat: int) -> list[Result]:
+    """
+    Measure the throughput of ``MarkovChain.learn`` and ``update``.
+
+    :param fixture: The corpus and its models.
+    :param order: The order of the chains and models.
+    :param repeat: The number of repetitions of every measurement.
+    :return: The results of the metrics.
+    """
+    words = fixture.words
+    if len(words) > MAX_REPEATED_SIZE:
+        repeat = 1
+
+    def learn() -> None:
+        chain = markov_model.MarkovChain([], order, 0)
+        for word in words:
+            chain.learn(word)
+
+    pairs = []
+    for word in words:
+        ended = word + "\n"
+        pairs.extend(
+            (ended[i - order:i], ended[i])
+            for i in range(order, len(ended))
+        )
+        if len(pairs) >= UPDATES:
+            break
+    pairs = pairs[:UPDATES]
+    chain = markov_model.MarkovChain(words[:1000], order, 0)
+
+    def update() -> None:
+        for context, char in pairs:
+            chain.update(context, char)
+
+    return [
+        Result("learn", order, len(words), "words_per_second",
+               len(words) / best_time(learn, repeat), True),
+        Result("update", order, len(words), "updates_per_second",
+               len(pairs) / best_time(update, repeat), True),
+    ]
+
+
+def bench_sample(fixture: Fixture, order: int, repeat: int) -> list[Result]:
+    """
+    Measure the latency of ``MarkovChain.sample`` and
+    ``MarkovModel.sample``.
+
+    :param fixture: The corpus and its models.
+    :param order: The order of the chains and models.
+    :param repeat: The number of repetitions of every measurement.
+    :return: The results of the metrics.
+    """
+    model = fixture.model(order)
+    chain = model.model[order]
+    contexts = fixture.contexts(order, SAMPLES)
+    decoded = chain.chain
+    known = [context for context in contexts if context in decoded]
+    rng = random.Random(0)
+
+    def chain_sample() -> None:
+        for context in known:
+            chain.sample(context, rng)
+
+    def model_sample() -> None:
+        for context in contexts:
+            model.sample(context, order)
+
+    return [
+        Result("chain_sample", order, len(fixture.words), "microseconds",
+               best_time(chain_sample, repeat) / len(known) * 1e6, False),
+        Result("model_sample", order, len(fixture.words), "microseconds",
+               best_time(model_sample, repeat) / len(contexts) * 1e6,
+               False),
+    ]
+
+
+def bench_generate(
+    fixture: Fixture, order: int, repeat: int
+) -> list[Result]:
+    """
+    Measure the throughput of ``generate`` and ``generate_batch``.
+
+    :param fixture: The corpus and its models.
+    :param order: The order of the chains and models.
+    :param repeat: The number of repetitions of every measurement.
+    :return: The results of the metrics.
+    """
+    model = fixture.model(order)
+
+    def generate() -> None:
+        for _ in range(NAMES):
+            model.generate(MAX_LENGTH)
+
+    model.generate_batch(1, MAX_LENGTH)  # build the tables beforehand
+    return [
+        Result("generate", order, len(fixture.words), "names_per_second",
+               NAMES / best_time(generate, repeat), True),
+        Result("generate_batch", order, len(fixture.words),
+               "names_per_second",
+               NAMES / best_time(
+                   lambda: model.generate_batch(NAMES, MAX_LENGTH), repeat
+               ),
+               True),
+    ]
+
+
+def bench_memory(fixture: Fixture, order: int, repeat: int) -> list[Result]:
+    """
+    Measure the peak memory of training a model.
+
+    :param fixture: The corpus and its models.
+    :param order: The order of the chains and models.
+    :param repeat: The number of repetitions of every measurement.
+    :return: The results of the metrics.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        markov_model.MarkovModel(fixture.words, order, 0)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return [
+        Result("train_memory", order, len(fixture.words), "peak_bytes",
+               peak, False),
+    ]
+
+
+def bench_load(fixture: Fixture, order: None, repeat: int) -> list[Result]:
+    """
+    Measure the time to parse a dataset file with a loader.
+
+    :param fixture: The corpus, written as a file of world cities.
+    :param order: Unused, as loading does not depend on an order.
+    :param repeat: The number of repetitions of every measurement.
+    :return: The results of the metrics.
+    """
+    if len(fixture.words) > MAX_REPEATED_SIZE:
+        repeat = 1
+    loader = loaders.WorldCitiesLoader("german")
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = Path(directory) / "cities.csv"
+        corpus.write_cities_csv(fixture.words, filepath)
+        seconds = best_time(lambda: list(loader.load(filepath)), repeat)
+    return [
+        Result("load", None, len(fixture.words), "rows_per_second",
+               len(fixture.words) / seconds, True),
+    ]
+
+
+type BenchmarkType = Callable[[Fixture, int | None, int], list[Result]]
+
+# benchmarks by name, and whether they run once per order
+BENCHMARKS: dict[str, tuple[BenchmarkType, bool]] = {
+    "learn": (bench_learn, True),
+    "sample": (bench_sample, True),
+    "generate": (bench_generate, True),
+    "memory": (bench_memory, True),
+    "load": (bench_load, False),
+}
+
+
+def run(
+    benchmarks: list[str],
+    orders: list[int],
+    sizes: list[int],
+    repeat: int = 3,
+    progress: Callable[[str], None] | None = None,
+) -> list[Result]:
+    """
+    Run benchmarks for all combinations of corpus sizes and orders.
+
+    :param benchmarks: The names of the benchmarks, keys of
+        ``BENCHMARKS``.
+    :param orders: The orders of the chains and models.
+    :param sizes: The numbers of words of the corpora.
+    :param repeat: The number of repetitions of every measurement.
+    :param progress: Callable receiving a line of text after every
+        benchmark. Defaults to None, which reports nothing.
+    :raises KeyError: If a benchmark is unknown.
+    :return: The results of all metrics.
+    """
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            raise KeyError(f"Unknown benchmark: {name}")
+    results = []
+    for size in sizes:
+        fixture = Fixture(corpus.synthetic_words(size))
+        for name in benchmarks:
+            func, per_order = BENCHMARKS[name]
+            for order in orders if per_order else [None]:
+                new = func(fixture, order, repeat)
+                results.extend(new)
+                if progress is not None:
+                    progress(", ".join(format_result(r) for r in new))
+    return results
+
+
+def format_result(result: Result) -> str:
+    """
+    Return a result as a line of text.
+
+    :param result: The result.
+    :return: The text.
+    """
+    order = "" if result.order is None else f" order {result.order}"
+    return (
+        f"{result.benchmark}{order} ({result.words} words): "
+        f"{result.value:.4g} {result.metric}"
+    )
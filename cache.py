@@ -0,0 +1,230 @@
+"""
+Content-addressed cache of trained Markov models.
+
+Models are stored in the binary format of ``MarkovModel.save`` in a
+cache directory, under a key derived from everything that determines
+the trained model: the content of the dataset file, the loader and its
+parameters, and the parameters of the model. The cache is bounded in
+size and evicts the least recently used models first.
+"""
+
+import hashlib
+import json
+import os
+import random
+from pathlib import Path
+from typing import Any
+
+import columnar
+import loaders
+import markov_model
+
+
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+SUFFIX = ".mcbn"
+# subdirectory of the columnar forms of the datasets
+DATASETS_DIRECTORY = "datasets"
+_STATS_FILE = "stats.json"
+
+
+def default_directory() -> Path:
+    """
+    Return the default cache directory, following the XDG convention.
+
+    :return: Path of the default cache directory.
+    """
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "mcbarnag"
+
+
+def file_digest(filepath: str | Path) -> str:
+    """
+    Return the SHA-256 hex digest of the content of a file.
+
+    :param filepath: Path of the file to hash.
+    :return: The hex digest.
+    """
+    with open(filepath, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def model_key(
+    dataset: str | Path,
+    loader: loaders.LoaderABC,
+    order: int,
+    prior: float,
+    max_backoff: int,
+    sampler: str,
+    novelty: str | None = None,
+    digest: str | None = None,
+) -> str:
+    """
+    Derive the cache key of a model from its training setup.
+
+    :param dataset: Path of the dataset file the model is trained on.
+    :param loader: The loader used to load the dataset.
+    :param order: The order of the model.
+    :param prior: The prior of the model.
+    :param max_backoff: The maximum back-off order of the model.
+    :param sampler: The sampler of the model.
+    :param novelty: The kind of index of the training words.
+    :param digest: The digest of the dataset file as returned by
+        ``file_digest``, if known already.
+    :return: The key, as a hex digest.
+    """
+    setup = {
+        "dataset": digest or file_digest(dataset),
+        "loader": type(loader).__name__,
+        "loader_parameters": vars(loader),
+        "order": order,
+        "prior": prior,
+        "max_backoff": max_backoff,
+        "sampler": sampler,
+        "novelty": novelty,
+    }
+    encoded = json.dumps(setup, sort_keys=True).encode("utf8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ModelCache:
+    """
+    Size-bounded cache of trained models with LRU eviction.
+
+    The modification time of a cached file serves as its last access
+    time. Hits, misses and evictions are counted persistently in the
+    cache directory. The columnar forms of the datasets the models are
+    trained on are kept in a subdirectory, outside of the size limit.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path | None = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> None:
+        """
+        :param directory: The cache directory, created if necessary.
+            Defaults to the directory given by ``default_directory``.
+        :param max_bytes: The maximum total size of all cached models.
+        """
+        self.directory = Path(directory or default_directory())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.datasets_directory = self.directory / DATASETS_DIRECTORY
+        self.max_bytes = max_bytes
+
+    def get(
+        self, key: str, rng: random.Random | int | None = None
+    ) -> markov_model.MarkovModel | None:
+        """
+        Load the model of the given key from the cache.
+
+        :param key: The key of the model.
+        :param rng: The random number generator of the loaded model, or
+            a seed to create one from.
+        :return: The model, or None if it is not cached.
+        """
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return markov_model.MarkovModel.load(path, rng)
+
+    def put(self, key: str, model: markov_model.MarkovModel) -> None:
+        """
+        Store the model under the given key, evicting old models.
+
+        :param key: The key of the model.
+        :param model: The trained model.
+        :return: None.
+        """
+        path = self._path(key)
+        # write to a temporary file first, so that concurrent runs never
+        # load a partially written model
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        model.save(temporary)
+        os.replace(temporary, path)
+        self._evict()
+
+    def clear(self) -> None:
+        """
+        Remove all cached models and datasets and reset the statistics.
+
+        :return: None.
+        """
+        for path in self.directory.glob(f"*{SUFFIX}"):
+            path.unlink(missing_ok=True)
+        for path in self.datasets_directory.glob(f"*{columnar.SUFFIX}"):
+            path.unlink(missing_ok=True)
+        (self.directory / _STATS_FILE).unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Return the statistics of the cache.
+
+        :return: Dictionary of the number of hits, misses and evictions,
+            the number of cached models and their total size in bytes.
+        """
+        stats = {"hits": 0, "misses": 0, "evictions": 0}
+        stats.update(self._read_stats())
+        files = list(self.directory.glob(f"*{SUFFIX}"))
+        stats["models"] = len(files)
+        stats["bytes"] = sum(path.stat().st_size for path in files)
+        return stats
+
+    def _path(self, key: str) -> Path:
+        """
+        Return the path of the cached model of the given key.
+
+        :param key: The key of the model.
+        :return: The path of the model file.
+        """
+        return self.directory / f"{key}{SUFFIX}"
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used models until the size fits.
+
+        :return: None.
+        """
+        files = [
+            (path.stat().st_mtime_ns, path.stat().st_size, path)
+            for path in self.directory.glob(f"*{SUFFIX}")
+        ]
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                continue  # still mapped by another process on Windows
+            total -= size
+            self._count("evictions")
+
+    def _read_stats(self) -> dict[str, Any]:
+        """
+        Read the persistent counters of the cache.
+
+        :return: Dictionary of the counters, empty if there are none.
+        """
+        try:
+            with open(self.directory / _STATS_FILE, encoding="utf8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return dict()
+
+    def _count(self, name: str) -> None:
+        """
+        Increment one of the persistent counters of the cache.
+
+        :param name: The name of the counter.
+        :return: None.
+        """
+        stats = self._read_stats()
+        stats[name] = stats.get(name, 0) + 1
+        temporary = self.directory / f"{_STATS_FILE}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf8") as file:
+            json.dump(stats, file)
+        os.replace(temporary, self.directory / _STATS_FILE)
@@ -0,0 +1,242 @@
+"""
+Pre-parsed, columnar binary form of the datasets of the loaders.
+
+Parsing a CSV dataset is a fixed cost of every run that trains a model.
+A columnar dataset holds the rows of a dataset already parsed: every
+distinct name is stored once in a string table, each row refers to its
+name by id, and the rows of every group (the country of a city) are
+indexed, so that selecting some groups is a look-up of their rows
+instead of a scan of all rows. The file is memory-mapped and validated
+by the SHA-256 digest of the source file it was built from.
+
+Layout (little-endian, every array aligned to 8 bytes):
+
+- header: magic ``b"MCBD"``, format version (u16), padding (u16),
+  length of the metadata (u32), SHA-256 digest of the source (32 bytes),
+  number of rows (u64), number of distinct names (u64), size of the
+  string table (u64)
+- metadata: UTF-8 encoded JSON with the sorted list of the groups
+- the string table: all distinct names, separated by newlines (UTF-8),
+  which never occur in names as they end words
+- the name ids of all rows in the order of the source (u32)
+- the offsets of the groups into the grouped rows (u64, one more than
+  groups) and the positions of the rows, grouped and in the order of
+  the source within every group (u32)
+"""
+
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from serialization import align, map_file, pad
+
+
+MAGIC = b"MCBD"
+FORMAT_VERSION = 1
+SUFFIX = ".mcbd"
+
+_HEADER = struct.Struct("<4sHxxI32sQQQ")
+
+
+class ColumnarDataset:
+    """
+    Memory-mapped columnar dataset, as written by ``write_dataset``.
+
+    The string table is decoded on first use and kept, so every distinct
+    name is decoded and held in memory only once.
+    """
+
+    def __init__(self, buffer: mmap.mmap | bytes) -> None:
+        """
+        :param buffer: The content of a columnar dataset file.
+        :raises ValueError: If the buffer does not hold a columnar
+            dataset of a supported format version.
+        """
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise ValueError("Buffer is too small to hold a dataset")
+        (magic, version, metadata_size, self.digest, n_rows, n_names,
+         table_size) = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("Buffer does not hold a McBarnag dataset")
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported dataset format version: {version}"
+            )
+        self.buffer = buffer
+        pos = _HEADER.size
+        metadata = json.loads(bytes(view[pos:pos + metadata_size]))
+        self.groups: list[str] = metadata["groups"]
+        self.group_index = {
+            group: index for index, group in enumerate(self.groups)
+        }
+        pos = align(pos + metadata_size)
+        arrays = []
+        columns = (
+            (table_size, "B"), (n_rows, "I"), (len(self.groups) + 1, "Q"),
+            (n_rows, "I"),
+        )
+        for length, typecode in columns:
+            size = length * array(typecode).itemsize
+            data = view[pos:pos + size].cast(typecode)
+            if sys.byteorder != "little" and typecode != "B":
+                swapped = array(typecode, data)
+                swapped.byteswap()
+                data = memoryview(swapped)
+            arrays.append(data)
+            pos = align(pos + size)
+        self.table, self.name_ids, self.group_offsets, self.group_rows = (
+            arrays
+        )
+        self.n_names = n_names
+        self._names: list[str] | None = None
+
+    def __len__(self) -> int:
+        return len(self.name_ids)
+
+    def names(self) -> list[str]:
+        """
+        Return the string table, indexed by the name ids.
+
+        :return: The list of all distinct names.
+        """
+        if self._names is None:
+            names = str(self.table, "utf8").split("\n")
+            self._names = names if self.n_names else []
+        return self._names
+
+    def rows(self, groups: Iterable[str] | None = None) -> Iterator[str]:
+        """
+        Stream the names of the rows, optionally of some groups only.
+
+        :param groups: The groups to select, or None for all rows.
+            Groups that do not occur in the dataset are ignored.
+        :return: Generator of the names of the selected rows, in the
+            order of the source.
+        """
+        names = self.names()
+        name_ids: Iterable[int] = self.name_ids
+        if groups is not None:
+            indices = {
+                self.group_index[group]
+                for group in groups if group in self.group_index
+            }
+            # the rows of every group are sorted, so sorting merges them
+            positions = sorted(itertools.chain.from_iterable(
+                self.group_rows[
+                    self.group_offsets[i]:self.group_offsets[i + 1]
+                ]
+                for i in indices
+            ))
+            name_ids = map(self.name_ids.__getitem__, positions)
+        for name_id in name_ids:
+            yield names[name_id]
+
+
+def write_dataset(
+    file: BinaryIO, rows: Iterable[tuple[str, str]], digest: bytes
+) -> None:
+    """
+    Write the rows of a dataset in the columnar format to an open file.
+
+    :param file: File opened for writing in binary mode.
+    :param rows: Iterable of the name and the group of every row.
+    :param digest: The SHA-256 digest of the source of the rows.
+    :raises ValueError: If a name contains a newline.
+    :return: None.
+    """
+    name_index: dict[str, int] = dict()
+    name_ids = array("I")
+    positions: dict[str, array] = dict()
+    for position, (name, group) in enumerate(rows):
+        name_id = name_index.get(name)
+        if name_id is None:
+            if "\n" in name:
+                raise ValueError(f"Name contains a newline: {name!r}")
+            name_id = name_index[name] = len(name_index)
+        name_ids.append(name_id)
+        group_rows = positions.get(group)
+        if group_rows is None:
+            group_rows = positions[group] = array("I")
+        group_rows.append(position)
+    table = "\n".join(name_index).encode("utf8")
+    groups = sorted(positions)
+    group_offsets = array("Q", [0])
+    group_rows = array("I")
+    for group in groups:
+        group_rows.extend(positions[group])
+        group_offsets.append(len(group_rows))
+    metadata = json.dumps({"groups": groups}).encode("utf8")
+    file.write(_HEADER.pack(
+        MAGIC, FORMAT_VERSION, len(metadata), digest, len(name_ids),
+        len(name_index), len(table),
+    ))
+    file.write(metadata)
+    pad(file, _HEADER.size + len(metadata))
+    file.write(table)
+    pad(file, len(table))
+    for data in (name_ids, group_offsets, group_rows):
+        file.write(_little_endian(data))
+        pad(file, len(data) * data.itemsize)
+
+
+def open_dataset(
+    filepath: str | Path,
+    source: str | Path,
+    rows: Iterable[tuple[str, str]],
+    digest: str | None = None,
+) -> ColumnarDataset:
+    """
+    Open the columnar form of a dataset, building it if necessary.
+
+    The columnar file is rebuilt from the rows if it does not exist, is
+    invalid, or was built from a source with a different content.
+
+    :param filepath: The path of the columnar file.
+    :param source: The path of the source file of the dataset.
+    :param rows: Iterable of the name and the group of every row of the
+        source, only iterated when building the columnar file.
+    :param digest: The SHA-256 hex digest of the source, if known
+        already, so the source is not hashed again.
+    :return: The memory-mapped dataset.
+    """
+    if digest is None:
+        with open(source, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+    try:
+        dataset = ColumnarDataset(map_file(filepath))
+    except (OSError, ValueError):
+        pass  # missing, empty or invalid
+    else:
+        if dataset.digest.hex() == digest:
+            return dataset
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first, so that concurrent runs never
+    # map a partially written dataset
+    temporary = filepath.with_suffix(f".{os.getpid()}.tmp")
+    with open(temporary, "wb") as file:
+        write_dataset(file, rows, bytes.fromhex(digest))
+    os.replace(temporary, filepath)
+    return ColumnarDataset(map_file(filepath))
+
+
+def _little_endian(data: array) -> bytes:
+    """
+    Return the bytes of an array in little-endian order.
+
+    :param data: The array.
+    :return: The bytes.
+    """
+    if sys.byteorder != "little":
+        data = array(data.typecode, data)
+        data.byteswap()
+    return data.tobytes()
@@ -0,0 +1,353 @@
+"""
+Generation of names under constraints, without blind rejection.
+
+Instead of generating names until one happens to satisfy the
+constraints, every step of the generation only considers the chars
+after which the constraints can still be met. The probability that a
+state of the generation ends in a valid name is computed for all states
+reachable from it, which are collected layer by layer by their length
+and valued from the longest to the shortest, and memoized, so dead-end
+branches are never entered and every generated name is valid.
+
+Suffix and substring constraints are tracked with the automata of the
+Knuth-Morris-Pratt algorithm, so the state of a partial name is just its
+context, its length and the states of the two automata.
+"""
+
+from __future__ import annotations
+
+import bisect
+import random
+from collections import Counter
+from typing import TYPE_CHECKING
+
+import instrumentation
+
+if TYPE_CHECKING:
+    from markov_model import MarkovModel
+
+
+type StateType = tuple[str, int, int, int]
+
+
+class ConstrainedGenerator:
+    """
+    Generator of words that satisfy constraints on length and content.
+
+    For every state of a word, the generator computes the probability
+    that an unconstrained generation from that state would end in a
+    valid word. Weighting the chars by the probabilities of their
+    following states draws the words from exactly the distribution of
+    unconstrained generation restricted to valid words, as rejecting
+    invalid words would, but never enters a dead end. The probability
+    of the start points is the acceptance rate of such rejection.
+    """
+
+    def __init__(
+        self,
+        model: MarkovModel,
+        max_length: int,
+        min_length: int = 0,
+        prefix: str = "",
+        suffix: str = "",
+        contains: str = "",
+    ) -> None:
+        """
+        :param model: The trained model to generate words from.
+        :param max_length: The maximum number of characters per word.
+        :param min_length: The minimum number of characters per word.
+        :param prefix: The text every word must start with.
+        :param suffix: The text every word must end with.
+        :param contains: The text every word must contain.
+        :raises ValueError: If the minimum length exceeds the maximum,
+            or if no word of the model can satisfy the constraints.
+        """
+        if min_length > max_length:
+            raise ValueError(
+                f"Minimum length {min_length} exceeds maximum length "
+                f"{max_length}"
+            )
+        self.model = model
+        self.order = model.order
+        self.max_length = max_length
+        self.min_length = min_length
+        # constraints are checked case-insensitively, like the chains
+        self.prefix = prefix.lower()
+        self.suffix = suffix.lower()
+        self.contains = contains.lower()
+        self._suffix_failure = _failure_function(self.suffix)
+        self._contains_failure = _failure_function(self.contains)
+        self._options: dict[str, tuple[list[str], list[float]]] = dict()
+        self._values: dict[StateType, float] = dict()
+        self._choices: dict[
+            StateType, tuple[list[str], list[float]]
+        ] = dict()
+        self._prepare_startpoints()
+
+    def generate(self, rng: random.Random) -> str:
+        """
+        Generate a random word that satisfies the constraints.
+
+        :param rng: The random number generator to draw from.
+        :return: A random word, inspired by the learned data.
+        """
+        word, state = self._starts[self._draw(self._start_weights, rng)]
+        truncated = False
+        while state[1] < self.max_length:
+            chars, cumulative = self._choose(state)
+            char = chars[self._draw(cumulative, rng)]
+            if char == "\n":
+                break
+            word += char
+            state = self._advance(state, word, char)
+        else:
+            truncated = True
+        if instrumentation.active is not None:
+            instrumentation.active.record_names(1, truncated)
+        return word.title()
+
+    def _prepare_startpoints(self) -> None:
+        """
+        Weight the start points by their probability of a valid word.
+
+        :raises ValueError: If no word can satisfy the constraints.
+        :return: None.
+        """
+        counts = Counter(dict(self.model.valid_startpoints.items()))
+        self._starts: list[tuple[str, StateType]] = []
+        self._start_weights: list[float] = []
+        mass = 0.0
+        for start, count in counts.items():
+            if not start.lower().startswith(self.prefix[:len(start)]):
+                continue
+            state = (start[-self.order:], len(start), 0, 0)
+            for char in start.lower():
+                state = self._advance_automata(state, char)
+            value = self._value(state)
+            if value > 0:
+                mass += count * value
+                self._starts.append((start, state))
+                self._start_weights.append(mass)
+        if not mass:
+            raise ValueError("No word of the model satisfies the constraints")
+        self.acceptance_rate = mass / sum(counts.values())
+
+    def _next_options(self, context: str) -> tuple[list[str], list[float]]:
+        """
+        Return the possible next chars of a context and their weights.
+
+        :param context: The context of the word so far.
+        :return: Tuple of the list of all chars with a positive weight,
+            where the end of the word is the char "\\n", and the list of
+            their probabilities.
+        """
+        options = self._options.get(context)
+        if options is None:
+            probabilities = self.model.probabilities(context)
+            options = list(probabilities.keys()), list(probabilities.values())
+            self._options[context] = options
+        return options
+
+    def _value(self, state: StateType) -> float:
+        """
+        Return the probability of a valid word from the state.
+
+        :param state: The state of the word so far.
+        :return: The probability that unconstrained generation from the
+            state ends in a word satisfying all constraints.
+        """
+        value = self._values.get(state)
+        if value is None:
+            self._evaluate(state)
+            value = self._values[state]
+        return value
+
+    def _evaluate(self, root: StateType) -> None:
+        """
+        Compute the values of a state and all states reachable from it.
+
+        Every char makes the word one char longer, so the states are
+        collected in layers of equal length and then valued from the
+        last layer to the first: the values of the following states are
+        always known by then. Unlike a recursive search, this is not
+        limited in the maximum length by the recursion limit.
+
+        :param root: The state whose value is not known yet.
+        :return: None.
+        """
+        layers = [[root]]
+        collected = {root}
+        while layers[-1]:
+            layer = []
+            for state in layers[-1]:
+                if state[1] >= self.max_length:
+                    continue
+                for char in self._next_options(state[0])[0]:
+                    if char == "\n":
+                        continue
+                    following = self._following(state, char)
+                    if (following is not None
+                            and following not in self._values
+                            and following not in collected):
+                        collected.add(following)
+                        layer.append(following)
+            layers.append(layer)
+        for layer in reversed(layers):
+            for state in layer:
+                if state[1] >= self.max_length:
+                    value = float(self._is_valid_end(state))
+                else:
+                    value = sum(
+                        probability * self._step_value(state, char)
+                        for char, probability in zip(
+                            *self._next_options(state[0])
+                        )
+                    )
+                self._values[state] = value
+
+    def _step_value(self, state: StateType, char: str) -> float:
+        """
+        Return the probability of a valid word after the next char.
+
+        :param state: The state of the word so far.
+        :param char: The next char, or "\\n" to end the word.
+        :return: The probability of a valid word.
+        """
+        if char == "\n":
+            return float(self._is_valid_end(state))
+        following = self._following(state, char)
+        return 0.0 if following is None else self._value(following)
+
+    def _following(self, state: StateType, char: str) -> StateType | None:
+        """
+        Return the state after a char that does not end the word.
+
+        :param state: The state of the word so far.
+        :param char: The next char.
+        :return: The following state, or None if the char breaks the
+            prefix.
+        """
+        length = state[1]
+        if length < len(self.prefix) and char != self.prefix[length]:
+            return None
+        return self._advance(state, state[0] + char, char)
+
+    def _choose(self, state: StateType) -> tuple[list[str], list[float]]:
+        """
+        Return the chars that can follow in the state, for drawing.
+
+        :param state: The state of the word so far.
+        :return: Tuple of the list of chars that can lead to a valid
+            word and the list of their cumulative weights.
+        """
+        choices = self._choices.get(state)
+        if choices is None:
+            chars = []
+            cumulative = []
+            mass = 0.0
+            for char, probability in zip(*self._next_options(state[0])):
+                weight = probability * self._step_value(state, char)
+                if weight > 0:
+                    mass += weight
+                    chars.append(char)
+                    cumulative.append(mass)
+            choices = self._choices[state] = chars, cumulative
+        return choices
+
+    def _is_valid_end(self, state: StateType) -> bool:
+        """
+        Return whether the word may end in the state.
+
+        :param state: The state of the word so far.
+        :return: True if the word satisfies all constraints.
+        """
+        _, length, suffix_state, contains_state = state
+        return (
+            length >= max(self.min_length, len(self.prefix))
+            and suffix_state == len(self.suffix)
+            and contains_state == len(self.contains)
+        )
+
+    def _advance(self, state: StateType, word: str, char: str) -> StateType:
+        """
+        Return the state after appending a char to the word.
+
+        :param state: The state of the word before the char.
+        :param word: The word (or its latest context) including the char.
+        :param char: The appended char.
+        :return: The new state.
+        """
+        context = word[-self.order:]
+        return self._advance_automata(
+            (context, state[1] + 1, state[2], state[3]), char
+        )
+
+    def _advance_automata(self, state: StateType, char: str) -> StateType:
+        """
+        Advance the suffix and substring automata of the state by a char.
+
+        :param state: The state, whose length already counts the char.
+        :param char: The lowercased char.
+        :return: The new state.
+        """
+        context, length, suffix_state, contains_state = state
+        if self.suffix:
+            suffix_state = _match(
+                self.suffix, self._suffix_failure, suffix_state, char
+            )
+        if contains_state < len(self.contains):  # found already otherwise
+            contains_state = _match(
+                self.contains, self._contains_failure, contains_state, char
+            )
+        return context, length, suffix_state, contains_state
+
+    @staticmethod
+    def _draw(cumulative: list[float], rng: random.Random) -> int:
+        """
+        Draw an index with probability proportional to its weight.
+
+        :param cumulative: The cumulative weights.
+        :param rng: The random number generator to draw from.
+        :return: The drawn index.
+        """
+        index = bisect.bisect_right(cumulative, rng.random() * cumulative[-1])
+        return min(index, len(cumulative) - 1)
+
+
+def _failure_function(pattern: str) -> list[int]:
+    """
+    Compute the failure function of the Knuth-Morris-Pratt algorithm.
+
+    :param pattern: The pattern to match.
+    :return: For every prefix of the pattern, the length of its longest
+        proper prefix that is also a suffix.
+    """
+    failure = [0] * len(pattern)
+    matched = 0
+    for i in range(1, len(pattern)):
+        while matched and pattern[i] != pattern[matched]:
+            matched = failure[matched - 1]
+        if pattern[i] == pattern[matched]:
+            matched += 1
+        failure[i] = matched
+    return failure
+
+
+def _match(pattern: str, failure: list[int], matched: int, char: str) -> int:
+    """
+    Advance the matching automaton of a pattern by a char.
+
+    :param pattern: The pattern to match.
+    :param failure: The failure function of the pattern.
+    :param matched: The length of the longest prefix of the pattern that
+        is a suffix of the text so far.
+    :param char: The next char of the text.
+    :return: The new length of the matched prefix.
+    """
+    if matched == len(pattern):
+        matched = failure[matched - 1]
+    while matched and pattern[matched] != char:
+        matched = failure[matched - 1]
+    if pattern[matched] == char:
+        matched += 1
+    return matched
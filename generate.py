@@ -3,7 +3,11 @@ Name generator module.
 """
 
 import argparse
+import cProfile
+import itertools
 
+import cache
+import instrumentation
 import loaders
 import markov_model
 
@@ -15,23 +19,292 @@ def main(args: argparse.Namespace) -> None:
     :param args: Namespace from the argument parser.
     :return: None.
     """
-    if args.dataset == "cities":
-        loader = loaders.WorldCitiesLoader(args.language)
+    model_cache = None
+    if args.clear_cache or args.cache_stats or not args.no_cache:
+        model_cache = cache.ModelCache(
+            args.cache_dir, int(args.cache_size * 2 ** 20)
+        )
+    if args.clear_cache:
+        model_cache.clear()
+
+    if args.model is not None:
+        model = markov_model.MarkovModel.load(args.model, rng=args.seed)
+    elif args.dataset is not None:
+        model = get_model(args, None if args.no_cache else model_cache)
+    else:
+        model = None  # only managing the cache
+
+    if model is not None:
+        if args.min_count > 1 or args.max_contexts or args.bits < 32 or (
+            args.memory_budget is not None
+        ):
+            print_pruning(model, args)
+        if args.save_model is not None:
+            model.save(args.save_model)
+        if args.top_k is not None:
+            print_top_k(model, args)
+        else:
+            print_names(model, args)
+
+    if args.cache_stats:
+        stats = model_cache.stats()
+        print(
+            f"Cache {model_cache.directory}: {stats['hits']} hits, "
+            f"{stats['misses']} misses, {stats['evictions']} evictions, "
+            f"{stats['models']} models, {stats['bytes']} bytes"
+        )
+
+
+def run_profiled(args: argparse.Namespace) -> None:
+    """
+    Run ``main`` with the profiling chosen in the args.
+
+    :param args: Namespace from the argument parser.
+    :return: None.
+    """
+    profiler = None
+    if args.profile_stats is not None:
+        profiler = cProfile.Profile()
+    profile = instrumentation.enable() if args.profile else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        main(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile_stats)
+        instrumentation.disable()
+    if profile is not None:
+        print(instrumentation.format_summary(profile.summary()))
+
+
+def print_names(
+    model: markov_model.MarkovModel, args: argparse.Namespace
+) -> None:
+    """
+    Generate random names with the model and print them.
+
+    :param model: The trained model.
+    :param args: Namespace from the argument parser.
+    :return: None.
+    """
+    constraints = {
+        "min_length": args.min_length,
+        "prefix": args.prefix,
+        "suffix": args.suffix,
+        "contains": args.contains,
+    }
+    novel = args.novel is not None
+    if any(constraints.values()):
+        names = []
+        seen = set()
+        rejected = 0  # names rejected since the last accepted name
+        while len(names) < args.number:
+            name = model.generate(args.max_length, **constraints, novel=novel)
+            if novel and name.lower() in seen:
+                # novel names are unique, as in the unconstrained case
+                rejected += 1
+                if rejected >= markov_model.MAX_NOVELTY_ATTEMPTS:
+                    raise ValueError(
+                        f"Found only {len(names)} of {args.number} "
+                        f"acceptable words"
+                    )
+                continue
+            seen.add(name.lower())
+            names.append(name)
+            rejected = 0
+    else:
+        names = model.generate_many(
+            args.number,
+            args.max_length,
+            workers=args.workers,
+            seed=args.seed,
+            novel=novel,
+            unique=novel,
+            max_perplexity=args.max_perplexity,
+            shared_memory=args.shared_memory,
+        )
+    for i, name in enumerate(names):
+        print(f"{i:02d}: {name}")
+    if any(constraints.values()):
+        rate = model.acceptance_rate(args.max_length, **constraints)
+        print(f"Acceptance rate without constraints: {rate:.2%}")
+
+
+def print_top_k(
+    model: markov_model.MarkovModel, args: argparse.Namespace
+) -> None:
+    """
+    Print the most probable names of the model and their probabilities.
+
+    :param model: The trained model.
+    :param args: Namespace from the argument parser.
+    :return: None.
+    """
+    top = model.top_k(args.top_k, args.max_length, args.beam_width)
+    for i, (name, probability) in enumerate(top):
+        print(f"{i:02d}: {name} (p = {probability:.3g})")
+
+
+def print_pruning(
+    model: markov_model.MarkovModel, args: argparse.Namespace
+) -> None:
+    """
+    Prune the model as chosen in the args and print the report.
+
+    :param model: The trained model, which is pruned in place.
+    :param args: Namespace from the argument parser.
+    :return: None.
+    """
+    memory_budget = None
+    if args.memory_budget is not None:
+        memory_budget = int(args.memory_budget * 2 ** 20)
+    report = model.prune(
+        args.min_count, args.max_contexts, args.bits, memory_budget
+    )
+    kept = "all"
+    if report["max_contexts"] is not None:
+        kept = f"at most {report['max_contexts']}"
+    print(
+        f"Pruned with minimum count {report['min_count']}, {kept} "
+        f"contexts per order, "
+        f"{report['bits']} bits per count: "
+        f"{report['bytes_before']} -> {report['bytes_after']} bytes, "
+        f"{report['contexts_before']} -> {report['contexts_after']} "
+        f"contexts, perplexity {report['perplexity_before']:.3f} -> "
+        f"{report['perplexity_after']:.3f}, "
+        f"{report['impossible']:.1%} of sampled names impossible"
+    )
+
+
+def get_loader(
+    dataset: str, language: str | None = None
+) -> tuple[loaders.LoaderABC, str]:
+    """
+    Return the loader and the file of a dataset.
+
+    :param dataset: The name of the dataset.
+    :param language: The language or comma-separated country codes of
+        the city names. Ignored by the other datasets.
+    :raises KeyError: If the dataset is unknown.
+    :return: Tuple of the loader and the path to the dataset file.
+    """
+    if dataset == "cities":
+        loader = loaders.WorldCitiesLoader(language)
         filepath = "./resources/worldcities.csv"
-    elif args.dataset == "greek-mythology":
+    elif dataset == "greek-mythology":
         loader = loaders.GreekMythologyLoader()
         filepath = "./resources/greek_mythology.csv"
     else:
-        raise KeyError(f"Unknown dataset: {args.dataset}")
+        raise KeyError(f"Unknown dataset: {dataset}")
+    return loader, filepath
 
-    training_data = loader.load(filepath)
-    model = markov_model.MarkovModel(
-        training_data, args.order, args.prior, args.max_backoff
+
+def get_model(
+    args: argparse.Namespace, model_cache: cache.ModelCache | None
+) -> markov_model.MarkovModel:
+    """
+    Return the model for the args, from the cache or by training it.
+
+    :param args: Namespace from the argument parser.
+    :param model_cache: The model cache to use, or None to always train
+        the model.
+    :return: The trained model.
+    """
+    return load_model(
+        args.dataset,
+        args.language,
+        args.order,
+        args.prior,
+        args.max_backoff,
+        args.sampler,
+        args.novel,
+        rng=args.seed,
+        workers=args.workers,
+        lazy=args.lazy,
+        model_cache=model_cache,
     )
 
-    for i in range(args.number):
-        name = model.generate(args.max_length)
-        print(f"{i:02d}: {name}")
+
+def load_model(
+    dataset: str,
+    language: str | None = None,
+    order: int = 3,
+    prior: float = 0.0,
+    max_backoff: int = 1,
+    sampler: str = "cdf",
+    novelty: str | None = None,
+    rng: int | None = None,
+    workers: int = 1,
+    lazy: bool = False,
+    model_cache: cache.ModelCache | None = None,
+) -> markov_model.MarkovModel:
+    """
+    Return the model of a dataset, from the cache or by training it.
+
+    :param dataset: The name of the dataset.
+    :param language: The language or comma-separated country codes of
+        the city names. Ignored by the other datasets.
+    :param order: The order of the model.
+    :param prior: The prior of the model.
+    :param max_backoff: The maximum back-off order of the model.
+    :param sampler: The name of the sampler of the model.
+    :param novelty: The index of the training names for novel names, or
+        None.
+    :param rng: The seed of the generator of the model.
+    :param workers: The number of processes to train the model in.
+    :param lazy: Whether to train the back-off orders on first use.
+    :param model_cache: The model cache to use, or None to always train
+        the model.
+    :raises KeyError: If the dataset is unknown.
+    :raises ValueError: If the dataset contains no names to train on.
+    :return: The trained model.
+    """
+    loader, filepath = get_loader(dataset, language)
+    key = digest = None
+    if model_cache is not None:
+        # hash the dataset once, for the key and for its columnar form
+        digest = cache.file_digest(filepath)
+        key = cache.model_key(
+            filepath,
+            loader,
+            order,
+            prior,
+            max_backoff,
+            sampler,
+            novelty,
+            digest,
+        )
+        model = model_cache.get(key, rng=rng)
+        if model is not None:
+            return model
+
+    if model_cache is not None:
+        training_data = loader.load_cached(
+            filepath, model_cache.datasets_directory, digest
+        )
+    else:
+        training_data = loader.load(filepath)
+    training_data = iter(training_data)
+    first = next(training_data, None)
+    if first is None:
+        selection = f" for language {language}" if language else ""
+        raise ValueError(f"No names in dataset {dataset}{selection}")
+    model = markov_model.MarkovModel(
+        itertools.chain([first], training_data),
+        order,
+        prior,
+        max_backoff,
+        sampler,
+        rng=rng,
+        workers=workers,
+        novelty=novelty,
+        lazy=lazy,
+    )
+    if model_cache is not None:
+        model_cache.put(key, model)
+    return model
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -45,9 +318,26 @@ def build_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "dataset",
         help=(
-            "The dataset to choose for the training of the Markov model."
+            "The dataset to choose for the training of the Markov model. "
+            "Not required when loading a trained model with --model."
         ),
         choices=["cities", "greek-mythology"],
+        nargs="?",
+        default=None,
+    )
+    parser.add_argument(
+        "--model",
+        help=(
+            "Path to a model file saved with --save-model. The model is "
+            "used as is, skipping the training, so the options for the "
+            "training are ignored."
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--save-model",
+        help="Save the model to the given path for later use with --model.",
+        default=None,
     )
     parser.add_argument(
         "-o",
@@ -70,6 +360,105 @@ def build_parser() -> argparse.ArgumentParser:
         default=10,
         type=int,
     )
+    parser.add_argument(
+        "--min-length",
+        help="Minimum length of the generated word in characters.",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--prefix",
+        help="Only generate words starting with the given text.",
+        default="",
+    )
+    parser.add_argument(
+        "--suffix",
+        help="Only generate words ending with the given text.",
+        default="",
+    )
+    parser.add_argument(
+        "--contains",
+        help="Only generate words containing the given text.",
+        default="",
+    )
+    parser.add_argument(
+        "--top-k",
+        help=(
+            "Instead of random names, list the given number of most "
+            "probable names of the model."
+        ),
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--beam-width",
+        help=(
+            "Number of partial names kept in every step of the search "
+            "for the most probable names. Defaults to 1000."
+        ),
+        default=1000,
+        type=int,
+    )
+    parser.add_argument(
+        "--novel",
+        help=(
+            "Only generate distinct names that are not in the training "
+            "data. Optionally choose the index of the training names: "
+            "'set' (exact, the default) or 'bloom' (compact)."
+        ),
+        choices=["set", "bloom"],
+        nargs="?",
+        const="set",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-perplexity",
+        help=(
+            "Reject names whose perplexity per character under the model "
+            "exceeds the given value, keeping only plausible names. Only "
+            "applies to generation without constraints."
+        ),
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--min-count",
+        help=(
+            "Prune the contexts seen fewer times than the given count "
+            "from all orders above the maximum back-off order."
+        ),
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--max-contexts",
+        help=(
+            "Prune all but the given number of most frequent contexts per "
+            "order."
+        ),
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--bits",
+        help=(
+            "Store every count in the given number of bits, scaling down "
+            "counts that do not fit. Defaults to 32."
+        ),
+        choices=[8, 16, 32],
+        default=32,
+        type=int,
+    )
+    parser.add_argument(
+        "--memory-budget",
+        help=(
+            "Maximum size of the counts of the model in MB. The model is "
+            "quantized and pruned until it fits, and the change in size "
+            "and perplexity is reported."
+        ),
+        default=None,
+        type=float,
+    )
     parser.add_argument(
         "-b",
         "--max-backoff",
@@ -80,6 +469,28 @@ def build_parser() -> argparse.ArgumentParser:
         default=1,
         type=int,
     )
+    parser.add_argument(
+        "--lazy",
+        help=(
+            "Train the back-off orders below the model order only when "
+            "generation first falls back to them, which shortens the "
+            "startup. Models written to the cache or with --save-model "
+            "always contain all orders, so this pays off most with "
+            "--no-cache."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "-s",
+        "--sampler",
+        help=(
+            "The engine used to sample the next character. All engines "
+            "produce the same distribution of names, they only differ in "
+            "speed. Defaults to 'cdf'."
+        ),
+        choices=list(markov_model.SAMPLERS.keys()),
+        default="cdf",
+    )
     parser.add_argument(
         "-n",
         "--number",
@@ -87,6 +498,91 @@ def build_parser() -> argparse.ArgumentParser:
         default=1,
         type=int,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help=(
+            "Number of processes to train the model and generate names in. "
+            "Only worthwhile for very large datasets or numbers of names. "
+            "Defaults to 1."
+        ),
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--shared-memory",
+        help=(
+            "Publish the model in shared memory for the workers, instead "
+            "of giving every worker its own copy."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--seed",
+        help=(
+            "Seed for the random number generator. The same seed yields "
+            "the same names, regardless of the number of workers."
+        ),
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help=(
+            "Always train the model from the parsed dataset file, "
+            "bypassing the cache of trained models and parsed datasets."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        help=(
+            "Remove all models and parsed datasets from the cache of "
+            "trained models."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        help="Print the hits, misses and size of the model cache.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory of the cache of trained models. Defaults to "
+            "'mcbarnag' in the user cache directory."
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-size",
+        help=(
+            "Maximum size of the model cache in MB. The least recently "
+            "used models are evicted first. Defaults to 256."
+        ),
+        default=256,
+        type=float,
+    )
+    parser.add_argument(
+        "--profile",
+        help=(
+            "Print a summary of the time spent loading, training and "
+            "generating, the back-off depths and context hit rates per "
+            "order, the back-off orders trained on first use with --lazy, "
+            "and the number of generated and truncated names. Worker "
+            "processes are not profiled."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-stats",
+        help=(
+            "Profile the run with cProfile and write the statistics to "
+            "the given path, for analysis with pstats."
+        ),
+        default=None,
+    )
     parser.add_argument(
         "-l",
         "--language",
@@ -104,7 +600,16 @@ def build_parser() -> argparse.ArgumentParser:
 if __name__ == '__main__':
     parser_ = build_parser()
     args_ = parser_.parse_args()
+    if args_.dataset is None and args_.model is None and not (
+        args_.clear_cache or args_.cache_stats
+    ):
+        parser_.error("a dataset is required unless --model is given")
     try:
-        main(args_)
+        if args_.profile or args_.profile_stats is not None:
+            run_profiled(args_)
+        else:
+            main(args_)
+    except ValueError as error:
+        parser_.error(str(error))
     except KeyboardInterrupt:
         print("Execution forcefully stopped.")
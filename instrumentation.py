@@ -0,0 +1,324 @@
+"""
+Opt-in instrumentation of the hot paths of loading, training and
+generation.
+
+Instrumentation is disabled by default. While it is disabled, the hot
+paths only check whether a profile is active, so they run at nearly
+full speed. Enabling it installs a ``Profile`` that collects:
+
+- the time spent loading, training and generating, where the time of a
+  phase does not include the time of phases nested in it, like loading
+  the words that are streamed into the training,
+- for every order, how often a context was found in the chain of that
+  order or had to back off to a lower one, and how far it backed off,
+- the number of chars sampled from the chain of every order,
+- the back-off orders of lazy models that had to be trained on first
+  use, which are all orders that were ever backed off to,
+- the number of names generated, and how many of them were cut off at
+  the maximum length.
+
+Only the current process is profiled: names generated by worker
+processes are not counted. Profiles are not thread-safe.
+"""
+
+import contextlib
+import functools
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from typing import Any
+
+
+class Profile:
+    """
+    Counters and timers collected while instrumentation is enabled.
+    """
+
+    def __init__(self) -> None:
+        # phase -> [exclusive seconds, calls, items]
+        self.phases: dict[str, list[float]] = dict()
+        # (order, depth) -> number of look-ups starting at the order that
+        # backed off by depth orders, beyond the lowest order if the
+        # depth exceeds the number of orders
+        self.backoff: Counter[tuple[int, int]] = Counter()
+        self.hits: Counter[int] = Counter()
+        self.misses: Counter[int] = Counter()
+        self.samples: Counter[int] = Counter()
+        # back-off orders trained on first use, in the order of training
+        self.trained_orders: list[int] = []
+        self.names = 0
+        self.truncated = 0
+        # open phases, as [phase, start, time of nested phases]
+        self._stack: list[list[Any]] = []
+
+    def start(self, phase: str) -> None:
+        """
+        Start timing a phase, pausing the phase it is nested in.
+
+        :param phase: The name of the phase.
+        :return: None.
+        """
+        self._stack.append([phase, time.perf_counter(), 0.0])
+
+    def stop(self, items: int = 0, calls: int = 1) -> None:
+        """
+        Stop timing the innermost phase.
+
+        :param items: The number of items the phase processed.
+        :param calls: The number of calls the timing completes.
+        :return: None.
+        """
+        phase, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        totals = self.phases.setdefault(phase, [0.0, 0, 0])
+        totals[0] += elapsed - nested
+        totals[1] += calls
+        totals[2] += items
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def record_lookup(
+        self, order: int, resolved: int | None, lowest: int, count: int = 1
+    ) -> None:
+        """
+        Record look-ups of contexts, backing off from an order.
+
+        :param order: The order the look-ups started at.
+        :param resolved: The order of the chain that knew the contexts,
+            or None if no order down to the lowest one did.
+        :param lowest: The lowest order that was looked up.
+        :param count: The number of look-ups.
+        :return: None.
+        """
+        if not count:
+            return
+        depth = order - (lowest - 1 if resolved is None else resolved)
+        self.backoff[order, depth] += count
+        for missed in range(order - depth + 1, order + 1):
+            self.misses[missed] += count
+        if resolved is not None:
+            self.hits[resolved] += count
+
+    def record_samples(self, order: int, count: int = 1) -> None:
+        """
+        Record chars sampled from a chain.
+
+        :param order: The order of the chain.
+        :param count: The number of chars.
+        :return: None.
+        """
+        self.samples[order] += count
+
+    def record_trained_order(self, order: int) -> None:
+        """
+        Record the training of a back-off order on its first use.
+
+        :param order: The order of the trained chain.
+        :return: None.
+        """
+        self.trained_orders.append(order)
+
+    def record_names(self, count: int, truncated: int) -> None:
+        """
+        Record generated names.
+
+        :param count: The number of names.
+        :param truncated: The number of names that reached the maximum
+            length before drawing the end of the word.
+        :return: None.
+        """
+        self.names += count
+        self.truncated += truncated
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Return everything collected so far.
+
+        :return: Dictionary mapping "phases" to the seconds, calls and
+            items of every phase, "orders" to the hits, misses, hit rate
+            and samples of every order, "backoff" to the histogram of the
+            back-off depths of every starting order, "trained_orders" to
+            the back-off orders trained on first use, and "names" and
+            "truncated" to the number of generated and truncated names.
+        """
+        orders = sorted(
+            set(self.hits) | set(self.misses) | set(self.samples),
+            reverse=True,
+        )
+        backoff: dict[int, dict[int, int]] = dict()
+        for (order, depth), count in sorted(self.backoff.items()):
+            backoff.setdefault(order, dict())[depth] = count
+        return {
+            "phases": {
+                phase: {"seconds": seconds, "calls": calls, "items": items}
+                for phase, (seconds, calls, items) in self.phases.items()
+            },
+            "orders": {
+                order: {
+                    "hits": self.hits[order],
+                    "misses": self.misses[order],
+                    "hit_rate": (
+                        self.hits[order]
+                        / (self.hits[order] + self.misses[order])
+                        if self.hits[order] + self.misses[order] else None
+                    ),
+                    "samples": self.samples[order],
+                }
+                for order in orders
+            },
+            "backoff": backoff,
+            "trained_orders": list(self.trained_orders),
+            "names": self.names,
+            "truncated": self.truncated,
+        }
+
+
+# the profile collecting the counters, or None if disabled
+active: Profile | None = None
+
+
+def enable() -> Profile:
+    """
+    Enable instrumentation with a new profile.
+
+    :return: The new profile.
+    """
+    global active
+    active = Profile()
+    return active
+
+
+def disable() -> Profile | None:
+    """
+    Disable instrumentation.
+
+    :return: The profile that was active, or None.
+    """
+    global active
+    profile, active = active, None
+    return profile
+
+
+@contextlib.contextmanager
+def profiling() -> Iterator[Profile]:
+    """
+    Enable instrumentation within a ``with`` block.
+
+    :return: Context manager yielding the new profile, which restores
+        the previous profile on exit.
+    """
+    global active
+    previous = active
+    try:
+        yield enable()
+    finally:
+        active = previous
+
+
+def timed(phase: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function to time its calls as a phase.
+
+    :param phase: The name of the phase.
+    :return: The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = active
+            if profile is None:
+                return func(*args, **kwargs)
+            profile.start(phase)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.stop()
+        return wrapper
+    return decorator
+
+
+def timed_iterator(phase: str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function returning an iterator to time the iteration.
+
+    Only the time spent producing the items is counted, not the time
+    the consumer spends between them, and the items are counted.
+
+    :param phase: The name of the phase.
+    :return: The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Iterator:
+            iterator = func(*args, **kwargs)
+            profile = active
+            if profile is None:
+                return iterator
+            return _timed_items(iterator, profile, phase)
+        return wrapper
+    return decorator
+
+
+def format_summary(summary: dict[str, Any]) -> str:
+    """
+    Return a summary of a profile as text.
+
+    :param summary: The summary, as returned by ``Profile.summary``.
+    :return: The text, over several lines.
+    """
+    lines = ["Profile:"]
+    for phase, totals in summary["phases"].items():
+        items = f", {totals['items']} items" if totals["items"] else ""
+        lines.append(
+            f"  {phase}: {totals['seconds']:.3f} s in "
+            f"{totals['calls']} calls{items}"
+        )
+    for order, counts in summary["orders"].items():
+        rate = counts["hit_rate"]
+        rate = "n/a" if rate is None else f"{rate:.1%}"
+        lines.append(
+            f"  order {order}: {counts['hits']} hits, "
+            f"{counts['misses']} misses ({rate} hit rate), "
+            f"{counts['samples']} chars sampled"
+        )
+    for order, histogram in summary["backoff"].items():
+        depths = ", ".join(
+            f"{depth}: {count}" for depth, count in histogram.items()
+        )
+        lines.append(f"  back-off depths from order {order}: {depths}")
+    if summary["trained_orders"]:
+        orders = ", ".join(map(str, summary["trained_orders"]))
+        lines.append(f"  back-off orders trained on first use: {orders}")
+    lines.append(
+        f"  names: {summary['names']} generated, "
+        f"{summary['truncated']} truncated at the maximum length"
+    )
+    return "\n".join(lines)
+
+
+def _timed_items(
+    iterator: Iterator, profile: Profile, phase: str
+) -> Iterator:
+    """
+    Yield the items of an iterator, timing the production of each.
+
+    :param iterator: The iterator.
+    :param profile: The profile to record the time in.
+    :param phase: The name of the phase.
+    :return: Generator of the items.
+    """
+    iterator = iter(iterator)
+    calls = 1  # the whole iteration counts as a single call
+    while True:
+        profile.start(phase)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            profile.stop(calls=calls)
+            return
+        except BaseException:
+            profile.stop(calls=calls)
+            raise
+        profile.stop(items=1, calls=calls)
+        calls = 0
+        yield item
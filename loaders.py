@@ -2,19 +2,92 @@
 Loaders for training data.
 """
 import csv
+import hashlib
+import json
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
 from pathlib import Path
+from typing import Any
+
+import columnar
+import instrumentation
 
 
 class LoaderABC(ABC):
     """ 
     Abstract base class for loaders.
+
+    Besides parsing their source file with ``load``, all loaders can
+    load the pre-parsed columnar form of the file with ``load_cached``,
+    which is built on first use. Loaders that filter the rows of a file
+    override ``rows`` and ``select`` to look up the selected rows in the
+    index of the columnar form instead of scanning all rows.
     """
 
     @abstractmethod
-    def load(self, filepath: str | Path) -> list[str]:
+    def load(self, filepath: str | Path) -> Iterator[str]:
         pass
 
+    def rows(self, filepath: str | Path) -> Iterator[tuple[str, str]]:
+        """
+        Stream the name and the group of every row of the source file.
+
+        :param filepath: Path of the source file.
+        :return: Generator of tuples of the name and the group of every
+            row. Defaults to all loaded names, in a single group.
+        """
+        for name in self.load(filepath):
+            yield name, ""
+
+    def select(self, dataset: columnar.ColumnarDataset) -> Iterator[str]:
+        """
+        Stream the names selected by the loader from a columnar dataset.
+
+        :param dataset: The columnar form of the source file.
+        :return: Generator of the selected names. Defaults to all names.
+        """
+        return dataset.rows()
+
+    def columnar_parameters(self) -> dict[str, Any]:
+        """
+        Return the parameters of the loader that change its ``rows``.
+
+        :return: JSON serializable dictionary of the parameters.
+            Defaults to all attributes of the loader.
+        """
+        return vars(self)
+
+    @instrumentation.timed_iterator("load")
+    def load_cached(
+        self,
+        filepath: str | Path,
+        directory: str | Path,
+        digest: str | None = None,
+    ) -> Iterator[str]:
+        """
+        Stream the names like ``load``, from the columnar form of the file.
+
+        The columnar form is built in the directory on first use, and
+        rebuilt whenever the content of the source file changes.
+
+        :param filepath: Path of the source file.
+        :param directory: The directory of the columnar files.
+        :param digest: The SHA-256 hex digest of the source file, if
+            known already.
+        :return: Generator of the same names as ``load``.
+        """
+        setup = {
+            "source": str(Path(filepath).resolve()),
+            "loader": type(self).__name__,
+            "parameters": self.columnar_parameters(),
+        }
+        encoded = json.dumps(setup, sort_keys=True).encode("utf8")
+        name = hashlib.sha256(encoded).hexdigest() + columnar.SUFFIX
+        dataset = columnar.open_dataset(
+            Path(directory) / name, filepath, self.rows(filepath), digest
+        )
+        yield from self.select(dataset)
+
 
 class WorldCitiesLoader(LoaderABC):
     """ 
@@ -38,32 +111,58 @@ class WorldCitiesLoader(LoaderABC):
         if language is None:
             self.countries = None
         elif language not in self.language_mapping.keys():
-            # attempt to set as explicit country code
-            self.countries = language.replace(" ", "").split(",")
+            # attempt to set as explicit country codes, which are
+            # uppercase in the dataset
+            self.countries = language.replace(" ", "").upper().split(",")
         else:
             self.countries = self.language_mapping[language]
         self.field = field
 
-    def load(self, filepath: str | Path) -> list[str]:
+    @instrumentation.timed_iterator("load")
+    def load(self, filepath: str | Path) -> Iterator[str]:
         """
-        Load a list of world city names, optionally limited to a language.
+        Stream the world city names, optionally limited to a language.
+
+        The file is read row by row, so only the current row is held in
+        memory.
 
         :param filepath: Name and path of the file containing the city
             names and country codes.
+        :return: Generator of the lowercased city names.
         """
-        with open(filepath, "r", encoding="utf8") as file:
-            lines = file.readlines()
-        header = lines.pop(0)
-        header_list = header.replace('"', "").split(",")
-        field_index = header_list.index(self.field)
-        country_index = header_list.index("iso2")
-        cities = []
-        for line in lines:
-            city = line.replace('"', "").split(",")[field_index].lower()
-            country = line.replace('"', "").split(",")[country_index]
+        for name, country in self.rows(filepath):
             if self.countries is None or country in self.countries:
-                cities.append(city)
-        return cities
+                yield name
+
+    def rows(self, filepath: str | Path) -> Iterator[tuple[str, str]]:
+        """
+        Stream the city name and the country code of every row.
+
+        :param filepath: Name and path of the file containing the city
+            names and country codes.
+        :return: Generator of tuples of the lowercased city name and the
+            country code of every row.
+        """
+        with open(filepath, newline="", encoding="utf8") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader)
+            field_index = header.index(self.field)
+            country_index = header.index("iso2")
+            for row in reader:
+                yield row[field_index].lower(), row[country_index]
+
+    def select(self, dataset: columnar.ColumnarDataset) -> Iterator[str]:
+        """
+        Stream the city names of the countries from a columnar dataset.
+
+        :param dataset: The columnar form of the file of the cities.
+        :return: Generator of the lowercased city names.
+        """
+        return dataset.rows(self.countries)
+
+    def columnar_parameters(self) -> dict[str, Any]:
+        # the countries are selected from the index, not when parsing
+        return {"field": self.field}
 
 
 class GreekMythologyLoader(LoaderABC):
@@ -71,18 +170,17 @@ class GreekMythologyLoader(LoaderABC):
     Load a list of names from greek mythology.
     """
 
-    def load(self, filepath: str | Path) -> list[str]:
+    @instrumentation.timed_iterator("load")
+    def load(self, filepath: str | Path) -> Iterator[str]:
         """
-        Load a list of names from greek mythology and return them.
+        Stream the names from greek mythology.
 
         :param filepath: Path to the CSV file containing the names.
-        :return: List of names from Greek mythology.
+        :return: Generator of names from Greek mythology.
         """
-        names = []
         with open(filepath, newline="", encoding="utf8") as csvfile:
             reader = csv.reader(csvfile)
             header = next(reader)
             field_index = header.index("name-english")
             for row in reader:
-                names.append(row[field_index])
-        return names
+                yield row[field_index]
@@ -2,21 +2,199 @@
 Generator for random names, employing Markov chains.
 """
 
-import random
+import bisect
+import contextlib
 import copy
+import gc
+import io
+import itertools
+import random
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import batch
+import constraints
+import instrumentation
+import novelty as novelty_index
+import pruning
+import scoring
+import search
+import serialization
+import shared
+from ngrams import Ngrams
+from serialization import CountBuffer, KeyBuffer, PackedCounts
+from startpoints import StartPoints
 
 
 type MarkovChainType = dict[str, dict[str, float]]
 
+# number of generated words after which novel generation gives up
+MAX_NOVELTY_ATTEMPTS = 10000
+# number of words whose n-grams are counted at once while training
+LEARN_BATCH_SIZE = 2 ** 16
+# number of contexts per order whose back-off is memoized, before the
+# memo is cleared
+MAX_RESOLVED_CONTEXTS = 2 ** 16
+
+# model of a worker process of MarkovModel.generate_many
+_worker_model: "MarkovModel | None" = None
+
+
+class SamplingTableABC(ABC):
+    """
+    Abstract base class for precomputed sampling tables of a context.
+
+    Every table exposes the sum of its weights as attribute ``total``.
+    """
+
+    __slots__ = ()
+
+    @abstractmethod
+    def __init__(self, weights: dict[str, float]) -> None:
+        """
+        :param weights: Mapping of chars to their (unnormalized) weight.
+            Must contain at least one char of positive weight.
+        """
+        pass
+
+    @abstractmethod
+    def draw(self, roll: float) -> str:
+        """
+        Draw a char from the table, proportionally to its weight.
+
+        :param roll: A uniform random number in [0, 1), which determines
+            the drawn char. Tables never draw random numbers themselves,
+            so that the random number generator is up to the caller.
+        :return: The drawn char.
+        """
+        pass
+
+
+class LinearTable(SamplingTableABC):
+    """
+    Sampling table, drawing by walking linearly over the weights.
+    """
+
+    __slots__ = ("chars", "weights", "total")
+
+    def __init__(self, weights: dict[str, float]) -> None:
+        self.chars = [char for char, w in weights.items() if w > 0]
+        self.weights = [w for w in weights.values() if w > 0]
+        self.total = sum(self.weights)
+
+    def draw(self, roll: float) -> str:
+        target = roll * self.total
+        for char, weight in zip(self.chars, self.weights):
+            if target < weight:
+                return char
+            target -= weight
+        return self.chars[-1]  # only reachable through rounding errors
+
+
+class CDFTable(SamplingTableABC):
+    """
+    Sampling table, drawing by bisecting the cumulative weights.
+    """
+
+    __slots__ = ("chars", "cumulative", "total")
+
+    def __init__(self, weights: dict[str, float]) -> None:
+        self.chars = []
+        self.cumulative = []
+        total = 0.0
+        for char, weight in weights.items():
+            if weight <= 0:
+                continue
+            total += weight
+            self.chars.append(char)
+            self.cumulative.append(total)
+        self.total = total
+
+    def draw(self, roll: float) -> str:
+        index = bisect.bisect_right(self.cumulative, roll * self.total)
+        return self.chars[min(index, len(self.chars) - 1)]
+
+
+class AliasTable(SamplingTableABC):
+    """
+    Sampling table, drawing in constant time using Vose's alias method.
+    """
+
+    __slots__ = ("chars", "probabilities", "aliases", "total")
+
+    def __init__(self, weights: dict[str, float]) -> None:
+        self.chars = [char for char, w in weights.items() if w > 0]
+        n = len(self.chars)
+        self.total = sum(w for w in weights.values() if w > 0)
+        scaled = [w * n / self.total for w in weights.values() if w > 0]
+        self.probabilities = [1.0] * n
+        self.aliases = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            lesser = small.pop()
+            greater = large.pop()
+            self.probabilities[lesser] = scaled[lesser]
+            self.aliases[lesser] = greater
+            scaled[greater] += scaled[lesser] - 1
+            if scaled[greater] < 1:
+                small.append(greater)
+            else:
+                large.append(greater)
+        # remaining entries are full columns (up to rounding errors),
+        # which is already reflected by the initial values
+
+    def draw(self, roll: float) -> str:
+        roll *= len(self.chars)
+        column = min(int(roll), len(self.chars) - 1)
+        if roll - column < self.probabilities[column]:
+            return self.chars[column]
+        return self.chars[self.aliases[column]]
+
+
+SAMPLERS: dict[str, type[SamplingTableABC]] = {
+    "linear": LinearTable,
+    "cdf": CDFTable,
+    "alias": AliasTable,
+}
+
 
 class MarkovChain:
     """
     Markov chain for a set of given words.
+
+    Internally, chars are mapped to small integers (the end-of-word
+    char always has code 0, the others get the next free code when
+    they are first seen) and contexts are packed into a single integer,
+    using the codes as digits of a number in base ``base``, the smallest
+    power of two holding the alphabet. For every context, only the
+    chars that were actually observed are stored, in one array of
+    alternating char codes and counts, sorted by char code, so the
+    rows do not depend on the order the words were learned in. The
+    prior is never stored: when sampling, the draw first chooses
+    between the observed mass and the total prior mass of the context,
+    and then samples inside the chosen group.
+
+    Chains loaded from a file keep their counts in the read-only
+    buffers of the file instead. They are copied into arrays as soon as
+    the chain learns anything new.
     """
 
-    def __init__(self, data: list[str], order: int, prior: float) -> None:
+    def __init__(
+        self,
+        data: Iterable[str],
+        order: int,
+        prior: float,
+        sampler: str = "cdf",
+    ) -> None:
         """
-        :param data: A list of words to use as training data.
+        :param data: An iterable of words to use as training data. It is
+            only iterated once, so it may be a generator.
         :param order: The order of the Markov-chain, i.e. the length of
             the context (which is the number of characters considered)
             used to determine the next char.
@@ -24,16 +202,49 @@ class MarkovChain:
             probability will be applied to all supported characters
             before the training, giving chances for characters to
             appear that are not learned in training.
+        :param sampler: The name of the sampling engine to use, one of
+            the keys of ``SAMPLERS``. Defaults to "cdf".
         """
-        normalized_data = [word.lower() for word in data]
+        if sampler not in SAMPLERS.keys():
+            raise KeyError(f"Unknown sampler: {sampler}")
         self.order = order
-        self.support = list(set("".join(normalized_data)))
-        self.support.sort()
-        self.prior = {x: prior for x in self.support}
-        self.prior.update({"\n": 0})
-        self.chain: MarkovChainType = dict()
-        for word in normalized_data:
-            self.learn(word)
+        self.sampler = sampler
+        self._prior = prior
+        self._set_support([])
+        # packed context code -> alternating char codes and counts
+        self.counts: dict[int, array] | PackedCounts = dict()
+        self._tables: dict[int, SamplingTableABC] = dict()
+        for word in data:
+            self.learn(word.lower())
+
+    @classmethod
+    def from_counts(
+        cls,
+        counts: PackedCounts,
+        order: int,
+        prior: float,
+        support: list[str],
+        sampler: str = "cdf",
+        base: int | None = None,
+    ) -> "MarkovChain":
+        """
+        Create a chain from already packed counts, without training.
+
+        :param counts: The packed counts of the chain.
+        :param order: The order of the Markov chain.
+        :param prior: The prior probability for characters.
+        :param support: The list of supported chars in the order of
+            their codes, which are used in the counts.
+        :param sampler: The name of the sampling engine to use.
+        :param base: The base the contexts are packed in. Defaults to
+            None, which is the smallest power of two holding the
+            alphabet.
+        :return: The Markov chain.
+        """
+        chain = cls([], order, prior, sampler)
+        chain._set_support(support, base)
+        chain.counts = counts
+        return chain
 
     def __str__(self) -> str:
         s = ""
@@ -46,26 +257,96 @@ class MarkovChain:
                 s += f"    {next_char}: {count}\n"
         return s
 
+    @property
+    def chain(self) -> MarkovChainType:
+        """
+        The weights as a nested dict of contexts, chars and weights.
+
+        Every observed context maps all chars of the alphabet to their
+        observed count plus the prior. The dictionary is created anew
+        from the packed counts on every access, so it is only meant for
+        inspection.
+        """
+        return {
+            self._decode(code): self._row_weights(row)
+            for code, row in self.counts.items()
+        }
+
+    @property
+    def prior_mass(self) -> float:
+        """
+        The total prior weight added to every context.
+        """
+        return self._prior * len(self.support)
+
+    def weights(self, context: str) -> dict[str, float] | None:
+        """
+        Return the weights of all chars following the context.
+
+        :param context: The context for which to return the weights.
+        :return: A dictionary mapping every char of the alphabet to its
+            observed count plus the prior, or None if the context was
+            never observed.
+        """
+        row = self.counts.get(self._encode(context))
+        if row is None:
+            return None
+        return self._row_weights(row)
+
     def learn(self, word: str) -> None:
         """
         Learn the given word by adding it to the chain.
 
+        Chars that are new to the chain are added to its support first.
+
         :param word: Any word that shall be learned.
         :return: None.
         """
-        length = len(word)
-        if length == self.order:
-            self.update(word, "\n")
-        elif length < self.order:
+        new_chars = [char for char in word if char not in self.codes]
+        if new_chars:
+            self._extend_support(new_chars)
+        order = self.order
+        if len(word) < order:
             return  # cannot learn words that are too short
-        pos = 0
-        while (pos + self.order) < length:
-            context = word[pos:pos + self.order]
-            next_char = word[pos + self.order]
-            self.update(context, next_char)
-            pos += 1
-        # update with end-of-word character
-        self.update(word[-self.order:], "\n")
+        self._thaw()
+        base = self.base
+        modulus = base ** order
+        # code of the context of the char at every position, which
+        # follows from the code of the context before
+        code = 0
+        for position, char in enumerate(word + "\n"):
+            digit = self.codes[char]
+            if position >= order:
+                self._count(code, digit)
+            code = (code * base + digit) % modulus
+
+    def learn_ngrams(self, ngrams: Ngrams) -> None:
+        """
+        Learn the counted n-grams of words that are already encoded.
+
+        The rows of the counts are only updated once per distinct
+        (context, char) pair, which makes learning words in batches
+        much faster than one by one.
+
+        :param ngrams: The n-grams of the words, encoded in the alphabet
+            of the chain for its order.
+        :return: None.
+        """
+        if not len(ngrams.keys):
+            return
+        self._thaw()
+        counts = self.counts
+        tables = self._tables
+        with _paused_gc():
+            for code, row in ngrams.rows():
+                old = counts.get(code)
+                if old is None:
+                    counts[code] = row
+                else:
+                    for char, count in zip(row[::2], row[1::2]):
+                        _add_count(old, char, count)
+                if tables:
+                    tables.pop(code, None)
 
     def update(self, context: str, next_char: str) -> None:
         """
@@ -76,28 +357,422 @@ class MarkovChain:
             that is to be learned.
         :return: None.
         """
-        if context not in self.chain.keys():
-            self.chain.update({context: copy.copy(self.prior)})
-        self.chain[context][next_char] += 1
+        code = self._encode(context)
+        if code is None:
+            raise KeyError(f"Context {context!r} contains unsupported chars")
+        self._thaw()
+        self._count(code, self.codes[next_char])
+
+    def merge(self, other: "MarkovChain") -> None:
+        """
+        Add the counts of another chain of the same order to this chain.
 
-    def sample(self, context: str) -> str | None:
+        The chars of the other chain are added to the support, so chains
+        trained on different shards of the data can be merged into the
+        chain of the whole data. Merging shards in their order results
+        in exactly the same chain as training on the whole data.
+
+        :param other: The chain whose counts to add. It is not changed.
+        :raises ValueError: If the orders of the chains differ.
+        :return: None.
+        """
+        if other.order != self.order:
+            raise ValueError(
+                f"Cannot merge chain of order {other.order} into a chain "
+                f"of order {self.order}"
+            )
+        new_chars = [
+            char for char in other.alphabet[1:] if char not in self.codes
+        ]
+        if new_chars:
+            self._extend_support(new_chars)
+        self._thaw()
+        recode = [self.codes[char] for char in other.alphabet]
+        same_codes = other.base == self.base and (
+            recode == list(range(len(recode)))
+        )
+        for code, row in other.counts.items():
+            if not same_codes:
+                code, row = self._recode(code, row, recode, other.base)
+            self._add(code, row)
+
+    def freeze(self) -> None:
+        """
+        Precompute the sampling tables for all contexts of the chain.
+
+        Sampling builds the table of a context on first use anyway, so
+        freezing only moves this cost out of the generation. Learning
+        after freezing is allowed: every update discards the table of
+        the affected context, which is then rebuilt on demand.
+
+        :return: None.
+        """
+        for code, row in self.counts.items():
+            self._tables[code] = self._build_table(row)
+
+    def sample(
+        self, context: str, rng: random.Random | None = None
+    ) -> str | None:
         """
         Sample the Markov chain for a follow-up char probabilistically.
 
         :param context: The context for which to find the follow-up char.
+        :param rng: The random number generator to draw from. Defaults
+            to the global generator of the ``random`` module.
         :return: The next char if one is found, otherwise None.
         """
-        if context not in self.chain.keys():
-            return None
-        counts = self.chain[context]
-        total = sum(list(counts.values()))
-        roll = random.uniform(0, total)
-        for char, occurrences in counts.items():
-            if roll <= occurrences:
-                return char
-            roll -= occurrences
+        return self.sample_code(self._encode(context), rng)
+
+    def sample_code(
+        self, code: int | None, rng: random.Random | None = None
+    ) -> str | None:
+        """
+        Sample the follow-up char of a context given by its code.
+
+        :param code: The packed code of the context, as created by
+            ``_encode``.
+        :param rng: The random number generator to draw from. Defaults
+            to the global generator of the ``random`` module.
+        :return: The next char if the context is known, otherwise None.
+        """
+        table = self._tables.get(code)
+        if table is None:
+            row = self.counts.get(code)
+            if row is None:
+                return None
+            table = self._build_table(row)
+            self._tables[code] = table
+        if instrumentation.active is not None:
+            instrumentation.active.record_samples(self.order)
+        roll = random.random() if rng is None else rng.random()
+        if self._prior > 0:
+            prior_mass = self.prior_mass
+            target = roll * (table.total + prior_mass)
+            if target < prior_mass:
+                index = int(target / self._prior)
+                return self.alphabet[1 + min(index, len(self.support) - 1)]
+            # reuse the remainder of the roll to draw from the observations
+            roll = (target - prior_mass) / table.total
+        return table.draw(roll)
+
+    def pack(self) -> tuple[KeyBuffer, CountBuffer, CountBuffer]:
+        """
+        Return the counts as three flat buffers.
+
+        :return: Tuple of the sorted codes of all contexts, as returned
+            by ``serialization.pack_keys``, the offsets of their rows
+            (followed by the total length) and the concatenated rows of
+            alternating char codes and counts.
+        """
+        if isinstance(self.counts, PackedCounts):
+            return self.counts.keys, self.counts.offsets, self.counts.pairs
+        keys = serialization.pack_keys(sorted(self.counts.keys()))
+        offsets = array("Q", [0])
+        pairs = array("I")
+        for code in keys:
+            pairs.extend(self.counts[code])
+            offsets.append(len(pairs))
+        return keys, offsets, pairs
+
+    def prune(
+        self, min_count: int = 1, max_contexts: int | None = None
+    ) -> None:
+        """
+        Remove rare contexts from the chain.
+
+        Look-ups of removed contexts back off to the next lower order,
+        like those of contexts that were never observed. Contexts are
+        removed as a whole, since removing some of their transitions
+        would distort the distribution of the remaining ones instead of
+        backing off.
+
+        :param min_count: The minimum total count of a context to keep.
+        :param max_contexts: The maximum number of contexts to keep,
+            preferring those with the highest total counts. Defaults to
+            None, which keeps all contexts.
+        :return: None.
+        """
+        totals = {
+            code: total
+            for code, row in self.counts.items()
+            if (total := sum(row[1::2])) >= min_count
+        }
+        codes = sorted(totals)
+        if max_contexts is not None and len(codes) > max_contexts:
+            ranked = sorted(codes, key=lambda code: (-totals[code], code))
+            codes = sorted(ranked[:max_contexts])
+        self.counts = {code: array("I", self.counts[code]) for code in codes}
+        self._tables.clear()
+
+    def quantize(self, bits: int) -> None:
+        """
+        Store the char codes and counts in fewer bits, in flat buffers.
+
+        Rows whose largest count exceeds the largest number of the given
+        bits are scaled down to fit, rounding every count to at least 1,
+        so that no observed char is lost. All other rows are stored
+        exactly. Like chains loaded from a file, the chain copies its
+        counts back into arrays as soon as it learns anything new.
+
+        :param bits: The number of bits per char code and count: 8, 16
+            or 32.
+        :raises ValueError: If the number of bits is not supported, or
+            if the char codes do not fit in them.
+        :return: None.
+        """
+        self.check_bits(bits)
+        limit = 2 ** bits - 1
+        keys, offsets, pairs = self.pack()
+        typecode = serialization.PAIR_TYPECODES[bits // 8]
+        if max(pairs[1::2], default=0) <= limit:
+            quantized = array(typecode, pairs)
+        else:
+            quantized = array(typecode)
+            for start, end in itertools.pairwise(offsets):
+                row = pairs[start:end]
+                scale = min(1.0, limit / max(row[1::2]))
+                for char, count in zip(row[::2], row[1::2]):
+                    quantized.extend((char, max(1, round(count * scale))))
+        self.counts = PackedCounts(keys, offsets, quantized)
+        self._tables.clear()
+
+    def check_bits(self, bits: int) -> None:
+        """
+        Check that the chain can be quantized to the number of bits.
+
+        :param bits: The number of bits per char code and count.
+        :raises ValueError: If the number of bits is not supported, or
+            if the char codes do not fit in them.
+        :return: None.
+        """
+        if bits not in (8, 16, 32):
+            raise ValueError(f"Unsupported number of bits: {bits}")
+        if len(self.alphabet) - 1 > 2 ** bits - 1:
+            raise ValueError(
+                f"{len(self.alphabet)} chars do not fit in {bits} bits"
+            )
+
+    def _set_support(
+        self, chars: list[str], base: int | None = None
+    ) -> None:
+        """
+        Set the supported chars, their codes, their priors and the base.
+
+        The support is kept sorted, while the alphabet lists the chars in
+        the order of their codes, so new chars never renumber old ones.
+
+        :param chars: The list of supported chars in the order of their
+            codes.
+        :param base: The base to pack contexts in, at least the size of
+            the alphabet. Defaults to None, which is the smallest power
+            of two holding the alphabet.
+        :return: None.
+        """
+        self.support = sorted(chars)
+        self.prior = {x: self._prior for x in self.support}
+        self.prior.update({"\n": 0})
+        self.alphabet = ["\n"] + list(chars)
+        self.codes = {char: code for code, char in enumerate(self.alphabet)}
+        if base is None:
+            base = 1 << (len(self.alphabet) - 1).bit_length()
+        self.base = base
+
+    def _thaw(self) -> None:
+        """
+        Copy counts held in the buffers of a file into arrays.
+
+        :return: None.
+        """
+        if isinstance(self.counts, PackedCounts):
+            self.counts = {
+                key: array("I", row) for key, row in self.counts.items()
+            }
+
+    def _count(self, code: int, char: int) -> None:
+        """
+        Count one occurrence of a char after a context.
+
+        :param code: The code of the context.
+        :param char: The code of the char.
+        :return: None.
+        """
+        row = self.counts.get(code)
+        if row is None:
+            self.counts[code] = array("I", (char, 1))
+        else:
+            _add_count(row, char, 1)
+        # the sampling table of the context is stale now
+        self._tables.pop(code, None)
+
+    def _add(self, code: int, pairs: CountBuffer) -> None:
+        """
+        Add counts to the row of a context.
+
+        :param code: The code of the context.
+        :param pairs: Alternating char codes and the counts to add.
+        :return: None.
+        """
+        row = self.counts.get(code)
+        if row is None:
+            self.counts[code] = array("I", pairs)
+        else:
+            for char, count in zip(pairs[::2], pairs[1::2]):
+                _add_count(row, char, count)
+        # the sampling table of the context is stale now
+        self._tables.pop(code, None)
+
+    def _recode(
+        self, code: int, row: CountBuffer, recode: list[int], old_base: int
+    ) -> tuple[int, array]:
+        """
+        Translate a context code and its row to the current alphabet.
+
+        :param code: The code of the context in the old alphabet.
+        :param row: The row of the context in the old alphabet.
+        :param recode: The new code of every char of the old alphabet.
+        :param old_base: The size of the old alphabet.
+        :return: Tuple of the new code and the new row.
+        """
+        base = self.base
+        new_code, scale = 0, 1
+        while code:
+            code, digit = divmod(code, old_base)
+            new_code += recode[digit] * scale
+            scale *= base
+        new_row = array("I")
+        for char, count in sorted(
+            (recode[char], count) for char, count in zip(row[::2], row[1::2])
+        ):
+            new_row.extend((char, count))
+        return new_code, new_row
+
+    def _extend_support(self, chars: Iterable[str]) -> None:
+        """
+        Add chars to the support, with the next free codes.
+
+        The codes of known chars never change, so the counts learned so
+        far only need re-coding when the alphabet outgrows the base,
+        which then doubles. Re-coding is therefore rare, and its cost is
+        amortized over the growth of the alphabet. The codes depend on
+        the order of the chars, which is the order they were first seen
+        in, so training on the same words always yields the same codes.
+
+        :param chars: The chars to add to the support, in order. Chars
+            that are already supported are skipped.
+        :return: None.
+        """
+        old_base = self.base
+        new_chars = [char for char in dict.fromkeys(chars)
+                     if char not in self.codes]
+        fits = len(self.alphabet) + len(new_chars) <= old_base
+        self._set_support(
+            self.alphabet[1:] + new_chars, old_base if fits else None
+        )
+        if not fits:
+            self._thaw()
+            self.counts = {
+                self._rebase(code, old_base): row
+                for code, row in self.counts.items()
+            }
+            self._tables.clear()
+
+    def _rebase(self, code: int, old_base: int) -> int:
+        """
+        Translate a context code packed in another base to the current one.
+
+        :param code: The code of the context in the old base.
+        :param old_base: The old base.
+        :return: The code of the context in the current base.
+        """
+        new_code, scale = 0, 1
+        while code:
+            code, digit = divmod(code, old_base)
+            new_code += digit * scale
+            scale *= self.base
+        return new_code
+
+    def _row_weights(self, row: array) -> dict[str, float]:
+        """
+        Add the prior to the observed counts of a context.
+
+        :param row: The array (or buffer) of alternating char codes and
+            counts.
+        :return: A dictionary mapping every char of the alphabet to its
+            observed count plus the prior.
+        """
+        weights = copy.copy(self.prior)
+        for char, count in zip(row[::2], row[1::2]):
+            weights[self.alphabet[char]] += count
+        return weights
+
+    def _build_table(self, row: array) -> SamplingTableABC:
+        """
+        Build the sampling table for the observed counts of a context.
+
+        :param row: The array (or buffer) of alternating char codes and
+            counts.
+        :return: The sampling table of the configured sampler.
+        """
+        weights = {
+            self.alphabet[char]: count
+            for char, count in zip(row[::2], row[1::2])
+        }
+        return SAMPLERS[self.sampler](weights)
+
+    def _encode(self, context: str) -> int | None:
+        """
+        Pack the given context into an integer.
+
+        :param context: The context to encode.
+        :return: The integer code of the context, or None if the context
+            contains chars not in the support of the chain.
+        """
+        base = self.base
+        code = 0
+        for char in context:
+            digit = self.codes.get(char)
+            if not digit:  # end-of-word char cannot be part of a context
+                return None
+            code = code * base + digit
+        return code
+
+    def _decode(self, code: int) -> str:
+        """
+        Unpack the given integer code into its context.
+
+        :param code: The code of the context, as created by ``_encode``.
+        :return: The context string.
+        """
+        base = self.base
+        chars = []
+        while code:
+            code, digit = divmod(code, base)
+            chars.append(self.alphabet[digit])
+        return "".join(reversed(chars))
 
     
+class _Chains(dict):
+    """
+    Chains of a model by order, training missing orders on first access.
+    """
+
+    def __init__(
+        self,
+        chains: dict[int, MarkovChain],
+        train: Callable[[int], MarkovChain],
+    ) -> None:
+        """
+        :param chains: The chains trained so far.
+        :param train: Callable training, storing and returning the chain
+            of a missing order, or raising KeyError if there is none.
+        """
+        super().__init__(chains)
+        self.train = train
+
+    def __missing__(self, order: int) -> MarkovChain:
+        return self.train(order)
+
+
 class MarkovModel:
     """
     A model, trained to create random names from a set of training data.
@@ -105,13 +780,20 @@ class MarkovModel:
 
     def __init__(
         self,
-        data: list[str],
+        data: Iterable[str],
         order: int,
         prior: float,
-        max_backoff: int = 1
+        max_backoff: int = 1,
+        sampler: str = "cdf",
+        rng: random.Random | int | None = None,
+        workers: int = 1,
+        novelty: str | None = None,
+        lazy: bool = False,
     ) -> None:
         """
-        :param data: List of words to train the model with.
+        :param data: Iterable of words to train the model with. It is
+            only iterated once, so it may be a generator that streams
+            the words from a file.
         :param order: The order of the model, i.e. the number of preceding
             characters to take into account as context for determination
             of the next char.
@@ -120,31 +802,733 @@ class MarkovModel:
             training the model.
         :param max_backoff: The maximum back-off order, i.e. the lowest
             order for which a model will be trained and used in look-up.
+        :param sampler: The sampling engine of the Markov chains: either
+            "linear" (walk the weights), "cdf" (bisect the cumulative
+            weights) or "alias" (constant time alias method). All of
+            them draw from the same distribution. Defaults to "cdf".
+        :param rng: The random number generator used for generation, or
+            a seed to create one from. Defaults to None, which creates
+            a randomly seeded generator.
+        :param workers: The number of worker processes to train in.
+            Defaults to 1, which trains in the current process.
+        :param novelty: The kind of index of the training words to build
+            for generating novel words only: either "set" (exact) or
+            "bloom" (a Bloom filter, compact at the cost of rarely
+            rejecting a novel word). Defaults to None, which builds no
+            index.
+        :param lazy: Whether to train only the chain of the model order
+            right away, and the chains of the back-off orders from a
+            retained copy of the normalized words when they are first
+            backed off to. The model generates the same words either
+            way. Defaults to False, which trains all orders at once.
         """
+        if novelty is not None and novelty not in novelty_index.INDEXES:
+            raise KeyError(f"Unknown novelty index: {novelty}")
+        if not isinstance(rng, random.Random):
+            rng = random.Random(rng)
+        self.rng = rng
         self.order = order
+        self.prior = prior
         self.max_backoff = max_backoff
-        self.valid_startpoints = self._valid_startpoints(data)
+        self.sampler = sampler
+        self.valid_startpoints = StartPoints()
+        self.novelty = novelty
+        self.known_words: novelty_index.IndexType | None = None
+        if novelty is not None:
+            self.known_words = novelty_index.INDEXES[novelty]()
         self.model = {
-            i: MarkovChain(data, i, prior)
+            i: MarkovChain([], i, prior, sampler)
             for i in range(self.max_backoff, self.order + 1)
         }
+        # the normalized words, in chunks of words separated by newlines,
+        # while the chains of some back-off orders are not trained yet
+        self._corpus: list[str] | None = None
+        if lazy and self.order > self.max_backoff:
+            self.model = _Chains(
+                {self.order: self.model[self.order]}, self._train_order
+            )
+            self._corpus = []
+        self._batch_generator: batch.BatchGenerator | None = None
+        self._batch_scorer: scoring.BatchScorer | None = None
+        # shared memory block holding the counts, if attached to one
+        self._shared_memory: shared.AttachedMemory | None = None
+        # order -> context -> chain and code the context resolves to, up
+        # to MAX_RESOLVED_CONTEXTS contexts per order
+        self._resolution: dict[
+            int, dict[str, tuple[MarkovChain | None, int | None]]
+        ] = dict()
+        self.partial_fit(data, workers)
 
-    def generate(self, max_length: int) -> str:
+    @instrumentation.timed("train")
+    def partial_fit(
+        self,
+        data: Iterable[str],
+        workers: int = 1,
+        shard_size: int = 10000,
+    ) -> None:
+        """
+        Learn additional words, on top of everything learned so far.
+
+        The counts of all chains are updated in place and chars that
+        were never seen before are added to the alphabet, so training
+        on a stream in several chunks results in the same model as
+        training on all words at once. The model can keep generating
+        in between: only the sampling tables of the changed contexts
+        are rebuilt, on their next use.
+
+        With multiple workers, the data is split into shards of
+        ``shard_size`` words that are trained in worker processes and
+        merged into the model in order, which yields the same model as
+        training serially.
+
+        :param data: Iterable of words to learn. It is only iterated
+            once, so it may be a generator.
+        :param workers: The number of worker processes. Defaults to 1,
+            which learns all words in the current process.
+        :param shard_size: The number of words per shard when using
+            multiple workers.
+        :return: None.
+        """
+        if workers > 1:
+            self._fit_sharded(data, workers, shard_size)
+            return
+        # all chains share one alphabet, so the n-grams of every batch
+        # are counted once for the model order, and cut down for the
+        # chains of the lower orders
+        chains = sorted(
+            self.model.values(), key=lambda chain: chain.order, reverse=True
+        )
+        top = self.model[self.order]
+        if self.known_words is not None:
+            self.known_words = novelty_index.thaw(self.known_words)
+        for words in itertools.batched(data, LEARN_BATCH_SIZE):
+            self.valid_startpoints.extend(
+                word[:self.order] for word in words
+                if len(word) >= self.order
+            )
+            normalized = [word.lower() for word in words]
+            if self._corpus is not None:
+                # the words are only retained for the back-off orders
+                # not trained yet, which learn them when they are trained
+                self._corpus.append("\n".join(normalized))
+            if self.known_words is not None:
+                for word in normalized:
+                    self.known_words.add(word)
+            # new chars are coded in the order they are first seen
+            new_chars = [
+                char for char in dict.fromkeys("".join(normalized))
+                if char not in top.codes
+            ]
+            if new_chars:
+                for chain in chains:
+                    chain._extend_support(new_chars)
+            ngrams = Ngrams.encode(
+                normalized, top.codes, top.base, self.order
+            )
+            for chain in chains:
+                while ngrams.order > chain.order:
+                    ngrams = ngrams.lower()
+                chain.learn_ngrams(ngrams)
+        self._discard_caches()
+
+    def merge(self, other: "MarkovModel") -> None:
+        """
+        Add everything another model has learned to this model.
+
+        :param other: A model of the same order and back-off order. It
+            is not changed.
+        :raises ValueError: If the orders of the models differ.
+        :return: None.
+        """
+        if (other.order != self.order
+                or other.max_backoff != self.max_backoff):
+            raise ValueError(
+                "Cannot merge models with different orders or back-off "
+                "orders"
+            )
+        corpus = other._corpus
+        if corpus is None:
+            # the words of the other model are gone, but its chains of
+            # all orders are complete
+            self.train_all()
+        for order, chain in self.model.items():
+            other_chain = other.model.get(order)  # never trains an order
+            if other_chain is None:
+                # train the missing order aside, so the other model
+                # keeps its words and stays lazy
+                other_chain = other._learn_corpus(order)
+            chain.merge(other_chain)
+        if self._corpus is not None:
+            self._corpus.extend(corpus)
+        self.valid_startpoints.extend(other.valid_startpoints)
+        if self.known_words is not None and other.known_words is not None:
+            self.known_words = novelty_index.thaw(self.known_words)
+            self.known_words.update(other.known_words)
+        self._discard_caches()
+
+    def prune(
+        self,
+        min_count: int = 1,
+        max_contexts: int | None = None,
+        bits: int = 32,
+        memory_budget: int | None = None,
+        words: list[str] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Prune and quantize the counts of the model to reduce its memory.
+
+        Contexts below the minimum count or beyond the maximum number
+        per order are removed from all chains but the one of the lowest
+        order, so that their look-ups back off to lower orders. The
+        counts of all chains are then stored in flat buffers of the
+        given number of bits per char code and count (see
+        ``MarkovChain.quantize``). Given a memory budget, the settings
+        are tightened until the counts fit in it.
+
+        :param min_count: The minimum total count of a context to keep.
+        :param max_contexts: The maximum number of contexts per order,
+            keeping the most frequent ones. Defaults to None, which keeps
+            all contexts.
+        :param bits: The number of bits per char code and count: 8, 16
+            or 32. Defaults to 32, which stores the counts exactly.
+        :param memory_budget: The maximum size of the packed counts in
+            bytes. Defaults to None, which applies the given settings as
+            they are.
+        :param words: The words to measure the perplexity of the model
+            on before and after pruning. Defaults to None, which
+            generates ``pruning.SAMPLE_SIZE`` words before pruning.
+        :raises ValueError: If the number of bits is not supported or
+            too small for the alphabet, or if the model cannot fit in
+            the memory budget. The model is not changed then.
+        :return: The report of the settings applied, the sizes and the
+            perplexities before and after pruning, as returned by
+            ``pruning.report``.
+        """
+        # all chains share the alphabet, so checking one checks them all
+        # before any of them is changed
+        self.model[self.order].check_bits(bits)
+        # pruning applies to all orders, including those not trained yet
+        self.train_all()
+        if words is None:
+            words = []
+            if self.valid_startpoints:
+                words = self.generate_many(
+                    pruning.SAMPLE_SIZE, pruning.SAMPLE_MAX_LENGTH, seed=0
+                )
+        before = pruning.measure(self, words)
+        if memory_budget is not None:
+            min_count, max_contexts, bits = pruning.plan(
+                self, memory_budget, min_count, max_contexts, bits
+            )
+        for order, chain in self.model.items():
+            if order > self.max_backoff:
+                chain.prune(min_count, max_contexts)
+            chain.quantize(bits)
+            chain.freeze()
+        self._discard_caches()
+        after = pruning.measure(self, words)
+        return pruning.report(
+            before, after, words, (min_count, max_contexts, bits)
+        )
+
+    def is_novel(self, word: str) -> bool:
+        """
+        Return whether the word is not one of the training words.
+
+        :param word: The word to look up, in any case.
+        :raises ValueError: If the model was trained without an index
+            of the training words.
+        :return: True if the word was not learned by the model.
+        """
+        if self.known_words is None:
+            raise ValueError(
+                "The model has no index of its training words, train it "
+                "with novelty enabled"
+            )
+        return word.lower() not in self.known_words
+
+    def train_all(self) -> None:
+        """
+        Train the chains of all back-off orders that are not trained yet.
+
+        Lazy models train the chains of their back-off orders on first
+        use. Afterwards, the retained words are released and the model
+        is the same as a model trained eagerly on the same words.
+
+        :return: None.
+        """
+        for order in range(self.order - 1, self.max_backoff - 1, -1):
+            self.model[order]  # trains the order if it is missing
+
+    def save(self, filepath: str | Path) -> None:
+        """
+        Save the trained model to a file in a compact binary format.
+
+        :param filepath: Path of the file to write.
+        :return: None.
+        """
+        with open(filepath, "wb") as file:
+            self._write(file)
+
+    def to_bytes(self) -> bytes:
+        """
+        Return the trained model in the binary format of ``save``.
+
+        :return: The bytes of the model, as read by ``from_buffer``.
+        """
+        buffer = io.BytesIO()
+        self._write(buffer)
+        return buffer.getvalue()
+
+    def share(self) -> shared.SharedModel:
+        """
+        Publish the trained model in shared memory for worker processes.
+
+        Workers attach to it with ``from_shared_memory``, given the name
+        and the layout of the returned handle, and use the counts and
+        the tables of batch generation in place, without copying. The
+        handle must be closed once all workers are done.
+
+        :return: The handle of the shared memory block.
+        """
+        return shared.SharedModel(self)
+
+    @classmethod
+    def from_shared_memory(
+        cls,
+        name: str,
+        layout: shared.LayoutType,
+        rng: random.Random | int | None = None,
+    ) -> "MarkovModel":
+        """
+        Attach to a model published in shared memory with ``share``.
+
+        The counts and the tables of batch generation of the model stay
+        in the shared memory block, read-only, so attaching neither
+        trains nor copies the model. Learning copies the counts of the
+        affected chains into memory, as for models loaded from a file.
+
+        :param name: The name of the shared memory block.
+        :param layout: The layout of the block.
+        :param rng: The random number generator of the model, or a seed
+            to create one from.
+        :return: The model.
+        """
+        memory, buffer, state = shared.attach(name, layout)
+        model = cls.from_buffer(buffer, rng)
+        # keep the block mapped for as long as the model uses it
+        model._shared_memory = memory
+        if state is not None:
+            model._batch_generator = batch.BatchGenerator(model, state)
+        return model
+
+    def _write(self, file: BinaryIO) -> None:
+        """
+        Write the trained model in the binary format to an open file.
+
+        :param file: File opened for writing in binary mode.
+        :return: None.
+        """
+        self.train_all()
+        metadata = {
+            "order": self.order,
+            "prior": self.prior,
+            "max_backoff": self.max_backoff,
+            "sampler": self.sampler,
+            "support": self.model[self.order].alphabet[1:],
+            "base": self.model[self.order].base,
+        }
+        arrays = dict(zip(
+            ("startpoint_offsets", "startpoints", "startpoint_counts"),
+            self.valid_startpoints.to_arrays(),
+        ))
+        if self.known_words is not None:
+            metadata["known_words"], index_arrays = (
+                novelty_index.index_to_arrays(self.known_words)
+            )
+            arrays.update(index_arrays)
+        chains = [(order, *chain.pack()) for order, chain in self.model.items()]
+        serialization.write_model(file, metadata, chains, arrays)
+
+    @classmethod
+    @instrumentation.timed("load")
+    def load(
+        cls, filepath: str | Path, rng: random.Random | int | None = None
+    ) -> "MarkovModel":
+        """
+        Load a model saved with ``save``, memory-mapping the file.
+
+        The counts of the model are not copied into memory, they remain
+        views into the mapped file, which is shared by all processes
+        loading it.
+
+        :param filepath: Path of the model file.
+        :param rng: The random number generator of the model, or a seed
+            to create one from.
+        :return: The loaded model.
+        """
+        return cls.from_buffer(serialization.map_file(filepath), rng)
+
+    @classmethod
+    def from_buffer(
+        cls, buffer: Any, rng: random.Random | int | None = None
+    ) -> "MarkovModel":
+        """
+        Create a model from a buffer holding a saved model, without copying.
+
+        :param buffer: Any object supporting the buffer protocol and
+            holding a model in the format written by ``save``.
+        :param rng: The random number generator of the model, or a seed
+            to create one from.
+        :return: The model.
+        """
+        metadata, chains, arrays = serialization.read_model(buffer)
+        model = cls(
+            [],
+            metadata["order"],
+            metadata["prior"],
+            metadata["max_backoff"],
+            metadata["sampler"],
+            rng,
+        )
+        model.valid_startpoints = StartPoints.from_arrays(
+            arrays["startpoint_offsets"],
+            arrays["startpoints"],
+            arrays["startpoint_counts"],
+        )
+        if "known_words" in metadata:
+            model.novelty = metadata["known_words"]["kind"]
+            model.known_words = novelty_index.index_from_arrays(
+                metadata["known_words"], arrays
+            )
+        model.model = {
+            order: MarkovChain.from_counts(
+                PackedCounts(keys, offsets, pairs),
+                order,
+                metadata["prior"],
+                metadata["support"],
+                metadata["sampler"],
+                metadata["base"],
+            )
+            for order, keys, offsets, pairs in chains
+        }
+        return model
+
+    @instrumentation.timed("generate")
+    def generate(
+        self,
+        max_length: int,
+        min_length: int = 0,
+        prefix: str = "",
+        suffix: str = "",
+        contains: str = "",
+        novel: bool = False,
+    ) -> str:
         """
         Generate a random word from the learned data.
 
+        Constraints are enforced while sampling: only chars after which
+        the word can still satisfy them are drawn, so the words follow
+        the distribution of unconstrained words that happen to satisfy
+        them, without rejecting any. The checks are case-insensitive.
+
+        :param max_length: The maximum number of characters in the word.
+        :param min_length: The minimum number of characters in the word.
+        :param prefix: The text the word must start with.
+        :param suffix: The text the word must end with.
+        :param contains: The text the word must contain.
+        :param novel: Whether to resample words until one is not a
+            training word. Requires a model trained with novelty.
+        :raises ValueError: If no word can satisfy the constraints, or
+            if no novel word is found.
+        :return: A random word, inspired by the learned data.
+        """
+        for _ in range(MAX_NOVELTY_ATTEMPTS):
+            word = self._generate_word(
+                max_length, min_length, prefix, suffix, contains
+            )
+            if not novel or self.is_novel(word):
+                return word
+        raise ValueError(
+            f"No novel word found in {MAX_NOVELTY_ATTEMPTS} attempts"
+        )
+
+    def _generate_word(
+        self,
+        max_length: int,
+        min_length: int,
+        prefix: str,
+        suffix: str,
+        contains: str,
+    ) -> str:
+        """
+        Generate a random word, which may be a training word.
+
         :param max_length: The maximum number of characters in the word.
+        :param min_length: The minimum number of characters in the word.
+        :param prefix: The text the word must start with.
+        :param suffix: The text the word must end with.
+        :param contains: The text the word must contain.
         :return: A random word, inspired by the learned data.
         """
-        word = random.choice(self.valid_startpoints)
+        if min_length or prefix or suffix or contains:
+            return self._constrained_generator(
+                max_length, min_length, prefix, suffix, contains
+            ).generate(self.rng)
+        word = self.rng.choice(self.valid_startpoints)
+        truncated = False
         while len(word) < max_length:
             context = word[-self.order:]
             next_char = self.sample(context, self.order)
             if next_char == "\n":
                 break
             word += next_char
+        else:
+            truncated = True
+        if instrumentation.active is not None:
+            instrumentation.active.record_names(1, truncated)
         return word.title()
-    
+
+    def acceptance_rate(
+        self,
+        max_length: int,
+        min_length: int = 0,
+        prefix: str = "",
+        suffix: str = "",
+        contains: str = "",
+    ) -> float:
+        """
+        Return the share of unconstrained words meeting the constraints.
+
+        This is the acceptance rate that generating words and rejecting
+        the invalid ones would have, which constrained generation avoids.
+
+        :param max_length: The maximum number of characters in the word.
+        :param min_length: The minimum number of characters in the word.
+        :param prefix: The text the word must start with.
+        :param suffix: The text the word must end with.
+        :param contains: The text the word must contain.
+        :raises ValueError: If no word can satisfy the constraints.
+        :return: The probability that a word generated without the
+            constraints satisfies them.
+        """
+        return self._constrained_generator(
+            max_length, min_length, prefix, suffix, contains
+        ).acceptance_rate
+
+    def top_k(
+        self, k: int, max_length: int, beam_width: int = 1000
+    ) -> list[tuple[str, float]]:
+        """
+        Find the most probable words of the model.
+
+        The search is deterministic: a beam search over the
+        log-probabilities of the words, following the back-off of the
+        model. It is exact as long as the beam is wide enough.
+
+        :param k: The number of words to find.
+        :param max_length: The maximum number of characters per word.
+        :param beam_width: The number of partial words kept in every
+            step of the search. Wider beams find more probable words,
+            at the cost of time and memory. Defaults to 1000.
+        :return: List of up to ``k`` tuples of the words and their
+            probabilities to be generated, from the most to the least
+            probable.
+        """
+        return search.top_k(self, k, max_length, beam_width)
+
+    def score(self, word: str) -> tuple[float, float]:
+        """
+        Score a word by how likely the model is to generate it.
+
+        :param word: The word to score, case-insensitively.
+        :return: Tuple of the natural log-probability of the word and
+            its perplexity per char, as returned by ``score_batch``.
+        """
+        log_probabilities, perplexities = self.score_batch([word])
+        return log_probabilities[0], perplexities[0]
+
+    def score_batch(
+        self, words: list[str]
+    ) -> tuple[list[float], list[float]]:
+        """
+        Score many words at once by how likely the model is to generate
+        them.
+
+        The probability of a word is the share of its start point among
+        all start points, times the probabilities of all its following
+        chars and its end, backed off as in ``sample``. It disregards
+        any maximum length of generation. The perplexity is the inverse
+        geometric mean of the probabilities of all chars and the end,
+        so it compares words of different lengths. Uses NumPy if it is
+        available.
+
+        :param words: The words to score, case-insensitively.
+        :return: Tuple of the list of the natural log-probabilities of
+            the words and the list of their perplexities. Words the
+            model cannot generate have a log-probability of minus
+            infinity and an infinite perplexity.
+        """
+        if self._batch_scorer is None:
+            self._batch_scorer = scoring.BatchScorer(self)
+        return self._batch_scorer.score(words)
+
+    @instrumentation.timed("generate")
+    def generate_batch(self, n: int, max_length: int) -> list[str]:
+        """
+        Generate many random words at once from the learned data.
+
+        All words of the batch are advanced in lockstep through flattened
+        sampling tables of the model, using NumPy if it is available.
+        The words follow the same distribution as those of ``generate``.
+
+        :param n: The number of words to generate.
+        :param max_length: The maximum number of characters per word.
+        :return: A list of random words, inspired by the learned data.
+        """
+        if self._batch_generator is None:
+            self._batch_generator = batch.BatchGenerator(self)
+        return self._batch_generator.generate(n, max_length, self.rng)
+
+    @instrumentation.timed("generate")
+    def generate_many(
+        self,
+        n: int,
+        max_length: int,
+        workers: int = 1,
+        seed: int | None = None,
+        chunk_size: int = 10000,
+        novel: bool = False,
+        unique: bool = False,
+        max_perplexity: float | None = None,
+        shared_memory: bool = False,
+    ) -> list[str]:
+        """
+        Generate many random words, optionally using multiple processes.
+
+        The words are generated in batches of ``chunk_size`` words. Every
+        chunk draws from its own random number generator, derived from
+        the seed and the index of the chunk, and the chunks are returned
+        in order. The result is therefore fully determined by the seed
+        and the chunk size, regardless of the number of workers. When
+        using multiple workers, the model is sent to each worker process
+        only once.
+
+        Words rejected as training words, duplicates or implausible words
+        are replaced by the words of further chunks, so the result stays
+        reproducible.
+
+        :param n: The number of words to generate.
+        :param max_length: The maximum number of characters per word.
+        :param workers: The number of worker processes. Defaults to 1,
+            which generates all words in the current process.
+        :param seed: The seed from which the generators of all chunks
+            are derived. Defaults to None, which draws a seed from the
+            generator of the model.
+        :param chunk_size: The number of words generated per chunk.
+        :param novel: Whether to reject training words. Requires a model
+            trained with novelty.
+        :param unique: Whether to reject words generated before, so that
+            all words are distinct (ignoring case).
+        :param max_perplexity: The maximum perplexity of the words, as
+            computed by ``score_batch``. Defaults to None, which accepts
+            words of any perplexity.
+        :param shared_memory: Whether the workers attach to the model in
+            shared memory (see ``share``) instead of receiving a copy of
+            it each. Defaults to False.
+        :raises ValueError: If ``MAX_NOVELTY_ATTEMPTS`` words in a row
+            are rejected.
+        :return: A list of random words, inspired by the learned data.
+        """
+        if seed is None:
+            seed = self.rng.getrandbits(64)
+        tasks = [
+            (seed, index, min(chunk_size, n - start), max_length)
+            for index, start in enumerate(range(0, n, chunk_size))
+        ]
+        executor = None
+        shared_model = None
+        if workers > 1:
+            initializer, initargs = _init_worker, (self,)
+            if shared_memory:
+                shared_model = self.share()
+                initializer = _init_shared_worker
+                initargs = (shared_model.name, shared_model.layout)
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=initializer,
+                initargs=initargs,
+            )
+        words = []
+        seen = set()
+        rejected = 0  # words rejected since the last accepted word
+        try:
+            while len(words) < n:
+                if executor is None:
+                    chunks = [self._generate_chunk(*task) for task in tasks]
+                else:
+                    chunks = executor.map(_generate_worker_chunk, tasks)
+                candidates = list(itertools.chain.from_iterable(chunks))
+                plausible = itertools.repeat(True)
+                if max_perplexity is not None:
+                    plausible = (
+                        perplexity <= max_perplexity
+                        for perplexity in self.score_batch(candidates)[1]
+                    )
+                for word, is_plausible in zip(candidates, plausible):
+                    if (not is_plausible
+                            or novel and not self.is_novel(word)
+                            or unique and word.lower() in seen):
+                        rejected += 1
+                        continue
+                    seen.add(word.lower())
+                    words.append(word)
+                    rejected = 0
+                if rejected >= MAX_NOVELTY_ATTEMPTS:
+                    raise ValueError(
+                        f"Found only {len(words)} of {n} acceptable words"
+                    )
+                # top up with full chunks following the previous ones
+                missing = n - len(words)
+                first = tasks[-1][1] + 1
+                tasks = [
+                    (seed, index, chunk_size, max_length)
+                    for index in range(first, first - (-missing // chunk_size))
+                ]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if shared_model is not None:
+                shared_model.close()
+        return words[:n]
+
+    def probabilities(self, context: str) -> dict[str, float]:
+        """
+        Return the probabilities of the chars following the context.
+
+        The context is backed off through the orders in the same way as
+        in ``sample``.
+
+        :param context: The context, as long as the order of the model.
+        :return: Dictionary mapping every char with a positive
+            probability to its probability. The end of the word is the
+            char "\\n".
+        """
+        weights = None
+        for order in range(self.order, self.max_backoff - 1, -1):
+            weights = self.model[order].weights(context)
+            if weights is not None:
+                break
+            context = "" if order == 1 else context[1:]
+        if weights is None:
+            return {"\n": 1.0}
+        total = sum(weights.values())
+        return {
+            char: weight / total
+            for char, weight in weights.items()
+            if weight > 0
+        }
+
     def sample(self, context: str, order: int) -> str:
         """
         Sample the MC of the given order for the next char for the context.
@@ -162,23 +1546,325 @@ class MarkovModel:
         """
         if order <= self.max_backoff - 1:
             return "\n"
-        next_char = self.model[order].sample(context)
-        if next_char is None:
-            next_context = "" if order == 1 else context[1:]
-            return self.sample(next_context, order - 1)
-        return next_char
+        resolution = self._resolution.get(order)
+        if resolution is None:
+            self.model[order]  # raise KeyError for orders above the model
+            resolution = self._resolution[order] = dict()
+        try:
+            chain, code = resolution[context]
+        except KeyError:
+            if len(resolution) >= MAX_RESOLVED_CONTEXTS:
+                resolution.clear()
+            chain, code = resolution[context] = self._resolve(context, order)
+        if instrumentation.active is not None:
+            instrumentation.active.record_lookup(
+                order, None if chain is None else chain.order, self.max_backoff
+            )
+        if chain is None:
+            return "\n"
+        return chain.sample_code(code, self.rng)
 
-    def _valid_startpoints(self, data: list[str]) -> list[str]:
+    def resolve(
+        self, context: str, order: int
+    ) -> tuple["MarkovChain | None", int | None]:
         """
-        Return a list of the starting characters of the given data.
+        Find the chain and context code that a back-off ends up with.
+
+        The resolution is memoized and shared with ``sample``, which
+        inlines it. The memo of every order is cleared when it reaches
+        ``MAX_RESOLVED_CONTEXTS`` contexts, so looking up arbitrary
+        contexts, such as those of names to score, cannot grow it
+        without bound, while hits cost no bookkeeping.
 
-        :param data: List of training data words.
-        :return: A list of the first N chars of the training data, 
-            where N is the order of the model.
+        :param context: The context to sample the next char for.
+        :param order: The order of the Markov chain to start from.
+        :return: Tuple of the first chain, going down from the given
+            order, that knows the (shortened) context, and the code of
+            that context. Both are None if no chain above the back-off
+            order knows the context.
         """
-        valid = []
-        for word in data:
-            if len(word) < self.order:
-                continue
-            valid.append(word[:self.order])
-        return valid
+        if order <= self.max_backoff - 1:
+            return None, None
+        resolution = self._resolution.get(order)
+        if resolution is None:
+            self.model[order]  # raise KeyError for orders above the model
+            resolution = self._resolution[order] = dict()
+        try:
+            return resolution[context]
+        except KeyError:
+            if len(resolution) >= MAX_RESOLVED_CONTEXTS:
+                resolution.clear()
+            resolved = resolution[context] = self._resolve(context, order)
+            return resolved
+
+    def _resolve(
+        self, context: str, order: int
+    ) -> tuple["MarkovChain | None", int | None]:
+        """
+        Find the chain and context code that a back-off ends up with.
+
+        :param context: The context to sample the next char for.
+        :param order: The order of the Markov chain to start from.
+        :return: Tuple of the first chain, going down from the given
+            order, that knows the (shortened) context, and the code of
+            that context. Both are None if no chain above the back-off
+            order knows the context.
+        """
+        while order >= self.max_backoff:
+            chain = self.model[order]
+            code = chain._encode(context)
+            if code in chain.counts:
+                return chain, code
+            context = "" if order == 1 else context[1:]
+            order -= 1
+        return None, None
+
+    def _constrained_generator(
+        self,
+        max_length: int,
+        min_length: int,
+        prefix: str,
+        suffix: str,
+        contains: str,
+    ) -> constraints.ConstrainedGenerator:
+        """
+        Return the generator for the constraints, creating it if needed.
+
+        The generators are kept, so that their tables of states are
+        reused by all words generated with the same constraints.
+
+        :param max_length: The maximum number of characters in the word.
+        :param min_length: The minimum number of characters in the word.
+        :param prefix: The text the word must start with.
+        :param suffix: The text the word must end with.
+        :param contains: The text the word must contain.
+        :return: The constrained generator.
+        """
+        key = (max_length, min_length, prefix, suffix, contains)
+        generator = self._constrained.get(key)
+        if generator is None:
+            generator = constraints.ConstrainedGenerator(self, *key)
+            self._constrained[key] = generator
+        return generator
+
+    def _discard_caches(self) -> None:
+        """
+        Discard everything derived from the counts after learning.
+
+        :return: None.
+        """
+        # the flattened tables of batch generation are stale now, and
+        # contexts that backed off before may be known now
+        self._batch_generator = None
+        self._batch_scorer = None
+        self._resolution = dict()
+        self._constrained = dict()
+
+    @instrumentation.timed("train")
+    def _train_order(self, order: int) -> MarkovChain:
+        """
+        Train the chain of a back-off order of a lazy model.
+
+        The chain learns the retained words in the current alphabet of
+        the model, so it ends up the same as if it had learned them
+        along with the chain of the model order.
+
+        :param order: The back-off order.
+        :raises KeyError: If the model has no chain of that order.
+        :return: The trained chain, which is stored in the model.
+        """
+        if self._corpus is None or not (
+            self.max_backoff <= order < self.order
+        ):
+            raise KeyError(order)
+        chain = self._learn_corpus(order)
+        self.model[order] = chain
+        if len(self.model) == self.order - self.max_backoff + 1:
+            # all orders are trained, so the model is an eager one now
+            self.model = dict(sorted(self.model.items()))
+            self._corpus = None
+        if instrumentation.active is not None:
+            instrumentation.active.record_trained_order(order)
+        return chain
+
+    def _learn_corpus(self, order: int) -> MarkovChain:
+        """
+        Return a new chain of an order that learned the retained words.
+
+        The chain learns the words in the current alphabet of the model
+        and is not stored in the model.
+
+        :param order: The order of the chain.
+        :return: The trained chain.
+        """
+        top = self.model[self.order]
+        chain = MarkovChain([], order, self.prior, self.sampler)
+        chain._set_support(top.alphabet[1:], top.base)
+        for chunk in self._corpus:
+            chain.learn_ngrams(Ngrams.encode(
+                chunk.split("\n"), top.codes, top.base, order
+            ))
+        return chain
+
+    def _fit_sharded(
+        self, data: Iterable[str], workers: int, shard_size: int
+    ) -> None:
+        """
+        Learn the words in shards in worker processes and merge them.
+
+        Only a few shards per worker are in flight at any time, so the
+        data is still streamed.
+
+        :param data: Iterable of words to learn.
+        :param workers: The number of worker processes.
+        :param shard_size: The number of words per shard.
+        :return: None.
+        """
+        parameters = (
+            self.order,
+            self.prior,
+            self.max_backoff,
+            self.sampler,
+            self.novelty,
+            self._corpus is not None,
+        )
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for shard in itertools.batched(data, shard_size):
+                pending.append(
+                    executor.submit(_train_shard, shard, *parameters)
+                )
+                if len(pending) > 2 * workers:
+                    self.merge(pending.popleft().result())
+            while pending:
+                self.merge(pending.popleft().result())
+
+    def _generate_chunk(
+        self, seed: int, index: int, n: int, max_length: int
+    ) -> list[str]:
+        """
+        Generate a chunk of words from a generator derived from the seed.
+
+        :param seed: The seed of the whole run.
+        :param index: The index of the chunk within the run.
+        :param n: The number of words in the chunk.
+        :param max_length: The maximum number of characters per word.
+        :return: The list of words of the chunk.
+        """
+        if self._batch_generator is None:
+            self._batch_generator = batch.BatchGenerator(self)
+        rng = random.Random(f"{seed}:{index}")
+        return self._batch_generator.generate(n, max_length, rng)
+
+    def __getstate__(self) -> dict:
+        # the batch generator is cheap to rebuild, but large to pickle
+        state = self.__dict__.copy()
+        state["_batch_generator"] = None
+        state["_batch_scorer"] = None
+        state["_resolution"] = dict()
+        state["_constrained"] = dict()
+        # loaded counts are copied into the pickle, not the block holding
+        # them
+        state["_shared_memory"] = None
+        return state
+
+
+def _add_count(row: array, char: int, count: int) -> None:
+    """
+    Add to the count of a char in a row, keeping the row sorted.
+
+    :param row: The array of alternating char codes and counts.
+    :param char: The code of the char.
+    :param count: The count to add.
+    :return: None.
+    """
+    chars = row[::2]
+    try:
+        row[2 * chars.index(char) + 1] += count
+    except ValueError:
+        index = 2 * bisect.bisect(chars, char)
+        row[index:index] = array("I", (char, count))
+
+
+@contextlib.contextmanager
+def _paused_gc() -> Iterator[None]:
+    """
+    Pause the garbage collector while creating many rows of counts.
+
+    Arrays are tracked by the garbage collector although they cannot be
+    part of reference cycles, so creating one row per context would
+    otherwise trigger collections that traverse all rows created so far.
+
+    :return: Context manager pausing the collector, unless it was
+        disabled already.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _init_worker(model: MarkovModel) -> None:
+    """
+    Install the model in a worker process of ``generate_many``.
+
+    :param model: The model to generate words from.
+    :return: None.
+    """
+    global _worker_model
+    _worker_model = model
+
+
+def _init_shared_worker(name: str, layout: shared.LayoutType) -> None:
+    """
+    Attach a worker process of ``generate_many`` to the shared model.
+
+    :param name: The name of the shared memory block of the model.
+    :param layout: The layout of the block.
+    :return: None.
+    """
+    global _worker_model
+    _worker_model = MarkovModel.from_shared_memory(name, layout)
+
+
+def _generate_worker_chunk(task: tuple[int, int, int, int]) -> list[str]:
+    """
+    Generate a chunk of words in a worker process of ``generate_many``.
+
+    :param task: The arguments of ``MarkovModel._generate_chunk``.
+    :return: The list of words of the chunk.
+    """
+    return _worker_model._generate_chunk(*task)
+
+
+def _train_shard(
+    words: Iterable[str],
+    order: int,
+    prior: float,
+    max_backoff: int,
+    sampler: str,
+    novelty: str | None,
+    lazy: bool,
+) -> MarkovModel:
+    """
+    Train a model on a shard of words in a worker process.
+
+    The sampling tables are not built, as the model is only merged.
+
+    :param words: The words of the shard.
+    :param order: The order of the model.
+    :param prior: The prior of the model.
+    :param max_backoff: The maximum back-off order of the model.
+    :param sampler: The sampler of the model.
+    :param novelty: The kind of index of the training words.
+    :param lazy: Whether to train the back-off orders lazily.
+    :return: The model of the shard.
+    """
+    model = MarkovModel(
+        [], order, prior, max_backoff, sampler, novelty=novelty, lazy=lazy
+    )
+    model.partial_fit(words)
+    return model
@@ -0,0 +1,262 @@
+"""
+Blends of several trained models, mixed at sample time.
+
+A mixture draws every next char from the weighted interpolation of the
+next-char distributions of its models. Instead of building the
+interpolated distribution in every step, it first draws one of the
+models by weight and then samples that model, which yields exactly the
+same distribution but reuses the sampling tables of the models as they
+are. The weights are therefore free to change between any two names,
+without retraining or rebuilding anything.
+
+Every model backs off through its own orders as it does on its own. A
+model that knows a context at none of its orders has nothing to say
+about the next char, so it abstains and the weights of the other models
+are renormalized; the word only ends there if no model knows the
+context.
+"""
+
+from __future__ import annotations
+
+import bisect
+import itertools
+import math
+import random
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Any
+
+import instrumentation
+
+if TYPE_CHECKING:
+    from markov_model import MarkovChain, MarkovModel
+
+
+class MixtureModel:
+    """
+    Weighted blend of several trained Markov models.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[MarkovModel],
+        weights: Sequence[float] | None = None,
+        rng: random.Random | int | None = None,
+    ) -> None:
+        """
+        :param models: The trained models to blend. They may differ in
+            order, back-off order and alphabet.
+        :param weights: The weight of every model. They are normalized,
+            so only their ratios matter. Defaults to None, which weights
+            all models equally.
+        :param rng: The random number generator used for generation, or
+            a seed to create one from. Defaults to None, which creates
+            a randomly seeded generator.
+        :raises ValueError: If there are no models or the weights are
+            invalid.
+        """
+        if not models:
+            raise ValueError("A mixture needs at least one model")
+        if not isinstance(rng, random.Random):
+            rng = random.Random(rng)
+        self.models = list(models)
+        self.rng = rng
+        self.weights = self._normalize(weights)
+
+    def set_weights(self, weights: Sequence[float] | None) -> None:
+        """
+        Change the weights of the models for all further names.
+
+        :param weights: The weight of every model, or None for equal
+            weights.
+        :raises ValueError: If the weights are invalid.
+        :return: None.
+        """
+        self.weights = self._normalize(weights)
+
+    def probabilities(
+        self, word: str, weights: Sequence[float] | None = None
+    ) -> dict[str, float]:
+        """
+        Return the probabilities of the chars following a partial word.
+
+        :param word: The start of the word generated so far.
+        :param weights: The weights to use instead of the weights of the
+            mixture. Defaults to None, which uses them.
+        :raises ValueError: If the weights are invalid.
+        :return: Dictionary mapping every char with a positive
+            probability to its probability. The end of the word is the
+            char "\\n".
+        """
+        weights = self.weights if weights is None else (
+            self._normalize(weights)
+        )
+        known = []
+        for model, weight in zip(self.models, weights):
+            if weight > 0:
+                chain, _ = self._resolve(model, word)
+                if chain is not None:
+                    context = word[-chain.order:] if chain.order else ""
+                    known.append((chain.weights(context), weight))
+        if not known:
+            return {"\n": 1.0}
+        total = sum(weight for _, weight in known)
+        mixed: dict[str, float] = dict()
+        for chain_weights, weight in known:
+            scale = weight / total / sum(chain_weights.values())
+            for char, chain_weight in chain_weights.items():
+                if chain_weight > 0:
+                    mixed[char] = mixed.get(char, 0.0) + scale * chain_weight
+        return mixed
+
+    @instrumentation.timed("generate")
+    def generate(
+        self, max_length: int, weights: Sequence[float] | None = None
+    ) -> str:
+        """
+        Generate a random word from the blend of the models.
+
+        The start of the word is a start point of one of the models,
+        drawn by weight, and every further char is drawn from the
+        interpolated distribution of the models that know the context.
+
+        :param max_length: The maximum number of characters in the word.
+        :param weights: The weights to use instead of the weights of the
+            mixture, for this word only. Defaults to None, which uses
+            them.
+        :raises ValueError: If the weights are invalid.
+        :return: A random word, inspired by the learned data of all
+            models.
+        """
+        weights = self.weights if weights is None else (
+            self._normalize(weights)
+        )
+        active = [
+            (model, weight)
+            for model, weight in zip(self.models, weights) if weight > 0
+        ]
+        return self._generate_word(active, max_length)
+
+    @instrumentation.timed("generate")
+    def generate_batch(
+        self, n: int, max_length: int, weights: Sequence[float] | None = None
+    ) -> list[str]:
+        """
+        Generate many random words from the blend of the models.
+
+        :param n: The number of words to generate.
+        :param max_length: The maximum number of characters per word.
+        :param weights: The weights to use instead of the weights of the
+            mixture, for these words only. Defaults to None, which uses
+            them.
+        :raises ValueError: If the weights are invalid.
+        :return: A list of random words, inspired by the learned data of
+            all models.
+        """
+        weights = self.weights if weights is None else (
+            self._normalize(weights)
+        )
+        active = [
+            (model, weight)
+            for model, weight in zip(self.models, weights) if weight > 0
+        ]
+        return [self._generate_word(active, max_length) for _ in range(n)]
+
+    def _generate_word(
+        self, active: list[tuple[MarkovModel, float]], max_length: int
+    ) -> str:
+        """
+        Generate a random word from the blend of some of the models.
+
+        Draws are only spent on choosing a model if more than one model
+        is eligible, so a mixture of a single model generates the same
+        words as that model with the same random number generator.
+
+        :param active: The models with a positive weight, and their
+            weights.
+        :param max_length: The maximum number of characters in the word.
+        :return: A random word.
+        """
+        rng = self.rng
+        model = self._choose(active, rng)
+        word = rng.choice(model.valid_startpoints)
+        truncated = False
+        while len(word) < max_length:
+            known = []
+            for model, weight in active:
+                chain, code = self._resolve(model, word)
+                if chain is not None:
+                    known.append(((chain, code), weight))
+            if not known:
+                break
+            chain, code = self._choose(known, rng)
+            next_char = chain.sample_code(code, rng)
+            if next_char == "\n":
+                break
+            word += next_char
+        else:
+            truncated = True
+        if instrumentation.active is not None:
+            instrumentation.active.record_names(1, truncated)
+        return word.title()
+
+    def _normalize(self, weights: Sequence[float] | None) -> list[float]:
+        """
+        Validate weights and scale them to a sum of one.
+
+        :param weights: The weight of every model, or None for equal
+            weights.
+        :raises ValueError: If the number of weights does not match the
+            number of models, or the weights are negative, not finite,
+            or all zero.
+        :return: The normalized weights.
+        """
+        if weights is None:
+            return [1 / len(self.models)] * len(self.models)
+        weights = [float(weight) for weight in weights]
+        if len(weights) != len(self.models):
+            raise ValueError(
+                f"Expected {len(self.models)} weights, got {len(weights)}"
+            )
+        if any(weight < 0 or not math.isfinite(weight) for weight in weights):
+            raise ValueError("Weights must be finite and non-negative")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("At least one weight must be positive")
+        return [weight / total for weight in weights]
+
+    @staticmethod
+    def _resolve(
+        model: MarkovModel, word: str
+    ) -> tuple[MarkovChain | None, int | None]:
+        """
+        Find the chain and context code a model backs off to for a word.
+
+        :param model: The model.
+        :param word: The start of the word generated so far. Words that
+            are shorter than the order of the model, which happens when
+            they start with a start point of a model of lower order,
+            start backing off at the order of their length.
+        :return: Tuple of the chain and the code of the context, both
+            None if the model does not know the context at any order.
+        """
+        order = min(model.order, len(word))
+        return model.resolve(word[-order:] if order else "", order)
+
+    @staticmethod
+    def _choose(options: list[tuple[Any, float]], rng: random.Random) -> Any:
+        """
+        Draw one of several options by their weights.
+
+        :param options: List of tuples of the options and their positive
+            weights, which need not be normalized.
+        :param rng: The random number generator to draw from. It is only
+            used if there is more than one option.
+        :return: The drawn option.
+        """
+        if len(options) == 1:
+            return options[0][0]
+        cumulative = list(
+            itertools.accumulate(weight for _, weight in options)
+        )
+        index = bisect.bisect_right(cumulative, rng.random() * cumulative[-1])
+        return options[min(index, len(options) - 1)][0]
@@ -0,0 +1,225 @@
+"""
+Counting of the n-grams of training words for the chains of all orders.
+
+All chains of a model share one alphabet, so the n-grams of a batch of
+words are counted once for the model order, and those of every lower
+order follow from them without going over the words again: cutting an
+n-gram down to its last chars yields the n-gram of the lower order
+ending at the same char.
+
+NumPy is an optional dependency: if it is installed, large batches are
+counted using vectorized array operations, otherwise a pure Python
+fallback counts the same n-grams.
+"""
+
+from __future__ import annotations
+
+import itertools
+from array import array
+from collections import Counter
+from collections.abc import Iterator, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+from batch import MAX_NUMPY_CODE
+
+
+# smallest number of chars of a batch for which the n-grams are counted
+# using NumPy, below which the overhead of the arrays outweighs it
+MIN_VECTORIZED_CHARS = 4096
+
+
+class Ngrams:
+    """
+    The counted n-grams of a batch of encoded words, for one order.
+
+    An n-gram is a context followed by a char, and is packed into the
+    code of the context times the base plus the code of the char. The
+    n-grams are counted from the joined words, in which every word is
+    followed by a newline of code 0, as the last char of the word.
+    """
+
+    def __init__(
+        self,
+        keys: list[int] | np.ndarray,
+        counts: list[int] | np.ndarray,
+        heads: list[list[int]] | list[np.ndarray],
+        order: int,
+        base: int,
+    ) -> None:
+        """
+        :param keys: The sorted codes of all distinct n-grams, as a list
+            or a NumPy array.
+        :param counts: The number of every n-gram, in the same order.
+        :param heads: The codes of the n-grams ending at every position
+            of every word below the context length, by position, which
+            lower orders count as well. They may contain chars of the
+            previous word as leading digits.
+        :param order: The length of the context of the n-grams.
+        :param base: The base the contexts are packed in.
+        """
+        self.keys = keys
+        self.counts = counts
+        self.heads = heads
+        self.order = order
+        self.base = base
+
+    @classmethod
+    def encode(
+        cls,
+        words: Sequence[str],
+        codes: dict[str, int],
+        base: int,
+        order: int,
+    ) -> Ngrams:
+        """
+        Count the n-grams of words in one pass over all of their chars.
+
+        :param words: The normalized words.
+        :param codes: The code of every char of the words.
+        :param base: The base the contexts are packed in.
+        :param order: The length of the context of the n-grams.
+        :return: The n-grams of the words.
+        """
+        text = "\n".join(words) + "\n"
+        if (np is not None and len(text) >= MIN_VECTORIZED_CHARS
+                and base ** (order + 1) < MAX_NUMPY_CODE):
+            return cls._encode_vectorized(words, text, codes, base, order)
+        modulus = base ** (order + 1)
+        code = 0
+        # the code of every n-gram follows from the code of the one
+        # ending one char earlier
+        windows = [
+            code := (code * base + codes[char]) % modulus for char in text
+        ]
+        lengths = [len(word) for word in words]
+        positions = itertools.chain.from_iterable(
+            range(length + 1) for length in lengths
+        )
+        # the context of an n-gram lies within its word once the n-gram
+        # ends at least ``order`` chars into the word
+        pairs = Counter(
+            itertools.compress(windows, map(order.__le__, positions))
+        )
+        keys = sorted(pairs)
+        starts = list(itertools.accumulate(
+            (length + 1 for length in lengths), initial=0
+        ))
+        heads = [
+            [
+                windows[start + position]
+                for start, length in zip(starts, lengths)
+                if length >= position
+            ]
+            for position in range(order)
+        ]
+        return cls(keys, [pairs[key] for key in keys], heads, order, base)
+
+    @classmethod
+    def _encode_vectorized(
+        cls,
+        words: Sequence[str],
+        text: str,
+        codes: dict[str, int],
+        base: int,
+        order: int,
+    ) -> Ngrams:
+        """
+        Count the n-grams of words using NumPy.
+
+        :param words: The normalized words.
+        :param text: The words, each followed by a newline.
+        :param codes: The code of every char of the words.
+        :param base: The base the contexts are packed in.
+        :param order: The length of the context of the n-grams.
+        :return: The n-grams of the words.
+        """
+        points = np.array(sorted(map(ord, codes)), dtype=np.uint32)
+        values = np.array(
+            [codes[chr(point)] for point in points.tolist()], dtype=np.int64
+        )
+        chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        digits = values[np.searchsorted(points, chars)]
+        windows = digits.copy()
+        for shift in range(1, order + 1):
+            windows[shift:] += digits[:-shift] * base ** shift
+        lengths = np.fromiter(
+            (len(word) + 1 for word in words), dtype=np.int64,
+            count=len(words),
+        )
+        starts = np.cumsum(lengths) - lengths
+        positions = np.arange(len(windows)) - np.repeat(starts, lengths)
+        keys, counts = np.unique(
+            windows[positions >= order], return_counts=True
+        )
+        heads = [
+            windows[starts[lengths > position] + position]
+            for position in range(order)
+        ]
+        return cls(keys, counts, heads, order, base)
+
+    def lower(self) -> Ngrams:
+        """
+        Return the n-grams of the next lower order.
+
+        Every n-gram is cut down to its last chars. Only the n-grams
+        ending right at the context length of the lower order have no
+        longer counterpart, and are taken from the heads.
+
+        :return: The n-grams with one char less of context.
+        """
+        order = self.order - 1
+        modulus = self.base ** (order + 1)
+        heads = self.heads[order]
+        if isinstance(self.keys, list):
+            pairs = Counter()
+            for key, count in zip(self.keys, self.counts):
+                pairs[key % modulus] += count
+            pairs.update(head % modulus for head in heads)
+            keys = sorted(pairs)
+            counts = [pairs[key] for key in keys]
+        else:
+            keys, inverse = np.unique(
+                np.concatenate((self.keys % modulus, heads % modulus)),
+                return_inverse=True,
+            )
+            weights = np.concatenate((self.counts, np.ones(len(heads))))
+            counts = np.bincount(inverse, weights).astype(np.int64)
+        return Ngrams(keys, counts, self.heads[:order], order, self.base)
+
+    def rows(self) -> Iterator[tuple[int, array]]:
+        """
+        Group the n-grams by context.
+
+        :return: Iterator of tuples of the code of every context and its
+            row of alternating char codes and counts, sorted by context
+            and char code.
+        """
+        base = self.base
+        if isinstance(self.keys, list):
+            last, row = None, array("I")
+            for key, count in zip(self.keys, self.counts):
+                code, char = divmod(key, base)
+                if code != last:
+                    if row:
+                        yield last, row
+                    last, row = code, array("I")
+                row.extend((char, count))
+            if row:
+                yield last, row
+            return
+        contexts = self.keys // base
+        pairs = np.empty(2 * len(self.keys), dtype=np.uint32)
+        pairs[::2] = self.keys % base
+        pairs[1::2] = self.counts
+        flat = array("I", pairs.tobytes())
+        starts = np.flatnonzero(np.diff(contexts, prepend=-1))
+        ends = np.append(starts[1:], len(self.keys))
+        for code, start, end in zip(
+            contexts[starts].tolist(), (2 * starts).tolist(),
+            (2 * ends).tolist(),
+        ):
+            yield code, flat[start:end]
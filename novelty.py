@@ -0,0 +1,219 @@
+"""
+Indexes of the training words, to reject generated names that exist.
+
+Two kinds of index are available: an exact set of all words, and a
+Bloom filter, which needs only a few bits per word. A Bloom filter can
+report a new word as known with a small probability, which only causes
+a needless resampling, but it never reports a known word as new.
+
+Saved models store either index as flat arrays: the set as the sorted
+table of the UTF-8 encoded words, which loaded models search in place
+as a ``PackedWords``, and the filter as its bits.
+"""
+
+import bisect
+import hashlib
+import math
+from array import array
+from collections.abc import Iterator, Set
+from typing import Any
+
+from serialization import CountBuffer, pack_strings
+
+
+DEFAULT_CAPACITY = 2 ** 20
+DEFAULT_ERROR_RATE = 0.001
+
+
+class BloomFilter:
+    """
+    Probabilistic set of strings, storing a fixed number of bits.
+
+    Every string sets ``n_hashes`` bits, whose positions are derived
+    from a single BLAKE2 digest by double hashing.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE,
+    ) -> None:
+        """
+        :param capacity: The number of strings up to which the rate of
+            false positives does not exceed ``error_rate``.
+        :param error_rate: The maximum rate of false positives.
+        """
+        n_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.n_bits = max(8, n_bits)
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(item)
+        )
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the bits of a loaded filter are a read-only view of the file
+        return {**self.__dict__, "bits": bytearray(self.bits)}
+
+    def add(self, item: str) -> None:
+        """
+        Add a string to the filter.
+
+        :param item: The string to add.
+        :return: None.
+        """
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def update(self, other: "BloomFilter") -> None:
+        """
+        Add all strings of another filter of the same size.
+
+        :param other: The filter to add.
+        :raises ValueError: If the filters differ in size.
+        :return: None.
+        """
+        if (other.n_bits, other.n_hashes) != (self.n_bits, self.n_hashes):
+            raise ValueError("Cannot merge Bloom filters of different sizes")
+        merged = int.from_bytes(self.bits, "little") | int.from_bytes(
+            other.bits, "little"
+        )
+        self.bits = bytearray(merged.to_bytes(len(self.bits), "little"))
+
+    def _positions(self, item: str) -> list[int]:
+        """
+        Return the positions of the bits of a string.
+
+        :param item: The string.
+        :return: The list of bit positions.
+        """
+        digest = hashlib.blake2b(item.encode("utf8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [
+            (first + i * second) % self.n_bits for i in range(self.n_hashes)
+        ]
+
+
+class PackedWords(Set[str]):
+    """
+    Read-only set of strings, searched in a sorted table of their bytes.
+
+    The strings are stored as their concatenated UTF-8 encodings, sorted
+    and with the offset of every string, such as the known words in a
+    saved model. Look-ups bisect the table without decoding it.
+    """
+
+    def __init__(self, offsets: CountBuffer, data: CountBuffer) -> None:
+        """
+        :param offsets: Buffer of the start of every encoded string in
+            ``data``, followed by the total length of ``data``.
+        :param data: Buffer of the concatenated encodings, sorted.
+        """
+        self.offsets = memoryview(offsets)
+        self.data = memoryview(data)
+
+    def __contains__(self, item: Any) -> bool:
+        if not isinstance(item, str):
+            return False
+        key = item.encode("utf8")
+        index = bisect.bisect_left(range(len(self)), key, key=self._encoded)
+        return index < len(self) and self._encoded(index) == key
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self._encoded(index).decode("utf8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __reduce__(self) -> tuple[type, tuple[array, bytes]]:
+        return PackedWords, (array("Q", self.offsets), bytes(self.data))
+
+    def _encoded(self, index: int) -> bytes:
+        """
+        Return the encoding of a string of the table.
+
+        :param index: The index of the string.
+        :return: The UTF-8 encoding of the string.
+        """
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]])
+
+
+type IndexType = set[str] | PackedWords | BloomFilter
+
+INDEXES = {
+    "set": set,
+    "bloom": BloomFilter,
+}
+
+
+def thaw(index: IndexType) -> IndexType:
+    """
+    Return a version of an index that words can be added to.
+
+    :param index: The index of known words, possibly loaded from a
+        saved model, whose tables are read-only.
+    :return: The index itself if it is writable, otherwise a writable
+        copy.
+    """
+    if isinstance(index, PackedWords):
+        return set(index)
+    if isinstance(index, BloomFilter) and isinstance(index.bits, memoryview):
+        index.bits = bytearray(index.bits)
+    return index
+
+
+def index_to_arrays(
+    index: IndexType,
+) -> tuple[dict[str, Any], dict[str, array]]:
+    """
+    Convert an index into its parameters and its arrays, for saving.
+
+    :param index: The index of known words.
+    :return: Tuple of the JSON serializable dictionary of the kind and
+        parameters of the index and the dictionary of its arrays by
+        name, as read by ``index_from_arrays``.
+    """
+    if isinstance(index, BloomFilter):
+        parameters = {
+            "kind": "bloom",
+            "n_bits": index.n_bits,
+            "n_hashes": index.n_hashes,
+        }
+        return parameters, {"known_bits": array("B", index.bits)}
+    # code point order of strings is the byte order of their encodings
+    offsets, data = pack_strings(sorted(index))
+    return {"kind": "set"}, {
+        "known_word_offsets": offsets, "known_words": data
+    }
+
+
+def index_from_arrays(
+    parameters: dict[str, Any], arrays: dict[str, CountBuffer]
+) -> IndexType:
+    """
+    Restore an index from its parameters and arrays, without copying.
+
+    :param parameters: The dictionary, as created by ``index_to_arrays``.
+    :param arrays: The arrays of the index by name. Other arrays are
+        ignored.
+    :raises KeyError: If the kind of index is unknown.
+    :return: The index of known words, read-only until thawed with
+        ``thaw``.
+    """
+    if parameters["kind"] == "set":
+        return PackedWords(
+            arrays["known_word_offsets"], arrays["known_words"]
+        )
+    if parameters["kind"] == "bloom":
+        index = BloomFilter()
+        index.n_bits = parameters["n_bits"]
+        index.n_hashes = parameters["n_hashes"]
+        index.bits = arrays["known_bits"]
+        return index
+    raise KeyError(f"Unknown novelty index: {parameters['kind']}")
+
@@ -0,0 +1,236 @@
+"""
+Pruning and quantization of the counts of a model to cap its memory.
+
+High-order chains are dominated by contexts that were observed only
+once or twice. Pruning removes rare contexts, whose look-ups then
+back off to the next lower order, and quantization
+stores the char codes and counts in fewer bits. The size of a model is
+the size of its packed counts, which is what a saved model file and a
+loaded model hold.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+if TYPE_CHECKING:
+    from markov_model import MarkovChain, MarkovModel
+
+
+# number and maximum length of the names generated to measure the
+# perplexity, if no words are given
+SAMPLE_SIZE = 1000
+SAMPLE_MAX_LENGTH = 20
+# highest minimum count tried to meet a memory budget, before capping
+# the number of contexts instead
+MAX_AUTO_MIN_COUNT = 16
+
+
+class Measurement(NamedTuple):
+    """
+    Size and fit of a model, before or after pruning.
+    """
+
+    bytes: int
+    contexts: int
+    log_probabilities: list[float]
+
+
+def packed_size(model: MarkovModel) -> int:
+    """
+    Return the size of the packed counts of all chains of a model.
+
+    :param model: The model to measure.
+    :return: The size in bytes.
+    """
+    return sum(
+        sum(memoryview(buffer).nbytes for buffer in packed)
+        for packed in (chain.pack() for chain in model.model.values())
+    )
+
+
+def measure(model: MarkovModel, words: list[str]) -> Measurement:
+    """
+    Measure the size of a model and how well it fits the words.
+
+    :param model: The model to measure.
+    :param words: The words to score.
+    :return: The measurement.
+    """
+    return Measurement(
+        packed_size(model),
+        sum(len(chain.counts) for chain in model.model.values()),
+        model.score_batch(words)[0],
+    )
+
+
+def plan(
+    model: MarkovModel,
+    memory_budget: int,
+    min_count: int = 1,
+    max_contexts: int | None = None,
+    bits: int = 32,
+) -> tuple[int, int | None, int]:
+    """
+    Choose the pruning and quantization that fit a memory budget.
+
+    The given settings are the mildest ones considered. The counts are
+    quantized to fewer bits first, then contexts below increasing
+    minimum counts are pruned, up to ``MAX_AUTO_MIN_COUNT``, and finally
+    the number of contexts per order is capped. The lowest order is
+    never pruned, so every context can still back off to it.
+
+    :param model: The trained model to prune.
+    :param memory_budget: The maximum size of the packed counts in bytes.
+    :param min_count: The minimum total count of a context to keep.
+    :param max_contexts: The maximum number of contexts per order.
+    :param bits: The maximum number of bits per char code and count.
+    :raises ValueError: If even the most aggressive pruning exceeds the
+        budget.
+    :return: Tuple of the minimum count, the maximum number of contexts
+        per order and the number of bits to use.
+    """
+    alphabet_size = len(model.model[model.order].alphabet)
+    candidates = [
+        b for b in (32, 16, 8) if b <= bits and alphabet_size <= 2 ** b
+    ]
+    rows = _cumulative_lengths(model, min_count)
+    for bits in candidates:
+        if _estimate_size(rows, max_contexts, bits) <= memory_budget:
+            return min_count, max_contexts, bits
+    while min_count < MAX_AUTO_MIN_COUNT:
+        min_count *= 2
+        rows = _cumulative_lengths(model, min_count)
+        if _estimate_size(rows, max_contexts, bits) <= memory_budget:
+            return min_count, max_contexts, bits
+    # the size grows with the cap, so bisect for the largest cap
+    low, high = 0, max(len(chain.counts) for chain in model.model.values())
+    if max_contexts is not None:
+        high = min(high, max_contexts)
+    if _estimate_size(rows, low, bits) > memory_budget:
+        raise ValueError(
+            f"Model does not fit in a memory budget of {memory_budget} bytes"
+        )
+    while low < high:
+        middle = (low + high + 1) // 2
+        if _estimate_size(rows, middle, bits) <= memory_budget:
+            low = middle
+        else:
+            high = middle - 1
+    return min_count, low, bits
+
+
+def report(
+    before: Measurement,
+    after: Measurement,
+    words: list[str],
+    settings: tuple[int, int | None, int],
+) -> dict[str, Any]:
+    """
+    Compare the measurements of a model before and after pruning.
+
+    The perplexity per char is computed over all words that the pruned
+    model can still generate, as backing off can make words impossible
+    when the lower order never saw one of their chars after a context.
+
+    :param before: The measurement before pruning.
+    :param after: The measurement after pruning.
+    :param words: The scored words.
+    :param settings: Tuple of the minimum count, the maximum number of
+        contexts per order and the number of bits that were applied.
+    :return: Dictionary of the settings, the sizes in bytes and numbers
+        of contexts, the perplexities before and after pruning, and the
+        share of the words that became impossible.
+    """
+    pairs = list(zip(before.log_probabilities, after.log_probabilities))
+    possible = [
+        i for i, (old, new) in enumerate(pairs)
+        if old > -math.inf and new > -math.inf
+    ]
+    lost = sum(old > -math.inf and new == -math.inf for old, new in pairs)
+    n_chars = sum(len(words[i]) + 1 for i in possible)
+    perplexities = [
+        math.exp(-sum(scores[i] for i in possible) / n_chars)
+        if n_chars else math.nan
+        for scores in (before.log_probabilities, after.log_probabilities)
+    ]
+    min_count, max_contexts, bits = settings
+    return {
+        "min_count": min_count,
+        "max_contexts": max_contexts,
+        "bits": bits,
+        "bytes_before": before.bytes,
+        "bytes_after": after.bytes,
+        "contexts_before": before.contexts,
+        "contexts_after": after.contexts,
+        "perplexity_before": perplexities[0],
+        "perplexity_after": perplexities[1],
+        "impossible": lost / len(words) if words else 0.0,
+    }
+
+
+def _estimate_size(
+    rows: dict[int, tuple[bool, list[int]]],
+    max_contexts: int | None,
+    bits: int,
+) -> int:
+    """
+    Return the size the packed counts of a model would have after pruning.
+
+    :param rows: The rows kept by pruning, as returned by
+        ``_cumulative_lengths``.
+    :param max_contexts: The maximum number of contexts per order.
+    :param bits: The number of bits per char code and count.
+    :return: The size in bytes.
+    """
+    size = 0
+    for protected, cumulative in rows.values():
+        n_contexts = len(cumulative) - 1
+        if not protected and max_contexts is not None:
+            n_contexts = min(n_contexts, max_contexts)
+        # context codes and row offsets of 8 bytes each, and the rows
+        size += 16 * n_contexts + 8 + bits // 8 * 2 * cumulative[n_contexts]
+    return size
+
+
+def _cumulative_lengths(
+    model: MarkovModel, min_count: int
+) -> dict[int, tuple[bool, list[int]]]:
+    """
+    Return the number of transitions pruning keeps in every chain.
+
+    :param model: The trained model to prune.
+    :param min_count: The minimum total count of a context to keep.
+    :return: Dictionary mapping every order to a tuple of whether its
+        chain is protected from pruning, as the lowest order is, and the
+        cumulative numbers of transitions of all kept contexts, from
+        the most to the least frequent context, as ranked by
+        ``MarkovChain.prune``.
+    """
+    rows = dict()
+    for order, chain in model.model.items():
+        protected = order == model.max_backoff
+        lengths = _ranked_lengths(chain, 1 if protected else min_count)
+        rows[order] = protected, list(itertools.accumulate(lengths, initial=0))
+    return rows
+
+
+def _ranked_lengths(chain: MarkovChain, min_count: int) -> list[int]:
+    """
+    Return the number of transitions of the contexts pruning keeps.
+
+    :param chain: The chain to prune.
+    :param min_count: The minimum total count of a context to keep.
+    :return: List of the numbers of transitions of all contexts with at
+        least the minimum count, from the most to the least frequent
+        context, as ranked by ``MarkovChain.prune``.
+    """
+    ranked = []
+    for code, row in chain.counts.items():
+        total = sum(row[1::2])
+        if total >= min_count:
+            ranked.append((-total, code, len(row) // 2))
+    ranked.sort()
+    return [length for _, _, length in ranked]
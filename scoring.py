@@ -0,0 +1,215 @@
+"""
+Scoring of names by their log-likelihood under a model.
+
+The log-probability of a name is the log of the share of its start
+point among all start points, plus the log-probabilities of all
+following chars, including the end of the word, as resolved by the
+back-off of the model. Its perplexity is the inverse geometric mean of
+the probabilities of all its chars and its end, so names of different
+lengths can be compared.
+
+NumPy is an optional dependency: if it is installed, many names are
+scored together by looking up the contexts of all their chars in the
+flattened tables of batch generation, otherwise a pure Python fallback
+scores the names one after the other.
+"""
+
+from __future__ import annotations
+
+import math
+from collections import Counter
+from typing import TYPE_CHECKING
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+from batch import MAX_NUMPY_CODE, OrderTable
+
+if TYPE_CHECKING:
+    from markov_model import MarkovModel
+
+
+# number of names scored together, bounding the memory of the arrays
+CHUNK_SIZE = 2 ** 16
+
+
+class BatchScorer:
+    """
+    Scorer of many names at once under the probabilities of a model.
+
+    The names are scored case-insensitively. A name starts like the
+    most frequent start point that matches it ignoring case, because
+    the start points keep the case of the training words, which
+    decides how their contexts back off.
+    """
+
+    def __init__(self, model: MarkovModel) -> None:
+        """
+        :param model: The trained model to score names with.
+        """
+        top_chain = model.model[model.order]
+        self.model = model
+        self.order = model.order
+        self.base = top_chain.base
+        self.vectorized = (
+            np is not None and self.base ** self.order < MAX_NUMPY_CODE
+        )
+        counts = Counter(dict(model.valid_startpoints.items()))
+        total = sum(counts.values())
+        self.starts: dict[str, tuple[str, float]] = dict()
+        shares = Counter()
+        for start, count in counts.most_common():
+            shares[start.lower()] += count / total
+            self.starts.setdefault(start.lower(), (start, 0.0))
+        for key, (start, _) in self.starts.items():
+            self.starts[key] = start, math.log(shares[key])
+        self._options: dict[str, dict[str, float]] = dict()
+        if self.vectorized:
+            # tables of the back-off orders, from highest to lowest order
+            self.tables = [
+                OrderTable(model.model[order], vectorized=True)
+                for order in range(model.order, model.max_backoff - 1, -1)
+            ]
+            # sorted code points of the supported chars, and their codes
+            points = np.array(
+                [ord(char) for char in top_chain.alphabet[1:]], dtype=np.int64
+            )
+            ranks = np.argsort(points, kind="stable")
+            self.support_points = points[ranks]
+            self.support_codes = ranks + 1
+
+    def score(self, names: list[str]) -> tuple[list[float], list[float]]:
+        """
+        Score names by their log-probabilities and perplexities.
+
+        :param names: The names to score.
+        :return: Tuple of the list of the natural log-probabilities of
+            the names and the list of their perplexities per char. Names
+            the model cannot generate have a log-probability of minus
+            infinity and an infinite perplexity.
+        """
+        log_probabilities = []
+        perplexities = []
+        for first in range(0, len(names), CHUNK_SIZE):
+            chunk = names[first:first + CHUNK_SIZE]
+            words, start_scores = self._prepare(chunk)
+            if self.vectorized:
+                scores = self._score_vectorized(words, start_scores)
+            else:
+                scores = [
+                    self._score_single(word, start_score)
+                    for word, start_score in zip(words, start_scores)
+                ]
+            for word, score in zip(words, scores):
+                log_probabilities.append(float(score))
+                perplexities.append(math.exp(-score / (len(word) + 1)))
+        return log_probabilities, perplexities
+
+    def _prepare(self, names: list[str]) -> tuple[list[str], list[float]]:
+        """
+        Lowercase names and find the start points they begin with.
+
+        :param names: The names to prepare.
+        :return: Tuple of the list of names, lowercased except for their
+            start points, and the list of the log-probabilities of their
+            start points.
+        """
+        words = []
+        start_scores = []
+        for name in names:
+            word = name.lower()
+            start, start_score = self.starts.get(
+                word[:self.order], (None, -math.inf)
+            )
+            if start is not None:
+                word = start + word[self.order:]
+            words.append(word)
+            start_scores.append(start_score)
+        return words, start_scores
+
+    def _score_single(self, word: str, start_score: float) -> float:
+        """
+        Return the log-probability of a single name.
+
+        :param word: The name, as prepared by ``_prepare``.
+        :param start_score: The log-probability of its start point.
+        :return: The log-probability of the name.
+        """
+        score = start_score
+        for i in range(self.order, len(word) + 1):
+            if score == -math.inf:
+                break
+            context = word[i - self.order:i]
+            options = self._options.get(context)
+            if options is None:
+                options = self.model.probabilities(context)
+                self._options[context] = options
+            probability = options.get(word[i] if i < len(word) else "\n", 0)
+            score = score + math.log(probability) if probability else -math.inf
+        return score
+
+    def _score_vectorized(
+        self, words: list[str], start_scores: list[float]
+    ) -> np.ndarray:
+        """
+        Vectorized version of ``_score_single`` for a list of names.
+
+        :param words: The names, as prepared by ``_prepare``.
+        :param start_scores: The log-probabilities of their start points.
+        :return: Array of the log-probabilities of the names.
+        """
+        lengths = np.fromiter(
+            map(len, words), dtype=np.int64, count=len(words)
+        )
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        # codes of all chars of all names, -1 for unknown chars, plus a
+        # sentinel for the end of the last name
+        points = np.frombuffer(
+            "".join(words).encode("utf-32-le"), dtype=np.uint32
+        ).astype(np.int64)
+        pos = np.searchsorted(self.support_points, points)
+        pos = np.minimum(pos, max(len(self.support_points) - 1, 0))
+        known = (
+            self.support_points[pos] == points
+            if len(self.support_points) else np.zeros(len(points), bool)
+        )
+        digits = np.append(
+            np.where(known, self.support_codes[pos], -1), -1
+        )
+        # one prediction per char after the start point and one for the
+        # end of every name
+        counts = np.maximum(lengths - self.order + 1, 0)
+        names = np.repeat(np.arange(len(words)), counts)
+        firsts = np.repeat(np.cumsum(counts) - counts, counts)
+        indices = np.arange(len(names)) - firsts + self.order
+        positions = offsets[names] + indices
+        targets = np.where(indices == lengths[names], 0, digits[positions])
+        # context codes of every order, valid if all chars are known
+        codes = [np.zeros(len(names), dtype=np.int64)]
+        valid = [np.ones(len(names), dtype=bool)]
+        for k in range(1, self.order + 1):
+            context_digits = digits[positions - k]
+            codes.append(codes[-1] + context_digits * self.base ** (k - 1))
+            valid.append(valid[-1] & (context_digits > 0))
+        probabilities = np.zeros(len(names))
+        resolved = np.zeros(len(names), dtype=bool)
+        pending = np.arange(len(names))
+        for table in self.tables:
+            if len(pending) == 0:
+                break
+            candidates = pending[valid[table.order][pending]]
+            found, rows = table.lookup_array(codes[table.order][candidates])
+            hits = candidates[found]
+            probabilities[hits] = table.probability_array(rows, targets[hits])
+            resolved[hits] = True
+            pending = pending[~resolved[pending]]
+        # contexts no order resolves can only end the name
+        probabilities[pending] = targets[pending] == 0
+        probabilities[targets < 0] = 0
+        with np.errstate(divide="ignore"):
+            logs = np.log(probabilities)
+        return np.asarray(start_scores) + np.bincount(
+            names, weights=logs, minlength=len(words)
+        )
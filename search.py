@@ -0,0 +1,117 @@
+"""
+Search for the most probable names of a model.
+
+The probability of a name is the probability that the model generates
+it: the share of its start point among all start points, times the
+probabilities of all following chars, including the end of the word,
+as resolved by the back-off of the model. The search is a beam search
+over the log-probabilities of partial names, which keeps only a fixed
+number of the best partial names in every step.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from collections import Counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from markov_model import MarkovModel
+
+
+def top_k(
+    model: MarkovModel, k: int, max_length: int, beam_width: int
+) -> list[tuple[str, float]]:
+    """
+    Find the most probable names of a model by beam search.
+
+    In every step, all partial names of the beam are extended by every
+    possible next char, and only the ``beam_width`` most probable
+    extensions are kept. Names that end are collected in a bounded heap
+    of the ``k`` most probable names. The memory used is therefore
+    proportional to the beam width and ``k``, not to the number of
+    names explored. The search is exact if the beam is wide enough to
+    hold all partial names.
+
+    :param model: The trained model to search.
+    :param k: The number of names to return. Returns no names if it is
+        not positive.
+    :param max_length: The maximum number of characters per name. Names
+        that reach it end there, as in generation.
+    :param beam_width: The number of partial names kept in every step.
+    :return: List of up to ``k`` tuples of the names and their
+        probabilities, from the most to the least probable.
+    """
+    if k <= 0:
+        return []
+    counts = Counter(dict(model.valid_startpoints.items()))
+    total = sum(counts.values())
+    beam = [
+        (math.log(count / total), start) for start, count in counts.items()
+    ]
+    beam = heapq.nlargest(beam_width, beam)
+    # min-heap of the best finished names, and their log-probabilities
+    best: list[tuple[float, str]] = []
+    finished: dict[str, float] = dict()
+    probabilities: dict[str, dict[str, float]] = dict()
+    while beam:
+        extensions = []
+        for log_p, word in beam:
+            if len(word) >= max_length:
+                _finish(best, finished, k, log_p, word.title())
+                continue
+            context = word[-model.order:]
+            options = probabilities.get(context)
+            if options is None:
+                options = probabilities[context] = model.probabilities(
+                    context
+                )
+            for char, probability in options.items():
+                score = log_p + math.log(probability)
+                if char == "\n":
+                    _finish(best, finished, k, score, word.title())
+                elif len(best) < k or score > best[0][0]:
+                    # others cannot beat the worst of the best names
+                    extensions.append((score, word + char))
+        beam = heapq.nlargest(beam_width, extensions)
+    return [
+        (word, math.exp(log_p))
+        for log_p, word in sorted(best, key=lambda x: (-x[0], x[1]))
+    ]
+
+
+def _finish(
+    best: list[tuple[float, str]],
+    finished: dict[str, float],
+    k: int,
+    log_p: float,
+    word: str,
+) -> None:
+    """
+    Offer a finished name to the heap of the best names.
+
+    A name that is already in the heap, reached from another start
+    point whose case differs, is generated either way, so the
+    probabilities of both are added up.
+
+    :param best: The min-heap of the best names.
+    :param finished: The log-probabilities of the names in the heap.
+    :param k: The maximum size of the heap.
+    :param log_p: The log-probability of the name.
+    :param word: The name.
+    :return: None.
+    """
+    if word in finished:
+        known = finished[word]
+        best.remove((known, word))
+        heapq.heapify(best)
+        high, low = max(known, log_p), min(known, log_p)
+        log_p = high + math.log1p(math.exp(low - high))
+    elif len(best) == k:
+        if log_p <= best[0][0]:
+            return
+        _, dropped = heapq.heappop(best)
+        del finished[dropped]
+    heapq.heappush(best, (log_p, word))
+    finished[word] = log_p
@@ -0,0 +1,381 @@
+"""
+Compact binary format for trained Markov models.
+
+The format is designed to be memory-mapped: all count arrays are stored
+aligned and in the same layout that the ``MarkovChain`` uses in memory,
+so loading a model only parses a small header and wraps the arrays of
+the file in memoryviews, without copying them. Processes loading the
+same file therefore share its pages.
+
+Layout (little-endian, every array aligned to 8 bytes):
+
+- header: magic ``b"MCBN"``, format version (u16), padding (u16),
+  length of the metadata (u32), number of chains (u32)
+- metadata: UTF-8 encoded JSON with all scalar model parameters, the
+  alphabet and the name, typecode and length of every named array
+- named arrays: the start points and the index of the known words,
+  each as a flat array of the listed typecode
+- per chain: order (i32), number of contexts (u32), number of count
+  entries (u64), typecode of the count entries (1 byte), size of the
+  context codes in bytes (u8), padding (u16), followed by the arrays of
+  the sorted context codes (i64 if their size is 8, otherwise integers
+  of that size, see ``WideKeys``), the offsets of the rows into the
+  count entries (u64, one more than contexts) and the count entries
+  (alternating char codes and counts, as u8, u16 or u32 according to
+  their typecode)
+"""
+
+import bisect
+import itertools
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from pathlib import Path
+from typing import Any, BinaryIO
+
+
+MAGIC = b"MCBN"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHxxII")
+_CHAIN_HEADER = struct.Struct("<iIQcBxx")
+# typecodes of the count entries, by their size in bytes
+PAIR_TYPECODES = {1: "B", 2: "H", 4: "I"}
+
+# largest context code that fits in the i64 array of the context codes
+MAX_KEY = 2 ** 63 - 1
+
+type CountBuffer = array | memoryview
+
+
+class WideKeys(Sequence[int]):
+    """
+    Sorted context codes too large for 64-bit integers.
+
+    The contexts of a chain are packed in base ``base`` with ``order``
+    digits, which exceeds 64 bits for long contexts over large
+    alphabets. Such codes are stored as little-endian integers of
+    ``width`` bytes in one flat buffer, and are decoded on access.
+    Look-ups are slower, but any order can be packed. The width is the
+    smallest multiple of 8 that holds the largest code and a sign bit,
+    like the i64 codes, so wide codes are never 8 bytes wide.
+    """
+
+    def __init__(self, data: CountBuffer | bytes, width: int) -> None:
+        """
+        :param data: Buffer of the concatenated codes.
+        :param width: The number of bytes of every code.
+        """
+        self.data = memoryview(data).cast("B")
+        self.width = width
+
+    @classmethod
+    def from_codes(cls, codes: list[int]) -> "WideKeys":
+        """
+        Pack sorted context codes into a flat buffer.
+
+        :param codes: The sorted, non-negative codes.
+        :return: The packed codes, as wide as the largest one requires.
+        """
+        width = (codes[-1].bit_length() // 64 + 1) * 8
+        return cls(
+            b"".join(code.to_bytes(width, "little") for code in codes), width
+        )
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Key index out of range")
+        start = index * self.width
+        return int.from_bytes(self.data[start:start + self.width], "little")
+
+    def __len__(self) -> int:
+        return len(self.data) // self.width
+
+    def __buffer__(self, flags: int) -> memoryview:
+        return self.data
+
+    def __reduce__(self) -> tuple[type, tuple[bytes, int]]:
+        return WideKeys, (bytes(self.data), self.width)
+
+
+type KeyBuffer = CountBuffer | WideKeys
+type PackedChainType = tuple[int, KeyBuffer, CountBuffer, CountBuffer]
+
+
+class PackedCounts(Mapping[int, memoryview]):
+    """
+    Read-only mapping of context codes to the count rows of a chain.
+
+    The counts are held in three flat buffers: the sorted codes of all
+    contexts, the offsets of their rows and the concatenated rows of
+    alternating char codes and counts. Look-ups bisect the codes and
+    return the row as a memoryview into the buffer, without copying.
+    """
+
+    def __init__(
+        self, keys: KeyBuffer, offsets: CountBuffer, pairs: CountBuffer
+    ) -> None:
+        """
+        :param keys: Sorted buffer of the packed codes of all contexts,
+            as returned by ``pack_keys``.
+        :param offsets: Buffer of the start of every row in ``pairs``,
+            followed by the total length of ``pairs``.
+        :param pairs: Buffer of the rows of all contexts, in the order
+            of their codes.
+        """
+        self.keys = keys if isinstance(keys, WideKeys) else memoryview(keys)
+        self.offsets = memoryview(offsets)
+        self.pairs = memoryview(pairs)
+
+    def __getitem__(self, code: int) -> memoryview:
+        if not isinstance(code, int):
+            raise KeyError(code)
+        index = bisect.bisect_left(self.keys, code)
+        if index == len(self.keys) or self.keys[index] != code:
+            raise KeyError(code)
+        return self.pairs[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __reduce__(self) -> tuple[type, tuple[KeyBuffer, array, array]]:
+        # memoryviews cannot be pickled, so the buffers are copied
+        keys = self.keys
+        return PackedCounts, (
+            keys if isinstance(keys, WideKeys) else _as_array(keys, "q"),
+            _as_array(self.offsets, "Q"),
+            _as_array(self.pairs, PAIR_TYPECODES[self.pairs.itemsize]),
+        )
+
+
+def pack_keys(codes: list[int]) -> KeyBuffer:
+    """
+    Pack sorted context codes into a buffer.
+
+    :param codes: The sorted, non-negative codes of all contexts.
+    :return: Array of the codes as i64, or ``WideKeys`` if the largest
+        code does not fit in it.
+    """
+    if not codes or codes[-1] <= MAX_KEY:
+        return array("q", codes)
+    return WideKeys.from_codes(codes)
+
+
+def write_model(
+    file: BinaryIO,
+    metadata: dict[str, Any],
+    chains: list[PackedChainType],
+    arrays: dict[str, array] | None = None,
+) -> None:
+    """
+    Write a model in the binary format to an open file.
+
+    :param file: File opened for writing in binary mode.
+    :param metadata: JSON serializable dictionary of model parameters.
+    :param chains: List of tuples of the order, the sorted context codes,
+        the row offsets and the rows of every chain.
+    :param arrays: Dictionary of further arrays by name, such as the
+        start points. Defaults to None, which writes none.
+    :return: None.
+    """
+    arrays = dict() if arrays is None else arrays
+    metadata = {
+        **metadata,
+        "arrays": [
+            [name, data.typecode, len(data)] for name, data in arrays.items()
+        ],
+    }
+    encoded = json.dumps(metadata).encode("utf8")
+    file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded), len(chains)))
+    file.write(encoded)
+    pad(file, _HEADER.size + len(encoded))
+    for data in arrays.values():
+        _write_array(file, data)
+    for order, keys, offsets, pairs in chains:
+        pairs_typecode = PAIR_TYPECODES[memoryview(pairs).itemsize]
+        key_size = keys.width if isinstance(keys, WideKeys) else 8
+        file.write(_CHAIN_HEADER.pack(
+            order,
+            len(keys),
+            len(pairs),
+            pairs_typecode.encode("ascii"),
+            key_size,
+        ))
+        pad(file, _CHAIN_HEADER.size)
+        if isinstance(keys, WideKeys):
+            file.write(keys.data)  # little-endian already
+            pad(file, len(keys.data))
+        else:
+            _write_array(file, _as_array(keys, "q"))
+        _write_array(file, _as_array(offsets, "Q"))
+        _write_array(file, _as_array(pairs, pairs_typecode))
+
+
+def read_model(
+    buffer: Any,
+) -> tuple[dict[str, Any], list[PackedChainType], dict[str, memoryview]]:
+    """
+    Read a model in the binary format from a buffer, without copying.
+
+    :param buffer: Any object supporting the buffer protocol, such as
+        a memory-mapped file or a shared memory block.
+    :raises ValueError: If the buffer does not hold a model of a
+        supported format version.
+    :return: Tuple of the metadata, the list of tuples of the order,
+        the sorted context codes, the row offsets and the rows of every
+        chain, and the dictionary of the named arrays. All buffers are
+        views into ``buffer``.
+    """
+    view = memoryview(buffer)
+    if len(view) < _HEADER.size:
+        raise ValueError("Buffer is too small to hold a model")
+    magic, version, metadata_size, n_chains = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Buffer does not hold a McBarnag model")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model format version: {version}")
+    pos = _HEADER.size
+    metadata = json.loads(bytes(view[pos:pos + metadata_size]))
+    pos = align(pos + metadata_size)
+    arrays = dict()
+    for name, typecode, length in metadata.pop("arrays", []):
+        arrays[name], pos = _read_array(view, pos, typecode, length)
+    chains = []
+    for _ in range(n_chains):
+        order, n_keys, n_pairs, pairs_typecode, key_size = (
+            _CHAIN_HEADER.unpack_from(view, pos)
+        )
+        pos = align(pos + _CHAIN_HEADER.size)
+        if key_size == 8:
+            keys, pos = _read_array(view, pos, "q", n_keys)
+        else:
+            size = n_keys * key_size
+            keys = WideKeys(view[pos:pos + size], key_size)
+            pos = align(pos + size)
+        offsets, pos = _read_array(view, pos, "Q", n_keys + 1)
+        pairs, pos = _read_array(
+            view, pos, pairs_typecode.decode("ascii"), n_pairs
+        )
+        chains.append((order, keys, offsets, pairs))
+    return metadata, chains, arrays
+
+
+def map_file(filepath: str | Path) -> mmap.mmap:
+    """
+    Memory-map the given file read-only.
+
+    :param filepath: Path to the file to map.
+    :return: The memory map of the whole file.
+    """
+    with open(filepath, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def pack_strings(strings: Iterable[str]) -> tuple[array, array]:
+    """
+    Concatenate the UTF-8 encodings of strings into a flat table.
+
+    :param strings: The strings.
+    :return: Tuple of the offsets of every string into the encodings,
+        followed by the total length, and the concatenated encodings.
+    """
+    offsets = array("Q", [0])
+    data = array("B")
+    for string in strings:
+        data.frombytes(string.encode("utf8"))
+        offsets.append(len(data))
+    return offsets, data
+
+
+def unpack_strings(offsets: CountBuffer, data: CountBuffer) -> list[str]:
+    """
+    Decode all strings of a table created by ``pack_strings``.
+
+    :param offsets: The offsets of the strings into the encodings.
+    :param data: The concatenated encodings.
+    :return: The list of the strings.
+    """
+    encoded = bytes(data)
+    return [
+        encoded[start:end].decode("utf8")
+        for start, end in itertools.pairwise(offsets)
+    ]
+
+
+def _write_array(file: BinaryIO, data: array) -> None:
+    """
+    Write an array in little-endian byte order, followed by padding.
+
+    :param file: The file to write to.
+    :param data: The array to write.
+    :return: None.
+    """
+    if sys.byteorder != "little" and data.itemsize > 1:
+        data = array(data.typecode, data)
+        data.byteswap()
+    file.write(data.tobytes())
+    pad(file, len(data) * data.itemsize)
+
+
+def _read_array(
+    view: memoryview, pos: int, typecode: str, length: int
+) -> tuple[memoryview, int]:
+    """
+    Read an array written by ``_write_array``, without copying.
+
+    :param view: The view of the whole buffer.
+    :param pos: The position of the array in the buffer.
+    :param typecode: The typecode of the array.
+    :param length: The number of items of the array.
+    :return: Tuple of the view of the array, which is a copy only on
+        big-endian machines, and the aligned position after it.
+    """
+    size = length * array(typecode).itemsize
+    data = view[pos:pos + size].cast(typecode)
+    if sys.byteorder != "little":
+        swapped = array(typecode, data)
+        swapped.byteswap()
+        data = memoryview(swapped)
+    return data, align(pos + size)
+
+
+def _as_array(buffer: CountBuffer, typecode: str) -> array:
+    """
+    Return a copy of the buffer as an array of the given type.
+
+    :param buffer: An array or a memoryview of matching item size.
+    :param typecode: The typecode of the array to create.
+    :return: The new array.
+    """
+    data = array(typecode)
+    data.frombytes(memoryview(buffer).cast("B"))
+    return data
+
+
+def align(pos: int) -> int:
+    """
+    Round the position up to the next multiple of 8.
+
+    :param pos: A position in bytes.
+    :return: The aligned position.
+    """
+    return (pos + 7) // 8 * 8
+
+
+def pad(file: BinaryIO, written: int) -> None:
+    """
+    Write zeros to the file to align a block of the given size.
+
+    :param file: The file to write to.
+    :param written: The number of bytes written since the last alignment.
+    :return: None.
+    """
+    file.write(bytes(align(written) - written))
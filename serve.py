@@ -0,0 +1,862 @@
+"""
+Local HTTP service generating names from resident models.
+
+The service keeps every trained model in memory, keyed by its dataset,
+language, order, prior and maximum back-off order, so requests pay
+neither the startup of the interpreter nor the loading and training of
+the model. Concurrent requests for the same model are coalesced into a
+single batch of ``MarkovModel.generate_batch``, and all training and
+generation runs in a thread pool, keeping the event loop responsive.
+
+The service is built on ``asyncio`` and speaks just enough HTTP/1.1 for
+local clients:
+
+- ``GET /generate?dataset=cities&language=DE&n=10`` returns a JSON
+  object with the list of generated ``names``. The optional parameters
+  are ``language``, ``order``, ``prior``, ``backoff``, ``n``,
+  ``max_length`` and ``seed``; seeded requests are reproducible and
+  therefore not coalesced with other requests. Repeating ``dataset``
+  blends the models of all datasets with a ``MixtureModel``, where every
+  dataset may name its language after a colon, as in
+  ``dataset=cities:DE&dataset=greek-mythology&weights=0.7,0.3``. The
+  blended models stay resident, so any blend costs no training. Datasets
+  that ignore the language share one model for all languages, and only
+  the ``MAX_MODELS`` most recently used models stay resident.
+- ``GET /metrics`` returns a JSON object with the number of requests,
+  names and batches, the latency percentiles and the throughput.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import time
+import urllib.parse
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+import cache
+import generate
+import markov_model
+import mixture
+
+
+# maximum number of names per request
+MAX_NAMES = 10000
+# maximum number of chars of a generated name
+MAX_LENGTH = 100
+# maximum order of a model
+MAX_ORDER = 10
+# default number of resident models, the least recently used models are
+# dropped beyond it
+MAX_MODELS = 64
+# maximum size of a request head, in bytes
+MAX_HEAD_SIZE = 2 ** 16
+# number of most recent requests the latency percentiles are taken over
+LATENCY_WINDOW = 10000
+# percentiles of the latency reported by the metrics
+PERCENTILES = (50, 90, 99)
+# datasets whose training data depends on the language, the models of
+# all others are shared by all languages
+LANGUAGE_DATASETS = frozenset({"cities"})
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class ModelKey(NamedTuple):
+    """
+    Training setup of a resident model.
+    """
+
+    dataset: str
+    language: str | None
+    order: int
+    prior: float
+    max_backoff: int
+
+
+class Request(NamedTuple):
+    """
+    Request for names waiting for its batch.
+    """
+
+    n: int
+    max_length: int
+    seed: int | None
+    future: asyncio.Future
+
+
+class Metrics:
+    """
+    Counters and latencies of the requests served.
+    """
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.names = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record_request(
+        self, latency: float, names: int, error: bool = False
+    ) -> None:
+        """
+        Record a served request.
+
+        :param latency: The time taken to serve the request in seconds.
+        :param names: The number of names returned.
+        :param error: Whether the request failed.
+        :return: None.
+        """
+        self.requests += 1
+        self.errors += error
+        self.names += names
+        self.latencies.append(latency)
+
+    def record_batch(self, requests: int) -> None:
+        """
+        Record a batch of generation.
+
+        :param requests: The number of requests served by the batch.
+        :return: None.
+        """
+        self.batches += 1
+        self.batched_requests += requests
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Return the current metrics.
+
+        :return: Dictionary of the counters, the uptime in seconds, the
+            throughput in requests and names per second, the mean number
+            of requests per batch, and the latency percentiles of the
+            most recent requests in milliseconds.
+        """
+        uptime = time.perf_counter() - self.started
+        latencies = sorted(self.latencies)
+        percentiles = {
+            f"p{p}": _percentile(latencies, p) * 1000 if latencies else None
+            for p in PERCENTILES
+        }
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "names": self.names,
+            "batches": self.batches,
+            "uptime": uptime,
+            "requests_per_second": self.requests / uptime,
+            "names_per_second": self.names / uptime,
+            "requests_per_batch": (
+                self.batched_requests / self.batches if self.batches else None
+            ),
+            "latency_ms": percentiles,
+        }
+
+
+class Batcher:
+    """
+    Coalescer of the concurrent requests for names of one model.
+
+    The first waiting request opens a batch, which collects all requests
+    arriving within ``max_delay`` seconds, or until ``max_batch`` names
+    are requested. The unseeded requests of a batch with the same
+    maximum length are generated by a single call of ``generate_batch``
+    and split up. Batches of a model run one after the other, holding
+    the ``lock`` of the batcher, which blends using the model acquire as
+    well, so the model and its generator are never used by two threads
+    at once.
+    """
+
+    def __init__(
+        self,
+        model: markov_model.MarkovModel,
+        executor: ThreadPoolExecutor,
+        metrics: Metrics,
+        max_delay: float = 0.005,
+        max_batch: int = MAX_NAMES,
+    ) -> None:
+        """
+        :param model: The trained model to generate names with.
+        :param executor: The executor to generate the names in.
+        :param metrics: The metrics to record the batches in.
+        :param max_delay: The time to wait for further requests after the
+            first request of a batch, in seconds.
+        :param max_batch: The number of names after which a batch is
+            closed without waiting any longer.
+        """
+        self.model = model
+        self.executor = executor
+        self.metrics = metrics
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        # None marks the end of the requests of a retired batcher
+        self.queue: asyncio.Queue[Request | None] = asyncio.Queue()
+        self.lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def generate(
+        self, n: int, max_length: int, seed: int | None = None
+    ) -> list[str]:
+        """
+        Generate names in the next batch.
+
+        :param n: The number of names to generate.
+        :param max_length: The maximum number of characters per name.
+        :param seed: The seed of ``generate_many``. Defaults to None,
+            which draws the names from the generator of the model.
+        :return: The list of names.
+        """
+        if self._task.done() and not self._task.cancelled():
+            # retired, but still used by a request that got it before
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(Request(n, max_length, seed, future))
+        return await future
+
+    def retire(self) -> None:
+        """
+        Stop batching once the requests already waiting are served.
+
+        :return: None.
+        """
+        self.queue.put_nowait(None)
+
+    def close(self) -> None:
+        """
+        Stop batching. Requests still waiting are cancelled.
+
+        :return: None.
+        """
+        self._task.cancel()
+        while not self.queue.empty():
+            request = self.queue.get_nowait()
+            if request is not None:
+                request.future.cancel()
+
+    async def _run(self) -> None:
+        """
+        Collect and generate batches until cancelled or retired.
+
+        :return: None.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            request = await self.queue.get()
+            if request is None:
+                if self.queue.empty():
+                    return
+                # serve the requests that arrived after the retirement
+                self.queue.put_nowait(None)
+                continue
+            requests = [request]
+            deadline = loop.time() + self.max_delay
+            total = request.n
+            while total < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except TimeoutError:
+                    break
+                if request is None:
+                    self.queue.put_nowait(None)  # retire after this batch
+                    break
+                requests.append(request)
+                total += request.n
+            self.metrics.record_batch(len(requests))
+            try:
+                async with self.lock:
+                    results = await loop.run_in_executor(
+                        self.executor, self._generate, requests
+                    )
+            except Exception as error:  # failed batches fail all requests
+                for request in requests:
+                    if not request.future.done():
+                        request.future.set_exception(error)
+                continue
+            for request, names in zip(requests, results):
+                if not request.future.done():  # the client may be gone
+                    request.future.set_result(names)
+
+    def _generate(self, requests: list[Request]) -> list[list[str]]:
+        """
+        Generate the names of all requests of a batch.
+
+        :param requests: The requests of the batch.
+        :return: The lists of names of the requests, in order.
+        """
+        results: list[list[str]] = [[] for _ in requests]
+        groups: dict[int, list[int]] = dict()
+        for i, request in enumerate(requests):
+            if request.seed is not None:
+                results[i] = self.model.generate_many(
+                    request.n, request.max_length, seed=request.seed
+                )
+            else:
+                groups.setdefault(request.max_length, []).append(i)
+        for max_length, indices in groups.items():
+            total = sum(requests[i].n for i in indices)
+            names = iter(self.model.generate_batch(total, max_length))
+            for i in indices:
+                results[i] = list(itertools.islice(names, requests[i].n))
+        return results
+
+
+class NameServer:
+    """
+    HTTP server generating names from resident, batched models.
+    """
+
+    def __init__(
+        self,
+        trainer: Callable[[ModelKey], markov_model.MarkovModel] | None = None,
+        threads: int | None = None,
+        max_delay: float = 0.005,
+        max_batch: int = MAX_NAMES,
+        max_models: int = MAX_MODELS,
+    ) -> None:
+        """
+        :param trainer: Callable returning the trained model of a key.
+            Called in the thread pool, once per key. Defaults to training
+            on the datasets of ``generate.py``, without a model cache.
+        :param threads: The number of threads of the pool that trains
+            models and generates names. Defaults to the default of
+            ``ThreadPoolExecutor``.
+        :param max_delay: The time a batch waits for further requests,
+            in seconds.
+        :param max_batch: The number of names that closes a batch.
+        :param max_models: The number of resident models. The least
+            recently used models are dropped beyond it, once their
+            waiting requests are served.
+        """
+        self.trainer = trainer or train_model
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.max_models = max_models
+        self.metrics = Metrics()
+        self._batchers: OrderedDict[ModelKey, asyncio.Task[Batcher]] = (
+            OrderedDict()
+        )
+        self._server: asyncio.Server | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8000) -> int:
+        """
+        Start listening for connections.
+
+        :param host: The address to listen on.
+        :param port: The port to listen on, or 0 for any free port.
+        :return: The port the server listens on.
+        """
+        self._server = await asyncio.start_server(
+            self._handle_connection, host, port, limit=MAX_HEAD_SIZE
+        )
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        """
+        Serve connections until cancelled, then close the server.
+
+        :return: None.
+        """
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """
+        Stop the server, the batchers and the thread pool.
+
+        :return: None.
+        """
+        if self._server is not None:
+            self._server.close()
+        for task in self._batchers.values():
+            if task.done() and not task.cancelled() and (
+                task.exception() is None
+            ):
+                task.result().close()
+            else:
+                task.cancel()
+        self._batchers.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def get_batcher(self, key: ModelKey) -> Batcher:
+        """
+        Return the batcher of a model, training the model on first use.
+
+        Concurrent requests for a model that is still training wait for
+        the same training. Failed trainings are not kept, so they are
+        retried by the next request. Training a new model drops the
+        least recently used model if there are more than ``max_models``.
+
+        :param key: The training setup of the model. The language is
+            ignored for datasets not in ``LANGUAGE_DATASETS``.
+        :return: The batcher of the model.
+        """
+        if key.dataset not in LANGUAGE_DATASETS:
+            key = key._replace(language=None)
+        task = self._batchers.get(key)
+        if task is None:
+            task = asyncio.create_task(self._train(key))
+            self._batchers[key] = task
+            while len(self._batchers) > self.max_models:
+                _, evicted = self._batchers.popitem(last=False)
+                evicted.add_done_callback(_retire)
+        else:
+            self._batchers.move_to_end(key)
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            if self._batchers.get(key) is task:
+                del self._batchers[key]
+            raise
+
+    async def generate(
+        self, key: ModelKey, n: int, max_length: int, seed: int | None = None
+    ) -> list[str]:
+        """
+        Generate names with the model of a key.
+
+        :param key: The training setup of the model.
+        :param n: The number of names to generate.
+        :param max_length: The maximum number of characters per name.
+        :param seed: The seed of the names, or None for random names.
+        :raises ValueError: If the training setup, the number of names or
+            the maximum length are out of range.
+        :return: The list of names.
+        """
+        _check_key(key)
+        _check_limits(n, max_length)
+        batcher = await self.get_batcher(key)
+        return await batcher.generate(n, max_length, seed)
+
+    async def blend(
+        self,
+        keys: list[ModelKey],
+        weights: list[float] | None,
+        n: int,
+        max_length: int,
+        seed: int | None = None,
+    ) -> list[str]:
+        """
+        Generate names with a weighted blend of the models of some keys.
+
+        The models are the resident models of the keys, so only models
+        that were never used before are trained. Blends are not batched,
+        as every request may weight the models differently, but they
+        hold the locks of the batchers of all their models while they
+        generate, so they never use a model along with its batches.
+
+        :param keys: The training setups of the models.
+        :param weights: The weights of the models, or None for equal
+            weights.
+        :param n: The number of names to generate.
+        :param max_length: The maximum number of characters per name.
+        :param seed: The seed of the names, or None for random names.
+        :raises ValueError: If the training setups, the number of names
+            or the maximum length are out of range, or the weights are
+            invalid.
+        :return: The list of names.
+        """
+        for key in keys:
+            _check_key(key)
+        _check_limits(n, max_length)
+        batchers = await asyncio.gather(*map(self.get_batcher, keys))
+        blend = mixture.MixtureModel(
+            [batcher.model for batcher in batchers], weights, seed
+        )
+        self.metrics.record_batch(1)
+        loop = asyncio.get_running_loop()
+        async with contextlib.AsyncExitStack() as stack:
+            # locks are always taken in the same order, so concurrent
+            # blends of overlapping models cannot deadlock
+            for batcher in sorted(set(batchers), key=id):
+                await stack.enter_async_context(batcher.lock)
+            return await loop.run_in_executor(
+                self.executor, blend.generate_batch, n, max_length
+            )
+
+    async def _train(self, key: ModelKey) -> Batcher:
+        """
+        Train the model of a key in the thread pool.
+
+        :param key: The training setup of the model.
+        :return: The batcher of the trained model.
+        """
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(self.executor, self.trainer, key)
+        return Batcher(
+            model, self.executor, self.metrics, self.max_delay, self.max_batch
+        )
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serve the requests of a connection until it is closed.
+
+        :param reader: The stream of the connection to read from.
+        :param writer: The stream of the connection to write to.
+        :return: None.
+        """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 400, {"error": "Too large"})
+                    break
+                keep_alive = await self._handle_request(head, reader, writer)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def _handle_request(
+        self,
+        head: bytes,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        """
+        Serve a single request.
+
+        :param head: The request line and headers of the request.
+        :param reader: The stream of the connection to read from.
+        :param writer: The stream of the connection to write to.
+        :return: Whether to keep the connection open.
+        """
+        start = time.perf_counter()
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            await self._respond(writer, 400, {"error": "Malformed request"})
+            return False
+        headers = dict()
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        # bodies are not used, but must be consumed to keep the connection
+        try:
+            length = int(headers.get("content-length", 0) or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self._respond(
+                writer, 400, {"error": "Invalid Content-Length"}
+            )
+            return False
+        if length:
+            await reader.readexactly(length)
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" and (
+            version == "HTTP/1.1" or connection == "keep-alive"
+        )
+        url = urllib.parse.urlsplit(target)
+        status, body = 200, None
+        if url.path not in ("/generate", "/metrics"):
+            status, body = 404, {"error": f"Unknown path: {url.path}"}
+        elif method != "GET":
+            status, body = 405, {"error": f"Method not allowed: {method}"}
+        elif url.path == "/metrics":
+            body = self.metrics.snapshot()
+        else:
+            try:
+                names = await self._generate_query(url.query)
+            except (KeyError, ValueError) as error:
+                status = 404 if isinstance(error, KeyError) else 400
+                body = {"error": str(error).strip("'\"")}
+            except Exception as error:  # keep serving other requests
+                status, body = 500, {"error": repr(error)}
+            else:
+                body = {"names": names}
+            self.metrics.record_request(
+                time.perf_counter() - start,
+                len(body.get("names", ())),
+                error=status != 200,
+            )
+        await self._respond(writer, status, body, keep_alive)
+        return keep_alive
+
+    async def _generate_query(self, query: str) -> list[str]:
+        """
+        Generate the names requested by the query of a URL.
+
+        :param query: The query string.
+        :raises KeyError: If the dataset is unknown.
+        :raises ValueError: If a parameter is missing or invalid.
+        :return: The list of names.
+        """
+        lists = urllib.parse.parse_qs(query)
+        params = {name: values[-1] for name, values in lists.items()}
+        if "dataset" not in params:
+            raise ValueError("Missing parameter: dataset")
+        try:
+            key = ModelKey(
+                params["dataset"],
+                params.get("language") or None,
+                int(params.get("order", 3)),
+                float(params.get("prior", 0.0)),
+                int(params.get("backoff", 1)),
+            )
+            n = int(params.get("n", 1))
+            max_length = int(params.get("max_length", 10))
+            seed = int(params["seed"]) if "seed" in params else None
+            weights = None
+            if "weights" in params:
+                weights = [
+                    float(weight) for weight in params["weights"].split(",")
+                ]
+        except ValueError as error:
+            raise ValueError(f"Invalid parameter: {error}") from None
+        if len(lists["dataset"]) == 1 and weights is None:
+            return await self.generate(key, n, max_length, seed)
+        keys = []
+        for dataset in lists["dataset"]:
+            dataset, _, language = dataset.partition(":")
+            keys.append(key._replace(
+                dataset=dataset, language=language or key.language
+            ))
+        return await self.blend(keys, weights, n, max_length, seed)
+
+    @staticmethod
+    async def _respond(
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: dict[str, Any],
+        keep_alive: bool = False,
+    ) -> None:
+        """
+        Write a JSON response.
+
+        :param writer: The stream of the connection to write to.
+        :param status: The status code.
+        :param body: The object to send as JSON.
+        :param keep_alive: Whether the connection stays open.
+        :return: None.
+        """
+        content = json.dumps(body).encode("utf8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            f"\r\n"
+        )
+        writer.write(head.encode("latin-1") + content)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass  # the client is gone
+
+
+def train_model(
+    key: ModelKey, model_cache: cache.ModelCache | None = None
+) -> markov_model.MarkovModel:
+    """
+    Train the model of a key on the datasets of ``generate.py``.
+
+    :param key: The training setup of the model.
+    :param model_cache: The model cache to use, or None to always train
+        the model.
+    :raises KeyError: If the dataset is unknown.
+    :raises ValueError: If the dataset contains no names to train on.
+    :return: The trained model.
+    """
+    return generate.load_model(
+        key.dataset,
+        key.language,
+        key.order,
+        key.prior,
+        key.max_backoff,
+        model_cache=model_cache,
+    )
+
+
+def _check_key(key: ModelKey) -> None:
+    """
+    Check the training setup of a requested model.
+
+    :param key: The training setup of the model.
+    :raises ValueError: If the prior or an order is out of range.
+    :return: None.
+    """
+    if not math.isfinite(key.prior) or key.prior < 0:
+        raise ValueError("Prior must be a non-negative number")
+    if not 0 <= key.order <= MAX_ORDER:
+        raise ValueError(f"Order must be 0 to {MAX_ORDER}")
+    if not 0 <= key.max_backoff <= key.order:
+        raise ValueError("Back-off order must be 0 to the order")
+
+
+def _check_limits(n: int, max_length: int) -> None:
+    """
+    Check the number of names and the maximum length of a request.
+
+    :param n: The number of names to generate.
+    :param max_length: The maximum number of characters per name.
+    :raises ValueError: If either is out of range.
+    :return: None.
+    """
+    if not 0 <= n <= MAX_NAMES:
+        raise ValueError(f"Number of names must be 0 to {MAX_NAMES}")
+    if not 1 <= max_length <= MAX_LENGTH:
+        raise ValueError(f"Maximum length must be 1 to {MAX_LENGTH}")
+
+
+def _retire(task: asyncio.Task[Batcher]) -> None:
+    """
+    Retire the batcher of a dropped model, once it is trained.
+
+    :param task: The task training the model.
+    :return: None.
+    """
+    if not task.cancelled() and task.exception() is None:
+        task.result().retire()
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    """
+    Return a percentile of sorted values, by the nearest rank.
+
+    :param values: The sorted values, at least one.
+    :param percentile: The percentile, from 0 to 100.
+    :return: The value at the percentile.
+    """
+    rank = math.ceil(percentile / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+async def main(args: argparse.Namespace) -> None:
+    """
+    Serve names according to the received args until interrupted.
+
+    :param args: Namespace from the argument parser.
+    :return: None.
+    """
+    model_cache = None
+    if not args.no_cache:
+        model_cache = cache.ModelCache(
+            args.cache_dir, int(args.cache_size * 2 ** 20)
+        )
+    server = NameServer(
+        lambda key: train_model(key, model_cache),
+        args.threads,
+        args.max_delay / 1000,
+        args.max_batch,
+        args.max_models,
+    )
+    port = await server.start(args.host, args.port)
+    print(f"Serving names on http://{args.host}:{port}")
+    await server.serve_forever()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Serve random names over HTTP from trained models kept in "
+            "memory"
+        ),
+        prog='python serve.py',
+    )
+    parser.add_argument(
+        "--host",
+        help="Address to listen on. Defaults to 127.0.0.1.",
+        default="127.0.0.1",
+    )
+    parser.add_argument(
+        "--port",
+        help="Port to listen on. Defaults to 8000.",
+        default=8000,
+        type=int,
+    )
+    parser.add_argument(
+        "--threads",
+        help=(
+            "Number of threads to train models and generate names in. "
+            "Defaults to the number of processors plus four, at most 32."
+        ),
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--max-delay",
+        help=(
+            "Time in milliseconds a batch waits for concurrent requests "
+            "of the same model. Defaults to 5."
+        ),
+        default=5.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--max-batch",
+        help=(
+            "Number of names after which a batch stops waiting for "
+            f"further requests. Defaults to {MAX_NAMES}."
+        ),
+        default=MAX_NAMES,
+        type=int,
+    )
+    parser.add_argument(
+        "--max-models",
+        help=(
+            "Number of models kept in memory. The least recently used "
+            f"models are dropped beyond it. Defaults to {MAX_MODELS}."
+        ),
+        default=MAX_MODELS,
+        type=int,
+    )
+    parser.add_argument(
+        "--no-cache",
+        help=(
+            "Always train the models, bypassing the cache of trained "
+            "models."
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "Directory of the cache of trained models. Defaults to "
+            "'mcbarnag' in the user cache directory."
+        ),
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-size",
+        help=(
+            "Maximum size of the model cache in MB. Defaults to 256."
+        ),
+        default=256,
+        type=float,
+    )
+    return parser
+
+
+if __name__ == '__main__':
+    parser_ = build_parser()
+    args_ = parser_.parse_args()
+    try:
+        asyncio.run(main(args_))
+    except KeyboardInterrupt:
+        print("Server stopped.")
@@ -0,0 +1,210 @@
+"""
+Publication of trained models in shared memory, for worker processes.
+
+A model is published as a single block of shared memory holding the
+model in the binary format of ``MarkovModel.save``, followed by the
+NumPy arrays of the flattened tables of batch generation, if NumPy is
+available. Worker processes attach to the block by its name and use the
+counts and tables in place, read-only, so a model is held in memory
+only once regardless of the number of workers, and no worker trains or
+unpickles its own copy. This includes the counts of the start points
+and the index of the training words, which the binary format stores as
+arrays: workers only decode the distinct start points.
+
+The process that publishes a model owns the block, and must close the
+handle to release it once all workers are done.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import math
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+import batch
+
+if TYPE_CHECKING:
+    from markov_model import MarkovModel
+
+
+# alignment of the arrays in the block, in bytes
+ALIGNMENT = 64
+
+type LayoutType = dict[str, Any]
+
+
+class ArrayEntry(NamedTuple):
+    """
+    Position and type of an array in a block of shared memory.
+    """
+
+    offset: int
+    dtype: str
+    shape: tuple[int, ...]
+
+
+class AttachedMemory(shared_memory.SharedMemory):
+    """
+    Block of shared memory attached to by a model.
+
+    The arrays and memoryviews of the model keep the mapping of the
+    block alive on their own, so it is unmapped once the last of them
+    is released, even if the block object is collected before them.
+    """
+
+    def __del__(self) -> None:
+        with contextlib.suppress(BufferError):  # views still in use
+            super().__del__()
+
+
+class SharedModel:
+    """
+    Handle of a model published in a block of shared memory.
+
+    The handle itself is not meant to be sent to workers: they attach
+    with ``MarkovModel.from_shared_memory`` given the ``name`` and the
+    ``layout`` of the block, which are picklable.
+    """
+
+    def __init__(self, model: MarkovModel) -> None:
+        """
+        :param model: The trained model to publish.
+        """
+        data = model.to_bytes()
+        generator = batch.BatchGenerator(model)
+        state = generator.state() if generator.vectorized else None
+        # the model at the start, then all arrays, each aligned
+        arrays: list[tuple[ArrayEntry, np.ndarray]] = []
+        self.layout: LayoutType = {
+            "model": len(data),
+            "generator": _place(state, arrays, _aligned(len(data))),
+        }
+        size = _aligned(len(data))
+        if arrays:
+            entry, values = arrays[-1]
+            size = _aligned(entry.offset + values.nbytes)
+        self.memory = shared_memory.SharedMemory(create=True, size=size)
+        self.name = self.memory.name
+        self.memory.buf[:len(data)] = data
+        for entry, values in arrays:
+            view = _view(self.memory.buf, entry)
+            view[...] = values
+            del view  # release the export of the buffer
+
+    def close(self) -> None:
+        """
+        Release the block. Workers still attached keep it mapped.
+
+        :return: None.
+        """
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self) -> SharedModel:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def attach(
+    name: str, layout: LayoutType
+) -> tuple[AttachedMemory, memoryview, dict[str, Any] | None]:
+    """
+    Attach to a block of shared memory holding a published model.
+
+    :param name: The name of the block.
+    :param layout: The layout of the block, as created by
+        ``SharedModel``.
+    :return: Tuple of the attached block, which must be kept alive as
+        long as the model is used, the read-only view of the saved model
+        and the state of its batch generator, as returned by
+        ``BatchGenerator.state`` with read-only arrays in the block, or
+        None if it was not published or NumPy is not available.
+    """
+    memory = AttachedMemory(name=name)
+    state = None
+    if layout["generator"] is not None and np is not None:
+        state = _restore(layout["generator"], memory.buf)
+    return memory, memory.buf[:layout["model"]].toreadonly(), state
+
+
+def _place(
+    state: Any, arrays: list[tuple[ArrayEntry, np.ndarray]], offset: int
+) -> Any:
+    """
+    Replace the arrays of a nested state by their entries in a block.
+
+    :param state: Arrays, or lists and dictionaries containing arrays
+        among other values.
+    :param arrays: The list to append the entries and their arrays to.
+    :param offset: The position of the first array in the block, if the
+        list is empty.
+    :return: The state with every array replaced by its entry.
+    """
+    if isinstance(state, dict):
+        return {
+            key: _place(value, arrays, offset)
+            for key, value in state.items()
+        }
+    if isinstance(state, list):
+        return [_place(value, arrays, offset) for value in state]
+    if np is not None and isinstance(state, np.ndarray):
+        if arrays:
+            entry, values = arrays[-1]
+            offset = _aligned(entry.offset + values.nbytes)
+        entry = ArrayEntry(offset, state.dtype.str, state.shape)
+        arrays.append((entry, state))
+        return entry
+    return state
+
+
+def _restore(layout: Any, buffer: memoryview) -> Any:
+    """
+    Replace the entries of a nested layout by read-only arrays.
+
+    :param layout: The layout, as returned by ``_place``.
+    :param buffer: The buffer of the block.
+    :return: The state with every entry replaced by its array.
+    """
+    if isinstance(layout, ArrayEntry):
+        view = _view(buffer, layout)
+        view.flags.writeable = False
+        return view
+    if isinstance(layout, dict):
+        return {
+            key: _restore(value, buffer) for key, value in layout.items()
+        }
+    if isinstance(layout, list):
+        return [_restore(value, buffer) for value in layout]
+    return layout
+
+
+def _view(buffer: memoryview, entry: ArrayEntry) -> np.ndarray:
+    """
+    Return a NumPy array viewing a part of the buffer.
+
+    :param buffer: The buffer of the block.
+    :param entry: The position and type of the array.
+    :return: The array, sharing the memory of the buffer.
+    """
+    count = math.prod(entry.shape)
+    return np.frombuffer(
+        buffer, dtype=entry.dtype, count=count, offset=entry.offset
+    ).reshape(entry.shape)
+
+
+def _aligned(pos: int) -> int:
+    """
+    Round the position up to the next multiple of ``ALIGNMENT``.
+
+    :param pos: A position in bytes.
+    :return: The aligned position.
+    """
+    return (pos + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,172 @@
+"""
+Start points of the training words, stored as distinct strings with counts.
+
+A model starts every word with the start of a training word, drawn with
+its frequency. Instead of one string per training word, the start points
+are held once each, in the order of their first occurrence, together
+with the number of words starting with them. Saved models store both as
+flat arrays, so loading them decodes only the distinct start points.
+"""
+
+import bisect
+import itertools
+from array import array
+from collections import Counter
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any
+
+from serialization import CountBuffer, pack_strings, unpack_strings
+
+
+class StartPoints(Sequence[str]):
+    """
+    Sequence of the start points of all training words.
+
+    The sequence behaves like the list of the start points of all words,
+    grouped by start point in the order of their first occurrence, so
+    drawing a uniformly random index draws every start point with its
+    frequency. Only the distinct start points and their counts are
+    stored, and indexing bisects the cumulative counts.
+    """
+
+    def __init__(
+        self, points: Iterable[str] = (), counts: CountBuffer | None = None
+    ) -> None:
+        """
+        :param points: The distinct start points. Without ``counts``,
+            they may repeat and are counted as they occur.
+        :param counts: The number of words starting with every distinct
+            start point, such as a read-only view into a saved model.
+            Defaults to None, which counts the given start points.
+        """
+        self.points: list[str] = []
+        self.counts: CountBuffer = array("I")
+        # index of every distinct start point, built before the first
+        # change, which also copies read-only counts
+        self._index: dict[str, int] | None = None
+        # cumulative counts, built on the first look-up after a change
+        self._ends: list[int] | None = None
+        self._total = 0
+        if counts is None:
+            self.extend(points)
+        else:
+            self.points = list(points)
+            self.counts = counts
+            self._total = sum(counts)
+
+    def __getitem__(self, index: int) -> str:
+        return self.points[self.locate(index)]
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __iter__(self) -> Iterator[str]:
+        for point, count in zip(self.points, self.counts):
+            yield from itertools.repeat(point, count)
+
+    def __contains__(self, point: Any) -> bool:
+        if self._index is None:
+            return point in self.points
+        return point in self._index
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"StartPoints({dict(self.items())!r})"
+
+    def __reduce__(self) -> tuple[type, tuple[list[str], array]]:
+        return StartPoints, (self.points, array("I", self.counts))
+
+    def locate(self, index: int) -> int:
+        """
+        Find the distinct start point at an index of the sequence.
+
+        :param index: The index into the sequence of all start points.
+            Negative indexes count from the end.
+        :raises IndexError: If the index is out of range.
+        :return: The index of the start point in ``points``.
+        """
+        if index < 0:
+            index += self._total
+        if not 0 <= index < self._total:
+            raise IndexError("start point index out of range")
+        if self._ends is None:
+            self._ends = list(itertools.accumulate(self.counts))
+        return bisect.bisect_right(self._ends, index)
+
+    def items(self) -> Iterator[tuple[str, int]]:
+        """
+        Return the distinct start points and their counts.
+
+        :return: Iterator of tuples of every distinct start point and
+            the number of words starting with it, in the order of their
+            first occurrence.
+        """
+        return zip(self.points, self.counts)
+
+    def append(self, point: str, count: int = 1) -> None:
+        """
+        Count the start point of another word.
+
+        :param point: The start point.
+        :param count: The number of words starting with it. Defaults to
+            1.
+        :return: None.
+        """
+        if self._index is None:
+            self._index = {
+                start: i for i, start in enumerate(self.points)
+            }
+            self.counts = array("I", self.counts)
+        position = self._index.get(point)
+        if position is None:
+            self._index[point] = len(self.points)
+            self.points.append(point)
+            self.counts.append(count)
+        else:
+            self.counts[position] += count
+        self._total += count
+        self._ends = None
+
+    def extend(self, points: Iterable[str]) -> None:
+        """
+        Count the start points of several words.
+
+        :param points: The start points, or another ``StartPoints``,
+            whose counts are added.
+        :return: None.
+        """
+        if not isinstance(points, StartPoints):
+            # a Counter keeps the order of the first occurrences
+            points = Counter(points)
+        for point, count in points.items():
+            self.append(point, count)
+
+    def to_arrays(self) -> tuple[array, array, array]:
+        """
+        Pack the start points into flat arrays, for saving.
+
+        :return: Tuple of the offsets of the start points into their
+            concatenated UTF-8 encodings, the encodings and the counts,
+            as read by ``from_arrays``.
+        """
+        offsets, data = pack_strings(self.points)
+        return offsets, data, array("I", self.counts)
+
+    @classmethod
+    def from_arrays(
+        cls, offsets: CountBuffer, data: CountBuffer, counts: CountBuffer
+    ) -> "StartPoints":
+        """
+        Restore the start points from their arrays, keeping the counts.
+
+        :param offsets: The offsets, as returned by ``to_arrays``.
+        :param data: The concatenated encodings of the start points.
+        :param counts: The counts of the start points.
+        :return: The start points, viewing the given counts.
+        """
+        return cls(unpack_strings(offsets, data), counts)
+
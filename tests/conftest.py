@@ -0,0 +1,26 @@
+"""
+Fixtures shared by the tests.
+"""
+import pytest
+
+
+WORDS = [
+    "hamburg", "berlin", "heilbronn", "heidelberg", "bremen", "bonn",
+    "bamberg", "hannover", "halle", "hameln", "bergen", "erlangen",
+]
+GREEK_WORDS = [
+    "zeus", "hera", "athena", "apollon", "artemis", "hermes", "hades",
+    "poseidon", "demeter", "dionysos", "hephaistos", "persephone",
+]
+
+
+@pytest.fixture
+def words() -> list[str]:
+    """Provide the city names most models of the tests are trained on"""
+    return list(WORDS)
+
+
+@pytest.fixture
+def greek_words() -> list[str]:
+    """Provide names from greek mythology, as a second training set"""
+    return list(GREEK_WORDS)
@@ -0,0 +1,66 @@
+"""
+Tests for the benchmark suite.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+from benchmarks import compare, corpus, suite
+
+
+def test_synthetic_words() -> None:
+    """Test that the synthetic corpora are reproducible"""
+    words = corpus.synthetic_words(500, seed=1)
+    assert len(words) == 500
+    assert words == corpus.synthetic_words(500, seed=1)
+    assert words != corpus.synthetic_words(500, seed=2)
+    assert all(word and word == word.lower() for word in words)
+
+
+def test_run_all_benchmarks(monkeypatch) -> None:
+    """Test that every benchmark reports all its metrics"""
+    for name in ("UPDATES", "SAMPLES", "NAMES"):
+        monkeypatch.setattr(suite, name, 100)
+    lines = []
+    results = suite.run(
+        list(suite.BENCHMARKS.keys()), [1, 3], [300], 1, lines.append
+    )
+    per_order = [r for r in results if r.order is not None]
+    assert {r.benchmark for r in per_order} == {
+        "learn", "update", "chain_sample", "model_sample", "generate",
+        "generate_batch", "train_memory",
+    }
+    assert len(per_order) == 2 * 7
+    assert [r.key for r in results if r.order is None] == [
+        ("load", None, 300, "rows_per_second")
+    ]
+    assert all(r.value > 0 for r in results)
+    assert len(lines) == 2 * 4 + 1
+    with pytest.raises(KeyError):
+        suite.run(["nope"], [1], [100])
+
+
+def test_save_and_compare(tmp_path: Path) -> None:
+    """Test that regressions against a stored baseline are flagged"""
+    baseline = [
+        suite.Result("learn", 3, 1000, "words_per_second", 100.0, True),
+        suite.Result("chain_sample", 3, 1000, "microseconds", 2.0, False),
+        suite.Result("load", None, 1000, "rows_per_second", 50.0, True),
+    ]
+    compare.save(baseline, tmp_path / "baseline.json")
+    assert compare.load(tmp_path / "baseline.json") == baseline
+    results = [
+        suite.Result("learn", 3, 1000, "words_per_second", 80.0, True),
+        suite.Result("chain_sample", 3, 1000, "microseconds", 1.0, False),
+        suite.Result("load", None, 1000, "rows_per_second", 48.0, True),
+        suite.Result("learn", 4, 1000, "words_per_second", 90.0, True),
+    ]
+    changes = compare.compare(compare.load(tmp_path / "baseline.json"),
+                              results)
+    assert [c.ratio for c in changes] == pytest.approx([0.8, 2.0, 0.96])
+    assert [c.is_regression(0.1) for c in changes] == [True, False, False]
+    assert "REGRESSION" in compare.format_change(changes[0], 0.1)
+    assert "REGRESSION" not in compare.format_change(changes[2], 0.1)
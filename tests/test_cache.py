@@ -0,0 +1,106 @@
+"""
+Tests for the cache of trained models.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import cache
+import loaders
+import markov_model
+
+
+@pytest.fixture
+def dataset(tmp_path: Path, words: list[str]) -> Path:
+    filepath = tmp_path / "names.csv"
+    filepath.write_text(
+        "name-english,name-greek,main-type,sub-type,description\n"
+        + "".join(f"{word},,god,olympian,\n" for word in words),
+        encoding="utf8",
+    )
+    return filepath
+
+
+def test_model_key(dataset: Path) -> None:
+    """Test that the key changes with the dataset and every parameter"""
+    loader = loaders.GreekMythologyLoader()
+    key = cache.model_key(dataset, loader, 3, 0.0, 1, "cdf")
+    assert key == cache.model_key(dataset, loader, 3, 0.0, 1, "cdf")
+    assert key != cache.model_key(dataset, loader, 2, 0.0, 1, "cdf")
+    assert key != cache.model_key(dataset, loader, 3, 0.1, 1, "cdf")
+    assert key != cache.model_key(dataset, loader, 3, 0.0, 2, "cdf")
+    assert key != cache.model_key(dataset, loader, 3, 0.0, 1, "alias")
+    assert key != cache.model_key(dataset, loader, 3, 0.0, 1, "cdf", "set")
+    cities = loaders.WorldCitiesLoader("german")
+    assert key != cache.model_key(dataset, cities, 3, 0.0, 1, "cdf")
+    assert cache.model_key(dataset, cities, 3, 0.0, 1, "cdf") != (
+        cache.model_key(
+            dataset, loaders.WorldCitiesLoader("english"), 3, 0.0, 1, "cdf"
+        )
+    )
+    with open(dataset, "a", encoding="utf8") as file:
+        file.write("bielefeld,,god,olympian,\n")
+    assert key != cache.model_key(dataset, loader, 3, 0.0, 1, "cdf")
+    digest = cache.file_digest(dataset)
+    assert cache.model_key(dataset, loader, 3, 0.0, 1, "cdf") == (
+        cache.model_key(dataset, loader, 3, 0.0, 1, "cdf", None, digest)
+    )
+
+
+def test_get_and_put(tmp_path: Path, words: list[str]) -> None:
+    """Test that a cached model is found and generates the same names"""
+    model_cache = cache.ModelCache(tmp_path / "cache")
+    assert model_cache.get("key") is None
+    mm = markov_model.MarkovModel(words, order=3, prior=0.1, rng=5)
+    model_cache.put("key", mm)
+    cached = model_cache.get("key", rng=7)
+    assert cached is not None
+    assert cached.generate_many(20, 10, seed=3) == (
+        mm.generate_many(20, 10, seed=3)
+    )
+    stats = model_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["models"] == 1
+    assert stats["bytes"] == (tmp_path / "cache" / "key.mcbn").stat().st_size
+
+
+def test_evict_least_recently_used(tmp_path: Path, words: list[str]) -> None:
+    """Test that the least recently used models are evicted first"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0)
+    model_cache = cache.ModelCache(tmp_path / "cache")
+    model_cache.put("probe", mm)
+    size = model_cache.stats()["bytes"]
+    model_cache.clear()
+
+    model_cache.max_bytes = 2 * size
+    model_cache.put("a", mm)
+    model_cache.put("b", mm)
+    # make "a" older than "b", then use it so that "b" is the oldest
+    os.utime(tmp_path / "cache" / "a.mcbn", ns=(1, 1))
+    os.utime(tmp_path / "cache" / "b.mcbn", ns=(2, 2))
+    assert model_cache.get("a") is not None
+    model_cache.put("c", mm)
+    assert model_cache.get("b") is None
+    assert model_cache.get("a") is not None
+    assert model_cache.get("c") is not None
+    stats = model_cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["models"] == 2
+    assert stats["bytes"] <= model_cache.max_bytes
+
+
+def test_clear(tmp_path: Path, words: list[str]) -> None:
+    """Test that clearing removes all models and resets the statistics"""
+    model_cache = cache.ModelCache(tmp_path / "cache")
+    model_cache.put("key", markov_model.MarkovModel(words, order=2, prior=0))
+    model_cache.get("key")
+    model_cache.clear()
+    assert model_cache.stats() == {
+        "hits": 0, "misses": 0, "evictions": 0, "models": 0, "bytes": 0
+    }
+    assert model_cache.get("key") is None
@@ -0,0 +1,83 @@
+"""
+Tests for the columnar form of datasets.
+"""
+import hashlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import columnar
+
+
+ROWS = [
+    ("münchen", "DE"), ("wien", "AT"), ("berlin", "DE"), ("bern", "CH"),
+    ("münchen", "DE"), ("graz", "AT"), ("zürich", "CH"), ("bern", "US"),
+]
+
+
+def test_write_and_read_dataset() -> None:
+    """Test that the rows and their groups are read back in order"""
+    file = io.BytesIO()
+    digest = hashlib.sha256(b"source").digest()
+    columnar.write_dataset(file, ROWS, digest)
+    dataset = columnar.ColumnarDataset(file.getvalue())
+    assert dataset.digest == digest
+    assert len(dataset) == len(ROWS)
+    assert dataset.groups == ["AT", "CH", "DE", "US"]
+    # names are interned
+    assert sorted(dataset.names()) == sorted({name for name, _ in ROWS})
+    assert list(dataset.rows()) == [name for name, _ in ROWS]
+    assert list(dataset.rows(["DE", "US", "XX"])) == [
+        "münchen", "berlin", "münchen", "bern"
+    ]
+    assert list(dataset.rows([])) == []
+
+
+def test_empty_dataset() -> None:
+    """Test that datasets without rows are valid"""
+    file = io.BytesIO()
+    columnar.write_dataset(file, [], bytes(32))
+    dataset = columnar.ColumnarDataset(file.getvalue())
+    assert list(dataset.rows()) == []
+    assert dataset.names() == []
+
+
+def test_invalid_dataset() -> None:
+    """Test that invalid buffers and names are rejected"""
+    with pytest.raises(ValueError):
+        columnar.ColumnarDataset(b"MCBN" + bytes(100))
+    with pytest.raises(ValueError):
+        columnar.write_dataset(io.BytesIO(), [("a\nb", "")], bytes(32))
+
+
+def test_open_dataset_rebuilds_on_change(tmp_path: Path) -> None:
+    """Test that the columnar file is built once per source content"""
+    source = tmp_path / "source.csv"
+    source.write_text("first", encoding="utf8")
+    filepath = tmp_path / "cache" / f"dataset{columnar.SUFFIX}"
+    dataset = columnar.open_dataset(filepath, source, ROWS)
+    assert list(dataset.rows(["AT"])) == ["wien", "graz"]
+    # an unchanged source is not parsed again
+    dataset = columnar.open_dataset(filepath, source, None)
+    assert list(dataset.rows(["AT"])) == ["wien", "graz"]
+    source.write_text("second", encoding="utf8")
+    dataset = columnar.open_dataset(filepath, source, [("linz", "AT")])
+    assert list(dataset.rows(["AT"])) == ["linz"]
+
+
+def test_open_dataset_uses_known_digest(tmp_path: Path) -> None:
+    """Test that a known digest of the source is trusted"""
+    source = tmp_path / "source.csv"
+    source.write_text("first", encoding="utf8")
+    filepath = tmp_path / f"dataset{columnar.SUFFIX}"
+    digest = hashlib.sha256(b"first").hexdigest()
+    columnar.open_dataset(filepath, source, ROWS, digest)
+    # the source is not read again if its digest is passed in
+    source.unlink()
+    dataset = columnar.open_dataset(filepath, source, None, digest)
+    assert dataset.digest.hex() == digest
+    assert list(dataset.rows(["AT"])) == ["wien", "graz"]
@@ -0,0 +1,102 @@
+"""
+Tests for the generation of names under constraints.
+"""
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import constraints
+import markov_model
+
+
+def is_valid(
+    word: str,
+    min_length: int = 0,
+    prefix: str = "",
+    suffix: str = "",
+    contains: str = "",
+) -> bool:
+    word = word.lower()
+    return (
+        len(word) >= min_length
+        and word.startswith(prefix.lower())
+        and word.endswith(suffix.lower())
+        and contains.lower() in word
+    )
+
+
+@pytest.mark.parametrize("prior", [0, 0.05])
+@pytest.mark.parametrize("constraint", [
+    {"min_length": 7},
+    {"prefix": "Ha"},
+    {"prefix": "berge"},
+    {"suffix": "en", "min_length": 6},
+    {"contains": "erl"},
+    {"prefix": "b", "suffix": "n", "contains": "rg"},
+])
+def test_generate_with_constraints(
+    prior: float, constraint: dict, words: list[str]
+) -> None:
+    """Test that all generated words satisfy the constraints"""
+    mm = markov_model.MarkovModel(words, order=2, prior=prior, rng=1)
+    for _ in range(300):
+        word = mm.generate(10, **constraint)
+        assert len(word) <= 10
+        assert is_valid(word, **constraint)
+    assert 0 < mm.acceptance_rate(10, **constraint) <= 1
+
+
+def test_generate_follows_rejection_distribution(words: list[str]) -> None:
+    """Test that constrained words follow the distribution of rejection"""
+    constraint = {"min_length": 6, "contains": "er"}
+    mm = markov_model.MarkovModel(words, order=2, prior=0, rng=2)
+    n = 20000
+    unconstrained = [mm.generate(9) for _ in range(n)]
+    accepted = [word for word in unconstrained if is_valid(word, **constraint)]
+    assert mm.acceptance_rate(9, **constraint) == pytest.approx(
+        len(accepted) / n, abs=0.01
+    )
+    constrained = Counter(mm.generate(9, **constraint) for _ in range(n))
+    expected = Counter(accepted)
+    for word, count in expected.most_common(5):
+        assert constrained[word] / n == pytest.approx(
+            count / len(accepted), abs=0.02
+        )
+
+
+def test_long_maximum_length(words: list[str]) -> None:
+    """Test that the maximum length is not limited by recursion"""
+    mm = markov_model.MarkovModel(words, order=2, prior=0.1, rng=3)
+    for _ in range(20):
+        word = mm.generate(400, min_length=3, prefix="ha")
+        assert is_valid(word, min_length=3, prefix="ha")
+    assert 0 < mm.acceptance_rate(400, min_length=3, prefix="ha") < 1
+
+
+def test_impossible_constraints(words: list[str]) -> None:
+    """Test that constraints no word can satisfy raise an error"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0)
+    with pytest.raises(ValueError):
+        mm.generate(10, prefix="x")
+    with pytest.raises(ValueError):
+        mm.generate(5, contains="heidelberg")
+    with pytest.raises(ValueError):
+        mm.generate(5, min_length=6)
+
+
+def test_match_overlapping_patterns() -> None:
+    """Test the matching automaton on patterns with repetitions"""
+    pattern = "abab"
+    failure = constraints._failure_function(pattern)
+    assert failure == [0, 0, 1, 2]
+    matched = 0
+    ends = []
+    for i, char in enumerate("aababab"):
+        matched = constraints._match(pattern, failure, matched, char)
+        if matched == len(pattern):
+            ends.append(i)
+    assert ends == [4, 6]
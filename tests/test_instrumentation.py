@@ -0,0 +1,107 @@
+"""
+Tests for the instrumentation of loading, training and generation.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import batch
+import instrumentation
+import loaders
+import markov_model
+
+
+def check_draws(profile: instrumentation.Profile, names, order, max_length):
+    """Check the counters against the generated names"""
+    truncated = [len(name) >= max_length for name in names]
+    assert profile.names == len(names)
+    assert profile.truncated == sum(truncated)
+    # every char after the start point and every end was one look-up
+    draws = sum(
+        len(name) - order + (not cut) for name, cut in zip(names, truncated)
+    )
+    assert sum(profile.backoff.values()) == draws
+    summary = profile.summary()
+    top = summary["orders"][order]
+    assert top["hits"] + top["misses"] == draws
+    assert sum(summary["backoff"][order].values()) == draws
+    # the chars drawn from chains, which excludes failed back-offs
+    assert sum(profile.samples.values()) == sum(profile.hits.values())
+
+
+def test_disabled_by_default(words: list[str]) -> None:
+    """Test that nothing is recorded unless instrumentation is enabled"""
+    assert instrumentation.active is None
+    mm = markov_model.MarkovModel(words, 3, 0.1)
+    mm.generate(10)
+    with instrumentation.profiling() as profile:
+        assert instrumentation.active is profile
+    assert instrumentation.active is None
+    assert profile.names == 0
+
+
+def test_profile_generate(words: list[str]) -> None:
+    """Test the counters of generating names one by one"""
+    mm = markov_model.MarkovModel(words, 3, 0.1, max_backoff=2, rng=4)
+    with instrumentation.profiling() as profile:
+        names = [mm.generate(8) for _ in range(200)]
+    check_draws(profile, names, 3, 8)
+    assert profile.truncated > 0
+    assert set(profile.summary()["orders"]) == {3, 2}
+    assert profile.phases["generate"][1] == 200
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_profile_generate_batch(
+    monkeypatch, vectorized, words: list[str]
+) -> None:
+    """Test the counters of generating names in batches"""
+    if vectorized:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(batch, "np", None)
+    mm = markov_model.MarkovModel(words, 3, 0.1, rng=4)
+    with instrumentation.profiling() as profile:
+        names = mm.generate_batch(500, 9)
+    check_draws(profile, names, 3, 9)
+    assert set(profile.summary()["orders"]) == {3, 2, 1}
+
+
+def test_profile_phases(tmp_path: Path, words: list[str]) -> None:
+    """Test that loading is timed apart from the training it feeds"""
+    filepath = tmp_path / "names.csv"
+    filepath.write_text(
+        "name-english\n" + "\n".join(words) + "\n", encoding="utf8"
+    )
+    with instrumentation.profiling() as profile:
+        loader = loaders.GreekMythologyLoader()
+        markov_model.MarkovModel(loader.load(filepath), 3, 0)
+    seconds, calls, items = profile.phases["load"]
+    assert (calls, items) == (1, len(words))
+    assert profile.phases["train"][1] == 1
+    assert 0 < seconds
+    text = instrumentation.format_summary(profile.summary())
+    assert f"load: {seconds:.3f} s in 1 calls, {len(words)} items" in text
+
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_profile_lazy_training(
+    monkeypatch, vectorized, words: list[str]
+) -> None:
+    """Test that the back-off orders trained on first use are recorded"""
+    if vectorized:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(batch, "np", None)
+    mm = markov_model.MarkovModel(words, 3, 0.1, rng=4, lazy=True)
+    with instrumentation.profiling() as profile:
+        names = mm.generate_batch(500, 9)
+    check_draws(profile, names, 3, 9)
+    assert profile.trained_orders == [2, 1]
+    # the trained orders count as training, not as generating
+    assert profile.phases["train"][1] == 2
+    text = instrumentation.format_summary(profile.summary())
+    assert "back-off orders trained on first use: 2, 1" in text
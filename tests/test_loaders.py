@@ -0,0 +1,66 @@
+"""
+Tests for the loaders of training data.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import loaders
+
+
+CITIES = (
+    '"city","city_ascii","lat","lng","country","iso2"\n'
+    '"München","Munich","48.1","11.6","Germany","DE"\n'
+    '"Wien","Vienna","48.2","16.4","Austria","AT"\n'
+    '"Washington, D.C.","Washington, D.C.","38.9","-77.0",'
+    '"United States","US"\n'
+    '"Zürich","Zurich","47.4","8.5","Switzerland","CH"\n'
+)
+
+
+def test_world_cities_loader(tmp_path: Path) -> None:
+    """Test that city names are streamed and filtered by country"""
+    filepath = tmp_path / "worldcities.csv"
+    filepath.write_text(CITIES, encoding="utf8")
+    names = loaders.WorldCitiesLoader().load(filepath)
+    assert iter(names) is names  # streamed, not materialized
+    assert list(names) == ["munich", "vienna", "washington, d.c.", "zurich"]
+    german = loaders.WorldCitiesLoader("german", field="city")
+    assert list(german.load(filepath)) == ["münchen", "wien", "zürich"]
+    countries = loaders.WorldCitiesLoader("US, AT")
+    assert list(countries.load(filepath)) == ["vienna", "washington, d.c."]
+    lowercase = loaders.WorldCitiesLoader("us,at")
+    assert list(lowercase.load(filepath)) == ["vienna", "washington, d.c."]
+
+
+@pytest.mark.parametrize("language", [None, "german", "US, AT", "XX"])
+def test_world_cities_loader_cached(tmp_path: Path, language) -> None:
+    """Test that the columnar dataset yields the names of the CSV file"""
+    filepath = tmp_path / "worldcities.csv"
+    filepath.write_text(CITIES, encoding="utf8")
+    loader = loaders.WorldCitiesLoader(language)
+    expected = list(loader.load(filepath))
+    directory = tmp_path / "datasets"
+    assert list(loader.load_cached(filepath, directory)) == expected
+    assert list(loader.load_cached(filepath, directory)) == expected
+    # all languages share the columnar file of a field
+    assert len(list(directory.iterdir())) == 1
+    other = loaders.WorldCitiesLoader(language, field="city")
+    assert list(other.load_cached(filepath, directory)) == list(
+        other.load(filepath)
+    )
+    assert len(list(directory.iterdir())) == 2
+
+
+def test_greek_mythology_loader_cached(tmp_path: Path) -> None:
+    """Test that loaders without groups are cached as a whole"""
+    filepath = tmp_path / "names.csv"
+    filepath.write_text(
+        "name-english,name-greek\nZeus,Ζεύς\nHera,Ἥρα\n", encoding="utf8"
+    )
+    loader = loaders.GreekMythologyLoader()
+    names = loader.load_cached(filepath, tmp_path / "datasets")
+    assert list(names) == ["Zeus", "Hera"]
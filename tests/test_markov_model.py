@@ -2,7 +2,11 @@
 Tests for the Markov model module.
 """
 import copy
+import pickle
+import random
+import string
 import sys
+import tracemalloc
 from pathlib import Path
 from typing import Iterator
 
@@ -11,7 +15,10 @@ from pytest_subtests import SubTests
 
 sys.path.append(str(Path(__file__).parent))
 
+import batch
 import markov_model
+import ngrams
+import serialization
 
 
 # type defs
@@ -284,6 +291,151 @@ def test_markov_chain_class_sample_method(
     assert mc.sample("ber") in ["l", "g"]  # probabilistic
 
 
+def test_markov_chain_class_sample_with_prior() -> None:
+    """Test that sampling applies the prior to all supported chars"""
+    random.seed(42)
+    mc = markov_model.MarkovChain(["hamburg"], order=3, prior=0.5)
+    weights = mc.weights("ham")
+    total = sum(weights.values())
+    n_draws = 40000
+    counts = {char: 0 for char in weights.keys()}
+    for _ in range(n_draws):
+        counts[mc.sample("ham")] += 1
+    assert counts["\n"] == 0
+    for char, weight in weights.items():
+        expected = n_draws * weight / total
+        sigma = (expected * (1 - weight / total)) ** 0.5
+        assert abs(counts[char] - expected) <= 5 * sigma + 1
+
+
+def test_markov_chain_class_freeze() -> None:
+    """Test that frozen sampling tables are invalidated by learning"""
+    mc = markov_model.MarkovChain(["hamburg"], order=3, prior=0)
+    mc.freeze()
+    assert mc.sample("ham") == "b"
+    assert mc.sample("xyz") is None
+    # learning a new follow-up char must be reflected in the samples
+    mc.update("ham", "u")
+    samples = {mc.sample("ham") for _ in range(200)}
+    assert samples == {"b", "u"}
+    # learning a new context must make it available for sampling
+    mc.learn("rumba")
+    assert mc.sample("rum") == "b"
+
+
+def test_markov_chain_class_memory_footprint() -> None:
+    """Test that the packed chain is smaller than a dict-of-dicts chain"""
+    rng = random.Random(42)
+    words = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+        for _ in range(2000)
+    ]
+    tracemalloc.start()
+    try:
+        mc = markov_model.MarkovChain(words, order=3, prior=0)
+        packed_size, _ = tracemalloc.get_traced_memory()
+        # same layout as a dict-of-dicts chain holding the full support
+        nested_chain = {context: mc.weights(context) for context in mc.chain}
+        total_size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(nested_chain) > 1000
+    assert 3 * packed_size < total_size - packed_size
+
+
+def test_markov_chain_class_growing_support() -> None:
+    """Test that learning new chars grows the support and keeps counts"""
+    mc = markov_model.MarkovChain(["hamburg"], order=2, prior=0.5)
+    assert mc.base == 8
+    mc.learn("bremen")
+    expected = markov_model.MarkovChain(["hamburg", "bremen"], 2, 0.5)
+    # chars are coded in the order they are first seen, and the base
+    # doubles once the alphabet outgrows it
+    assert mc.alphabet == [
+        "\n", "h", "a", "m", "b", "u", "r", "g", "e", "n"
+    ]
+    assert mc.support == sorted(mc.alphabet[1:])
+    assert mc.base == 16
+    assert mc.chain == expected.chain
+    assert mc.pack() == expected.pack()
+    assert mc.weights("em") == expected.weights("em")
+
+
+def test_markov_chain_class_sparse_counts() -> None:
+    """Test that only observed transitions are stored in the counts"""
+    mc = markov_model.MarkovChain(["hamburg", "hambach"], order=2, prior=1)
+    code = mc._encode("am")
+    row = mc.counts[code]
+    # alternating char codes and counts, sorted by char code
+    assert list(row) == [mc.codes["b"], 2]
+    assert mc._decode(code) == "am"
+    assert len(mc.counts) == len(mc.chain)
+    assert all(len(row) % 2 == 0 for row in mc.counts.values())
+    assert mc.weights("am")["b"] == 3
+    assert mc.weights("am")["h"] == 1
+    assert mc.weights("xyz") is None
+
+
+def test_markov_chain_class_learn_ngrams() -> None:
+    """Test that learning shared n-grams equals learning word by word"""
+    words = ["hamburg", "bremen", "hambach", "ham", "bre", "ab", ""]
+    mc = markov_model.MarkovChain([], order=3, prior=0)
+    mc._extend_support("".join(words))
+    mc.learn_ngrams(
+        ngrams.Ngrams.encode(words, mc.codes, mc.base, 3)
+    )
+    # n-grams of a higher order are cut down to the order of the chain
+    higher = ngrams.Ngrams.encode(words, mc.codes, mc.base, 5)
+    mc.learn_ngrams(higher.lower().lower())
+    expected = markov_model.MarkovChain(words + words, order=3, prior=0)
+    assert mc.pack() == expected.pack()
+
+
+def test_markov_chain_class_sorted_rows() -> None:
+    """Test that the rows do not depend on the order of the words"""
+    words = ["hamburg", "hambach", "hameln", "hamm"]
+    mc = markov_model.MarkovChain(words, order=3, prior=0)
+    reverse = markov_model.MarkovChain([], order=3, prior=0)
+    reverse._extend_support(mc.alphabet[1:])
+    for word in reversed(words):
+        reverse.learn(word)
+    row = mc.counts[mc._encode("ham")]
+    assert list(row[::2]) == sorted(row[::2])
+    assert mc.pack() == reverse.pack()
+
+
+def test_markov_chain_class_merge_method() -> None:
+    """Test that merged chains equal a chain trained on all words"""
+    mc = markov_model.MarkovChain(["hamburg", "bremen"], order=2, prior=0)
+    mc.merge(markov_model.MarkovChain(["berlin", "köln"], 2, prior=0))
+    expected = markov_model.MarkovChain(
+        ["hamburg", "bremen", "berlin", "köln"], order=2, prior=0
+    )
+    assert mc.support == expected.support
+    assert mc.pack() == expected.pack()
+    with pytest.raises(ValueError):
+        mc.merge(markov_model.MarkovChain(["bonn"], order=3, prior=0))
+
+
+def test_markov_chain_class_pack_wide_codes() -> None:
+    """Test that contexts beyond 64 bits are packed and looked up"""
+    words = ["abcdefghijklmnopq", "bcdefghijklmnopqa", "abcdefghijklmnopqr"]
+    mc = markov_model.MarkovChain(words, order=16, prior=0)
+    assert mc.base ** mc.order > 2 ** 64
+    keys, offsets, pairs = mc.pack()
+    assert isinstance(keys, serialization.WideKeys)
+    assert list(keys) == sorted(mc.counts)
+    counts = serialization.PackedCounts(keys, offsets, pairs)
+    for code, row in mc.counts.items():
+        assert list(counts[code]) == list(row)
+    assert counts.get(max(mc.counts) + 1) is None
+    assert list(pickle.loads(pickle.dumps(counts))) == list(keys)
+    chain = mc.chain
+    mc.quantize(8)
+    assert mc.chain == chain
+    assert mc.sample("abcdefghijklmnop") in ("q", "\n")
+
+
 def test_markov_model_class_init() -> None:
     """Test that the model is instantiated correctly from simple data"""
     mm = markov_model.MarkovModel(["hamburg"], order=3, prior=0)
@@ -299,6 +451,112 @@ def test_markov_model_class_init() -> None:
         assert mm.model[i + 1].order == i + 1
 
 
+def test_markov_model_class_init_from_generator() -> None:
+    """Test that a model trains from a generator in a single pass"""
+    words = ["Hamburg", "Berlin", "Heilbronn", "Bonn", "Ulm"]
+    mm = markov_model.MarkovModel(
+        (word for word in words), order=3, prior=0.1, max_backoff=1
+    )
+    expected = markov_model.MarkovModel(words, order=3, prior=0.1)
+    assert mm.valid_startpoints == ["Ham", "Ber", "Hei", "Bon", "Ulm"]
+    for order, chain in expected.model.items():
+        assert mm.model[order].support == chain.support
+        assert mm.model[order].chain == chain.chain
+
+
+def test_markov_model_class_partial_fit_method() -> None:
+    """Test that learning in chunks equals learning all words at once"""
+    words = ["Hamburg", "Berlin", "Heilbronn", "Bonn", "Ulm", "Köln"]
+    mm = markov_model.MarkovModel(words[:2], order=3, prior=0.1)
+    mm.generate_batch(5, 10)  # generate in between
+    mm.partial_fit(word for word in words[2:4])
+    mm.partial_fit(words[4:])
+    expected = markov_model.MarkovModel(words, order=3, prior=0.1, rng=1)
+    assert mm.valid_startpoints == expected.valid_startpoints
+    for order, chain in expected.model.items():
+        assert mm.model[order].support == chain.support
+        assert mm.model[order].pack() == chain.pack()
+    # new chars and startpoints are used right away
+    mm.rng = random.Random(1)
+    assert mm.generate_batch(50, 10) == expected.generate_batch(50, 10)
+    assert "Köl" in mm.valid_startpoints
+
+
+def test_markov_model_class_sharded_training() -> None:
+    """Test that parallel sharded training equals serial training"""
+    words = ["Hamburg", "Berlin", "Heilbronn", "Bonn", "Ulm", "Köln", "Hof"]
+    expected = markov_model.MarkovModel(words, order=3, prior=0.1)
+    mm = markov_model.MarkovModel([], order=3, prior=0.1)
+    mm.partial_fit(iter(words), workers=2, shard_size=2)
+    assert mm.valid_startpoints == expected.valid_startpoints
+    for order, chain in expected.model.items():
+        assert mm.model[order].support == chain.support
+        assert mm.model[order].pack() == chain.pack()
+    trained = markov_model.MarkovModel(words, order=3, prior=0.1, workers=2)
+    assert trained.model[3].pack() == expected.model[3].pack()
+
+
+def test_markov_model_class_lazy_training(batch_engine: str) -> None:
+    """Test that lazy back-off orders are trained on first use"""
+    words = ["hamburg", "berlin", "heilbronn", "bonn", "ulm", "köln", "hof"]
+    mm = markov_model.MarkovModel(words, order=3, prior=0, lazy=True)
+    assert list(mm.model) == [3]
+    # without a prior, lowercase contexts never back off
+    mm.generate_batch(50, 10)
+    mm.generate(10)
+    assert list(mm.model) == [3]
+    # capitalized start points back off, which trains the lower orders
+    words = [word.title() for word in words]
+    expected = markov_model.MarkovModel(words, order=3, prior=0, rng=2)
+    mm = markov_model.MarkovModel(words, order=3, prior=0, rng=2, lazy=True)
+    assert mm.generate_batch(50, 10) == expected.generate_batch(50, 10)
+    assert list(mm.model) == [3, 2]  # order 1 was never needed
+    for order, chain in expected.model.items():
+        assert mm.model[order].pack() == chain.pack()
+    assert mm.to_bytes() == expected.to_bytes()
+    with pytest.raises(KeyError):
+        mm.model[4]
+
+
+def test_markov_model_class_lazy_partial_fit_and_merge() -> None:
+    """Test that lazy models learn the words of all orders"""
+    words = ["Hamburg", "Berlin", "Heilbronn", "Bonn", "Ulm", "Köln", "Hof"]
+    expected = markov_model.MarkovModel(words, order=3, prior=0.1)
+    mm = markov_model.MarkovModel(words[:2], order=3, prior=0.1, lazy=True)
+    mm.partial_fit(words[2:4])
+    mm.model[2]  # one order trained before learning more words
+    mm.partial_fit(words[4:])
+    assert mm.to_bytes() == expected.to_bytes()
+    for other_lazy in (True, False):
+        mm = markov_model.MarkovModel(words[:3], 3, 0.1, lazy=True)
+        mm.model[1]
+        other = markov_model.MarkovModel(words[3:], 3, 0.1, lazy=other_lazy)
+        mm.merge(other)
+        assert mm.to_bytes() == expected.to_bytes()
+    # merging into an eager model does not train the other model
+    mm = markov_model.MarkovModel(words[:3], order=3, prior=0.1)
+    other = markov_model.MarkovModel(words[3:], 3, 0.1, lazy=True)
+    mm.merge(other)
+    assert mm.to_bytes() == expected.to_bytes()
+    assert list(other.model) == [3]
+    assert other.to_bytes() == markov_model.MarkovModel(
+        words[3:], order=3, prior=0.1
+    ).to_bytes()
+    mm = markov_model.MarkovModel([], order=3, prior=0.1, lazy=True)
+    mm.partial_fit(iter(words), workers=2, shard_size=2)
+    assert list(mm.model) == [3]
+    assert mm.to_bytes() == expected.to_bytes()
+
+
+def test_markov_model_class_shared_encoding() -> None:
+    """Test that the chains of all orders learn as if trained alone"""
+    words = ["Ulm", "Hof", "Bonn", "Jena", "Heilbronn", "Ab", "X"]
+    mm = markov_model.MarkovModel(words, order=4, prior=0, max_backoff=0)
+    for order in range(5):
+        chain = markov_model.MarkovChain(words, order, prior=0)
+        assert mm.model[order].pack() == chain.pack()
+
+
 def test_markov_model_class_order() -> None:
     """Test that the order is correctly applied to the model"""
     mm = markov_model.MarkovModel(["hamburg"], order=5, prior=0)
@@ -419,3 +677,180 @@ def test_markov_model_class_sample_method_with_max_backoff() -> None:
     assert mm.sample("ambu", 4) == "r"
     assert mm.sample("xmbu", 4) == "r"  # fall through to 3rd order
     assert mm.sample("ham", 3) == "b"
+
+
+def test_markov_model_class_sample_method_resolution_cache() -> None:
+    """Test that cached back-off resolutions are updated after learning"""
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    mm = markov_model.MarkovModel(words, order=4, prior=0, max_backoff=3)
+    assert mm.sample("xmbu", 4) == "r"
+    assert mm.sample("xmbu", 4) == "r"  # resolved from the cache
+    assert mm.sample("xyhe", 4) == "\n"
+    mm.partial_fit(["xmbus", "oxyhel"])
+    assert mm.sample("xmbu", 4) == "s"
+    assert mm.sample("xyhe", 4) == "l"
+    with pytest.raises(KeyError):
+        mm.sample("xmbus", 5)
+
+
+def test_markov_model_class_resolution_cache_is_bounded(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that the cache of back-off resolutions stays bounded"""
+    monkeypatch.setattr(markov_model, "MAX_RESOLVED_CONTEXTS", 8)
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    mm = markov_model.MarkovModel(words, order=4, prior=0, max_backoff=3)
+    for i in range(100):
+        mm.sample(f"{i:04d}", 4)
+        mm.resolve(f"x{i:03d}", 4)
+        assert len(mm._resolution[4]) <= 8
+    assert mm.sample("xmbu", 4) == "r"
+    assert mm.resolve("xmbu", 4) == mm._resolve("xmbu", 4)
+
+
+def test_sampling_tables_distribution(subtests: SubTests) -> None:
+    """Test that all sampling engines draw from the same distribution"""
+    weights = {"a": 1, "b": 0, "c": 2.5, "d": 0.5, "\n": 6}
+    total = sum(weights.values())
+    n_draws = 40000
+    for name, table_type in markov_model.SAMPLERS.items():
+        with subtests.test(msg=f"sampler {name}"):
+            rng = random.Random(42)
+            table = table_type(weights)
+            counts = {char: 0 for char in weights.keys()}
+            for _ in range(n_draws):
+                counts[table.draw(rng.random())] += 1
+            assert counts["b"] == 0
+            for char, weight in weights.items():
+                expected = n_draws * weight / total
+                # allow for five standard deviations of deviation
+                sigma = (expected * (1 - weight / total)) ** 0.5
+                assert abs(counts[char] - expected) <= 5 * sigma + 1
+
+
+def test_markov_model_class_sampler(subtests: SubTests) -> None:
+    """Test that the sampler can be selected for the model"""
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    for name, table_type in markov_model.SAMPLERS.items():
+        with subtests.test(msg=f"sampler {name}"):
+            mm = markov_model.MarkovModel(
+                words, order=4, prior=0, sampler=name
+            )
+            assert mm.sampler == name
+            for chain in mm.model.values():
+                assert chain.sampler == name
+            assert mm.sample("ambu", 4) == "r"
+            assert mm.sample("xyzq", 4) == "\n"
+            assert mm.generate(20) in [w.title() for w in words]
+    with pytest.raises(KeyError):
+        markov_model.MarkovModel(words, order=4, prior=0, sampler="magic")
+
+
+@pytest.fixture(params=["numpy", "python"])
+def batch_engine(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[str]:
+    """Run a test with both the vectorized and the pure Python engine"""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(batch, "np", None)
+    yield request.param
+
+
+def test_markov_model_class_generate_batch_method(batch_engine: str) -> None:
+    """Test the batch generation of the model class"""
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    mm = markov_model.MarkovModel(words, order=4, prior=0)
+    possible_outcomes = [w.title() for w in words]
+    output = mm.generate_batch(4000, max_length=20)
+    assert len(output) == 4000
+    assert set(output) == set(possible_outcomes)
+    # every start point is equally likely, so every name should be too
+    for name in possible_outcomes:
+        assert 800 < output.count(name) < 1200
+    # check that the max length is respected
+    output = mm.generate_batch(10, max_length=4)
+    assert output == [w[:4] for w in output]
+    assert all(len(w) == 4 for w in output)
+
+
+def test_markov_model_class_generate_batch_back_off(batch_engine: str) -> None:
+    """Test that batch generation backs off like the sample method"""
+    words = ["Hamburg", "Berlin", "Heilbronn", "Heidelberg"]
+    mm = markov_model.MarkovModel(words, order=4, prior=0)
+    # capitalized start points are not in the chain and must back off,
+    # after which only the original names can be recreated
+    output = mm.generate_batch(200, max_length=20)
+    assert set(output) == set(words)
+
+
+def test_markov_model_class_generate_batch_prior(batch_engine: str) -> None:
+    """Test that batch generation applies the prior"""
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    mm = markov_model.MarkovModel(words, order=2, prior=1)
+    output = mm.generate_batch(500, max_length=8)
+    support = set(mm.model[2].support)
+    assert all(2 <= len(w) <= 8 for w in output)
+    assert all(set(w.lower()) <= support for w in output)
+    assert all(w == w.title() for w in output)
+    # with a large prior, names exceed the training data
+    assert len(set(output) - {w.title() for w in words}) > 100
+
+
+def test_markov_model_class_generate_batch_wide_codes(
+    batch_engine: str,
+) -> None:
+    """Test batch generation with context codes beyond 64 bits"""
+    words = ["abcdefghijklmnopq", "bcdefghijklmnopqa"]
+    mm = markov_model.MarkovModel(words, order=16, prior=0)
+    assert mm.model[16].base ** 16 >= 2 ** 63
+    output = mm.generate_batch(50, max_length=30)
+    assert len(output) == 50
+    assert set(output) <= {
+        "Abcdefghijklmnopq", "Abcdefghijklmnopqa",
+        "Bcdefghijklmnopq", "Bcdefghijklmnopqa",
+    }
+    assert not mm._batch_generator.vectorized
+    with pytest.raises(ValueError):
+        batch.OrderTable(mm.model[16], vectorized=True)
+
+
+def test_order_table_guided_draws() -> None:
+    """Test that guided vectorized draws equal the scalar bisection"""
+    np = pytest.importorskip("numpy")
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg", "bremen"]
+    chain = markov_model.MarkovModel(words * 3 + ["hb"], 1, 0.2).model[1]
+    vectorized = batch.OrderTable(chain, vectorized=True)
+    scalar = batch.OrderTable(chain, vectorized=False)
+    rng = np.random.default_rng(0)
+    rows = rng.integers(vectorized.n_contexts, size=20000)
+    rolls = rng.random(20000)
+    expected = [scalar.draw(row, roll) for row, roll in zip(rows, rolls)]
+    assert vectorized.draw_array(rows, rolls).tolist() == expected
+
+
+def test_markov_model_class_rng() -> None:
+    """Test that seeded models generate reproducible output"""
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    outputs = []
+    for _ in range(2):
+        mm = markov_model.MarkovModel(words, order=2, prior=0.1, rng=7)
+        outputs.append([mm.generate(12) for _ in range(20)])
+        outputs.append(mm.generate_batch(20, 12))
+    assert outputs[0] == outputs[2]
+    assert outputs[1] == outputs[3]
+    rng = random.Random(7)
+    mm = markov_model.MarkovModel(words, order=2, prior=0.1, rng=rng)
+    assert mm.rng is rng
+
+
+def test_markov_model_class_generate_many_method() -> None:
+    """Test that parallel generation is independent of the worker count"""
+    words = ["hamburg", "berlin", "heilbronn", "heidelberg"]
+    mm = markov_model.MarkovModel(words, order=2, prior=0.1)
+    serial = mm.generate_many(250, 12, workers=1, seed=3, chunk_size=40)
+    parallel = mm.generate_many(250, 12, workers=3, seed=3, chunk_size=40)
+    assert len(serial) == 250
+    assert serial == parallel
+    assert serial != mm.generate_many(250, 12, seed=4, chunk_size=40)
@@ -0,0 +1,118 @@
+"""
+Tests for the weighted blends of several Markov models.
+"""
+import math
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+import mixture
+
+
+def test_single_model_matches_model(
+    words: list[str], greek_words: list[str]
+) -> None:
+    """Test that a mixture of one model generates the words of the model"""
+    mm = markov_model.MarkovModel(words, 3, 0.1, rng=5)
+    expected = [mm.generate(12) for _ in range(50)]
+    mix = mixture.MixtureModel([markov_model.MarkovModel(words, 3, 0.1)])
+    mix.rng = random.Random(5)
+    assert mix.generate_batch(50, 12) == expected
+    # models without weight take no draws either
+    other = markov_model.MarkovModel(greek_words, 2, 0.1)
+    mix = mixture.MixtureModel([other, mm], [0, 1], rng=5)
+    mm.rng = random.Random(5)
+    assert mix.generate_batch(50, 12) == [mm.generate(12) for _ in range(50)]
+
+
+def test_probabilities_interpolate(
+    words: list[str], greek_words: list[str]
+) -> None:
+    """Test that the distribution is the weighted mean of the models"""
+    models = [
+        markov_model.MarkovModel(words, 2, 0.1),
+        markov_model.MarkovModel(greek_words, 2, 0.1),
+    ]
+    mix = mixture.MixtureModel(models, [3, 1])
+    probabilities = mix.probabilities("he")
+    assert math.isclose(sum(probabilities.values()), 1)
+    for char, p in probabilities.items():
+        expected = (
+            0.75 * models[0].probabilities("he").get(char, 0)
+            + 0.25 * models[1].probabilities("he").get(char, 0)
+        )
+        assert math.isclose(p, expected)
+    # weights given per call override the weights of the mixture
+    assert mix.probabilities("he", [1, 0]) == pytest.approx(
+        models[0].probabilities("he")
+    )
+
+
+def test_unknown_contexts_abstain(
+    words: list[str], greek_words: list[str]
+) -> None:
+    """Test that models not knowing a context leave it to the others"""
+    models = [
+        markov_model.MarkovModel(words, 2, 0, max_backoff=2),
+        markov_model.MarkovModel(greek_words, 2, 0, max_backoff=2),
+    ]
+    mix = mixture.MixtureModel(models, [1, 1])
+    # only the greek words know "zeu"
+    assert mix.probabilities("zeu") == pytest.approx(
+        models[1].probabilities("eu")
+    )
+    assert mix.probabilities("xyz") == {"\n": 1.0}
+
+
+def test_weights_change_without_retraining(
+    words: list[str], greek_words: list[str]
+) -> None:
+    """Test that the weights can be changed for every call"""
+    models = [
+        markov_model.MarkovModel(words, 3, 0),
+        markov_model.MarkovModel(greek_words, 3, 0),
+    ]
+    mix = mixture.MixtureModel(models, rng=1)
+    assert mix.weights == [0.5, 0.5]
+    names = mix.generate_batch(100, 20, weights=[0, 1])
+    models[1].rng = random.Random(1)
+    assert names == [models[1].generate(20) for _ in range(100)]
+    mix.set_weights([2, 0])
+    assert mix.weights == [1.0, 0.0]
+    mix.rng, models[0].rng = random.Random(2), random.Random(2)
+    names = [mix.generate(20) for _ in range(100)]
+    assert names == [models[0].generate(20) for _ in range(100)]
+    # the blend starts names with the start points of both models
+    names = mix.generate_batch(200, 20, weights=[1, 1])
+    starts = {name[:3].lower() for name in names}
+    assert starts & {word[:3] for word in words}
+    assert starts & {word[:3] for word in greek_words}
+
+
+@pytest.mark.parametrize(
+    "weights", [[1], [1, 2, 3], [1, -1], [0, 0], [1, math.inf], [1, math.nan]]
+)
+def test_invalid_weights(
+    weights, words: list[str], greek_words: list[str]
+) -> None:
+    """Test that invalid weights are rejected"""
+    models = [
+        markov_model.MarkovModel(words, 2, 0),
+        markov_model.MarkovModel(greek_words, 2, 0),
+    ]
+    with pytest.raises(ValueError):
+        mixture.MixtureModel(models, weights)
+    mix = mixture.MixtureModel(models)
+    with pytest.raises(ValueError):
+        mix.generate(10, weights)
+
+
+def test_no_models() -> None:
+    """Test that a mixture needs a model"""
+    with pytest.raises(ValueError):
+        mixture.MixtureModel([])
@@ -0,0 +1,86 @@
+"""
+Tests for the counting of the n-grams of training words.
+"""
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+import ngrams
+
+
+@pytest.fixture
+def corpus(words: list[str]) -> list[str]:
+    """Provide the test words along with words shorter than the orders"""
+    return words + ["ab", "", "ulm"]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[str]:
+    """Count with both the vectorized and the pure Python engine"""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(ngrams, "MIN_VECTORIZED_CHARS", 0)
+    else:
+        monkeypatch.setattr(ngrams, "np", None)
+    yield request.param
+
+
+def _rows(counted: ngrams.Ngrams) -> dict[int, list[int]]:
+    return {code: list(row) for code, row in counted.rows()}
+
+
+def test_encode(engine: str, corpus: list[str]) -> None:
+    """Test that the n-grams are those a chain learns word by word"""
+    for order in range(5):
+        chain = markov_model.MarkovChain(corpus, order, prior=0)
+        counted = ngrams.Ngrams.encode(
+            corpus, chain.codes, chain.base, order
+        )
+        assert counted.order == order
+        assert _rows(counted) == {
+            code: list(row) for code, row in chain.counts.items()
+        }
+
+
+def test_lower(engine: str, corpus: list[str]) -> None:
+    """Test that lower n-grams equal those counted for the lower order"""
+    chain = markov_model.MarkovChain(corpus, 4, prior=0)
+    counted = ngrams.Ngrams.encode(corpus, chain.codes, chain.base, 4)
+    for order in range(3, -1, -1):
+        counted = counted.lower()
+        expected = ngrams.Ngrams.encode(
+            corpus, chain.codes, chain.base, order
+        )
+        assert counted.order == order
+        assert list(counted.keys) == list(expected.keys)
+        assert list(counted.counts) == list(expected.counts)
+
+
+def test_rows_are_sorted(engine: str, corpus: list[str]) -> None:
+    """Test that the rows are grouped by context and sorted by char"""
+    chain = markov_model.MarkovChain(corpus, 2, prior=0)
+    counted = ngrams.Ngrams.encode(corpus, chain.codes, chain.base, 2)
+    codes = [code for code, _ in counted.rows()]
+    assert codes == sorted(set(codes))
+    for _, row in counted.rows():
+        assert list(row[::2]) == sorted(set(row[::2]))
+
+
+def test_model_training_engines(
+    monkeypatch: pytest.MonkeyPatch, corpus: list[str]
+) -> None:
+    """Test that both engines train the same model"""
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(ngrams, "MIN_VECTORIZED_CHARS", 0)
+    vectorized = markov_model.MarkovModel(corpus, order=4, prior=0)
+    monkeypatch.setattr(ngrams, "np", None)
+    pure = markov_model.MarkovModel(corpus, order=4, prior=0)
+    for order, chain in pure.model.items():
+        assert vectorized.model[order].pack() == chain.pack()
@@ -0,0 +1,79 @@
+"""
+Tests for the generation of novel names.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+import novelty
+
+
+def test_bloom_filter() -> None:
+    """Test that a Bloom filter knows all words and few others"""
+    bloom = novelty.BloomFilter(capacity=1000, error_rate=0.01)
+    words = [f"word{i}" for i in range(1000)]
+    for word in words[::2]:
+        bloom.add(word)
+    assert all(word in bloom for word in words[::2])
+    false_positives = sum(word in bloom for word in words[1::2])
+    assert false_positives < 20
+    other = novelty.BloomFilter(capacity=1000, error_rate=0.01)
+    for word in words[1::2]:
+        other.add(word)
+    bloom.update(other)
+    assert all(word in bloom for word in words)
+    with pytest.raises(ValueError):
+        bloom.update(novelty.BloomFilter(capacity=10))
+
+
+@pytest.mark.parametrize("kind", ["set", "bloom"])
+def test_generate_novel_words(
+    kind: str, tmp_path: Path, words: list[str]
+) -> None:
+    """Test that novel generation never returns training words"""
+    mm = markov_model.MarkovModel(
+        words, order=2, prior=0, rng=1, novelty=kind
+    )
+    assert not mm.is_novel("Hamburg")
+    assert mm.is_novel("Hamberg")
+    words = [mm.generate(10, novel=True) for _ in range(200)]
+    assert all(word.lower() not in words for word in words)
+    # the index is saved with the model
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin")
+    assert loaded.novelty == kind
+    assert not loaded.is_novel("bremen")
+    assert loaded.is_novel("bremberg")
+
+
+def test_generate_many_novel_and_unique(words: list[str]) -> None:
+    """Test that the words of a run are novel, distinct and reproducible"""
+    mm = markov_model.MarkovModel(words, order=2, prior=0, novelty="set")
+    words = mm.generate_many(
+        50, 10, seed=3, chunk_size=20, novel=True, unique=True
+    )
+    assert len(words) == 50
+    assert len({word.lower() for word in words}) == 50
+    assert all(mm.is_novel(word) for word in words)
+    assert words == mm.generate_many(
+        50, 10, workers=2, seed=3, chunk_size=20, novel=True, unique=True
+    )
+    # the model cannot generate that many distinct words
+    with pytest.raises(ValueError):
+        mm.generate_many(200, 10, seed=3, chunk_size=1000, unique=True)
+
+
+def test_novelty_index_training(words: list[str]) -> None:
+    """Test that the index is built in sharded training and required"""
+    mm = markov_model.MarkovModel(
+        words, order=2, prior=0, novelty="set", workers=2
+    )
+    assert mm.known_words == set(words)
+    with pytest.raises(ValueError):
+        markov_model.MarkovModel(words, order=2, prior=0).is_novel("bonn")
+    with pytest.raises(KeyError):
+        markov_model.MarkovModel(words, order=2, prior=0, novelty="list")
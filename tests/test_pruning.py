@@ -0,0 +1,126 @@
+"""
+Tests for the pruning and quantization of Markov models.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+import pruning
+from serialization import PackedCounts
+
+
+def test_chain_prune(words: list[str]) -> None:
+    """Test that rare contexts are removed from a chain"""
+    chain = markov_model.MarkovChain(words, order=2, prior=0)
+    totals = {
+        context: sum(row.values()) for context, row in chain.chain.items()
+    }
+    expected = {context: row for context, row in chain.chain.items()
+                if totals[context] >= 3}
+    chain.prune(min_count=3)
+    assert chain.chain == expected
+    chain.prune(max_contexts=2)
+    assert len(chain.chain) == 2
+    assert sorted(totals[context] for context in chain.chain) == sorted(
+        totals.values()
+    )[-2:]
+
+
+def test_pruned_contexts_back_off(words: list[str]) -> None:
+    """Test that look-ups of pruned contexts back off to lower orders"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0)
+    assert mm.probabilities("amb") == {"u": 0.5, "e": 0.5}
+    mm.prune(min_count=3, words=[])
+    assert "amb" not in mm.model[3].chain
+    assert mm.probabilities("amb") == mm.probabilities("zmb")
+    # the lowest order is never pruned
+    assert mm.model[1].chain == markov_model.MarkovChain(
+        words, order=1, prior=0
+    ).chain
+
+
+def test_chain_quantize(words: list[str]) -> None:
+    """Test that counts are stored in fewer bits, scaled if necessary"""
+    chain = markov_model.MarkovChain(words, order=1, prior=0)
+    expected = chain.chain
+    chain.quantize(16)
+    assert isinstance(chain.counts, PackedCounts)
+    assert chain.counts.pairs.itemsize == 2
+    assert chain.chain == expected
+    chain = markov_model.MarkovChain(words * 100 + ["ex"], order=1, prior=0)
+    chain.quantize(8)
+    assert chain.counts.pairs.itemsize == 1
+    row = chain.chain["e"]
+    assert max(row.values()) == 255
+    assert row["x"] == 1  # rounded up, not lost
+    assert row["r"] / row["n"] == pytest.approx(
+        expected["e"]["r"] / expected["e"]["n"], rel=0.05
+    )
+    # learning copies the counts back into arrays of 32 bits
+    chain.learn("hamburg")
+    assert chain.counts[chain._encode("h")].itemsize == 4
+    with pytest.raises(ValueError):
+        chain.quantize(12)
+
+
+def test_quantized_model_save_and_load(
+    tmp_path: Path, words: list[str]
+) -> None:
+    """Test that quantized counts are saved in their number of bits"""
+    mm = markov_model.MarkovModel(words * 300, order=2, prior=0.1, rng=3)
+    mm.prune(bits=8, words=[])
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin", rng=3)
+    for order, chain in loaded.model.items():
+        assert chain.counts.pairs.itemsize == 1
+        assert chain.chain == mm.model[order].chain
+    assert loaded.generate_batch(20, 10) == mm.generate_batch(20, 10)
+
+
+def test_prune_report(words: list[str]) -> None:
+    """Test the report of the size and perplexity of a pruned model"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0.1)
+    report = mm.prune(bits=16, words=words)
+    assert report["bytes_after"] < report["bytes_before"]
+    assert report["bytes_after"] == pruning.packed_size(mm)
+    assert report["perplexity_after"] == report["perplexity_before"]
+    report = mm.prune(min_count=2, words=words)
+    assert report["contexts_after"] < report["contexts_before"]
+    assert report["perplexity_after"] > report["perplexity_before"]
+    assert report["impossible"] == 0
+
+
+@pytest.mark.parametrize("budget", [3000, 2000, 1200])
+def test_prune_memory_budget(budget: int, words: list[str]) -> None:
+    """Test that a memory budget chooses settings that fit in it"""
+    mm = markov_model.MarkovModel(words, order=4, prior=0)
+    full = pruning.packed_size(mm)
+    assert full > budget
+    report = mm.prune(memory_budget=budget)
+    assert report["bytes_before"] == full
+    assert report["bytes_after"] <= budget
+    assert mm.generate(12)
+
+
+def test_prune_memory_budget_too_small(words: list[str]) -> None:
+    """Test that an unreachable memory budget raises an error"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0)
+    with pytest.raises(ValueError):
+        mm.prune(memory_budget=100)
+
+
+@pytest.mark.parametrize("bits", [8, 12])
+def test_prune_invalid_bits_keeps_model(bits: int, words: list[str]) -> None:
+    """Test that invalid bits are rejected before anything is pruned"""
+    words = words + ["".join(chr(0x4E00 + i) for i in range(300))]
+    mm = markov_model.MarkovModel(words, order=3, prior=0)
+    expected = {order: chain.chain for order, chain in mm.model.items()}
+    with pytest.raises(ValueError):
+        mm.prune(min_count=3, bits=bits, words=[])
+    assert {
+        order: chain.chain for order, chain in mm.model.items()
+    } == expected
@@ -0,0 +1,80 @@
+"""
+Tests for the scoring of names by their log-likelihood.
+"""
+import math
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+import scoring
+
+
+NAMES = [
+    "Hamburg", "berlin", "Bergen", "Hamberg", "Heidelbronn", "Bonnover",
+    "Erlangen", "Halle", "Xanten", "Hamb!rg", "Be", "", "Hallé",
+]
+
+
+@pytest.mark.parametrize("prior", [0, 0.5])
+@pytest.mark.parametrize("order,max_backoff", [(2, 1), (3, 1), (3, 2)])
+def test_vectorized_matches_single(
+    monkeypatch, prior, order, max_backoff, words: list[str]
+):
+    """Test that the NumPy and pure Python scores agree"""
+    pytest.importorskip("numpy")
+    mm = markov_model.MarkovModel(words, order, prior, max_backoff)
+    log_probabilities, perplexities = mm.score_batch(NAMES)
+    monkeypatch.setattr(scoring, "np", None)
+    expected = scoring.BatchScorer(mm).score(NAMES)
+    assert log_probabilities == pytest.approx(expected[0])
+    assert perplexities == pytest.approx(expected[1])
+
+
+@pytest.mark.parametrize("title", [False, True])
+def test_scores_match_search(words: list[str], title: bool):
+    """Test that the scores are the probabilities of generating names"""
+    if title:
+        words = [word.title() for word in words]
+    mm = markov_model.MarkovModel(words, 3, 0)
+    top = mm.top_k(20, 30)
+    log_probabilities, _ = mm.score_batch([name for name, _ in top])
+    for (name, probability), log_probability in zip(top, log_probabilities):
+        assert math.exp(log_probability) == pytest.approx(probability)
+
+
+def test_impossible_names(words: list[str]):
+    """Test that names the model cannot generate score minus infinity"""
+    mm = markov_model.MarkovModel(words, 3, 0)
+    for name in ["Xanten", "Hamb!rg", "Be", "Hamburgen"]:
+        log_probability, perplexity = mm.score(name)
+        assert log_probability == -math.inf
+        assert perplexity == math.inf
+    # the prior makes every name of known chars possible
+    mm = markov_model.MarkovModel(words, 3, 0.1)
+    assert mm.score("Hamburgen")[0] > -math.inf
+    assert mm.score("Hamb!rg")[0] == -math.inf
+
+
+def test_perplexity(words: list[str]):
+    """Test the perplexity per char of a name"""
+    mm = markov_model.MarkovModel(words, 3, 0.1)
+    log_probability, perplexity = mm.score("Hamburg")
+    assert perplexity == pytest.approx(math.exp(-log_probability / 8))
+    assert mm.score("hamburg") == (log_probability, perplexity)
+    assert perplexity < mm.score("Hmmbrg")[1]
+
+
+def test_generate_many_max_perplexity(words: list[str]):
+    """Test that generation rejects names above the maximum perplexity"""
+    mm = markov_model.MarkovModel(words, 2, 0.1)
+    names = mm.generate_many(200, 10, seed=1, chunk_size=64)
+    threshold = sorted(mm.score_batch(names)[1])[100]
+    plausible = mm.generate_many(
+        200, 10, seed=1, chunk_size=64, max_perplexity=threshold
+    )
+    assert len(plausible) == 200
+    assert max(mm.score_batch(plausible)[1]) <= threshold
@@ -0,0 +1,71 @@
+"""
+Tests for the search for the most probable names.
+"""
+import sys
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+
+
+def all_names(
+    mm: markov_model.MarkovModel, max_length: int
+) -> dict[str, float]:
+    """Enumerate all names of the model with their probabilities"""
+    names = Counter()
+    starts = Counter(mm.valid_startpoints)
+    stack = [(start, count / len(mm.valid_startpoints))
+             for start, count in starts.items()]
+    while stack:
+        word, probability = stack.pop()
+        name = word.title()
+        if len(word) >= max_length:
+            names[name] += probability
+            continue
+        for char, p in mm.probabilities(word[-mm.order:]).items():
+            if char == "\n":
+                names[name] += probability * p
+            else:
+                stack.append((word + char, probability * p))
+    return names
+
+
+def test_top_k_is_exact_with_wide_beam(words: list[str]) -> None:
+    """Test that a wide beam finds exactly the most probable names"""
+    mm = markov_model.MarkovModel(words, order=2, prior=0, max_backoff=2)
+    expected = all_names(mm, 8)
+    top = mm.top_k(20, 8, beam_width=100000)
+    assert len(top) == 20
+    for (name, probability), (expected_name, expected_probability) in zip(
+        top, sorted(expected.items(), key=lambda x: (-x[1], x[0]))
+    ):
+        assert probability == pytest.approx(expected_probability)
+        assert probability == pytest.approx(expected[name])
+    assert top == mm.top_k(20, 8, beam_width=100000)  # deterministic
+
+
+def test_top_k_with_narrow_beam(words: list[str]) -> None:
+    """Test that a narrow beam still returns sorted, valid names"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0.01)
+    top = mm.top_k(50, 10, beam_width=20)
+    assert len(top) == 50
+    assert len({name for name, _ in top}) == 50
+    probabilities = [probability for _, probability in top]
+    assert probabilities == sorted(probabilities, reverse=True)
+    assert 0 < sum(probabilities) <= 1
+    assert all(len(name) <= 10 for name, _ in top)
+
+
+def test_top_k_sums_equal_names() -> None:
+    """Test that names reached from several start points add up"""
+    mm = markov_model.MarkovModel(
+        ["Hamburg", "hamburg", "bremen"], order=3, prior=0
+    )
+    assert mm.top_k(2, 10, beam_width=10) == [
+        ("Hamburg", pytest.approx(2 / 3)), ("Bremen", pytest.approx(1 / 3))
+    ]
+    assert mm.top_k(0, 10, beam_width=10) == []
@@ -0,0 +1,152 @@
+"""
+Tests for the serialization of Markov models.
+"""
+import io
+import json
+import pickle
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import markov_model
+import serialization
+from serialization import PackedCounts
+
+
+def test_save_and_load_model(tmp_path: Path, words: list[str]) -> None:
+    """Test that a loaded model equals the saved model"""
+    mm = markov_model.MarkovModel(
+        words, order=3, prior=0.25, max_backoff=2, sampler="alias"
+    )
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin")
+    assert loaded.order == 3
+    assert loaded.prior == 0.25
+    assert loaded.max_backoff == 2
+    assert loaded.sampler == "alias"
+    assert loaded.valid_startpoints == mm.valid_startpoints
+    assert loaded.model.keys() == mm.model.keys()
+    for order, chain in loaded.model.items():
+        assert isinstance(chain.counts, PackedCounts)
+        assert chain.order == order
+        assert chain.support == mm.model[order].support
+        assert chain.prior == mm.model[order].prior
+        assert chain.chain == mm.model[order].chain
+
+
+def test_loaded_model_generates_like_saved_model(
+    tmp_path: Path, words: list[str]
+) -> None:
+    """Test that a loaded model generates the same names when seeded"""
+    mm = markov_model.MarkovModel(words, order=2, prior=0.1, rng=3)
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin", rng=3)
+    assert [loaded.generate(12) for _ in range(20)] == [
+        mm.generate(12) for _ in range(20)
+    ]
+    assert loaded.generate_batch(50, 12) == mm.generate_batch(50, 12)
+    assert loaded.sample("xyz", 2) == "\n"
+
+
+def test_loaded_model_can_learn(tmp_path: Path, words: list[str]) -> None:
+    """Test that a loaded chain is copied into memory when learning"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0)
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin")
+    chain = loaded.model[3]
+    chain.learn("bergen")
+    assert isinstance(chain.counts, dict)
+    row = chain.counts[chain._encode("erg")]
+    assert list(row) == [chain.codes["\n"], 2, chain.codes["e"], 2]
+    # new chars are added to the loaded model as well
+    loaded.partial_fit(["würzburg"])
+    expected = markov_model.MarkovModel(words + ["würzburg"], 3, prior=0)
+    assert loaded.model[2].pack() == expected.model[2].pack()
+
+
+def test_packed_counts(words: list[str]) -> None:
+    """Test the mapping interface of packed counts"""
+    chain = markov_model.MarkovChain(words, order=2, prior=0)
+    counts = PackedCounts(*chain.pack())
+    assert len(counts) == len(chain.counts)
+    assert list(counts) == sorted(chain.counts.keys())
+    for code, row in chain.counts.items():
+        assert list(counts[code]) == list(row)
+    assert counts.get(-1) is None
+    assert counts.get(None) is None
+
+
+def test_read_model_rejects_invalid_buffers() -> None:
+    """Test that invalid buffers raise an error"""
+    with pytest.raises(ValueError):
+        serialization.read_model(b"MC")
+    with pytest.raises(ValueError):
+        serialization.read_model(b"ABCD" + bytes(12))
+    buffer = io.BytesIO()
+    serialization.write_model(buffer, {}, [])
+    data = bytearray(buffer.getvalue())
+    assert serialization.read_model(data) == ({}, [], {})
+    data[4] = serialization.FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        serialization.read_model(data)
+
+
+def test_save_and_load_wide_context_codes(tmp_path: Path) -> None:
+    """Test that context codes beyond 64 bits are saved and loaded"""
+    words = ["abcdefghijklmnopq", "bcdefghijklmnopqa", "abcdefghijklmnopqr"]
+    mm = markov_model.MarkovModel(words, order=16, prior=0, rng=1)
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin", rng=1)
+    keys = loaded.model[16].counts.keys
+    assert isinstance(keys, serialization.WideKeys)
+    assert keys.width == 16
+    assert loaded.model[16].chain == mm.model[16].chain
+    assert loaded.to_bytes() == mm.to_bytes()
+    assert loaded.generate_batch(20, 30) == mm.generate_batch(20, 30)
+    # codes that fit in 64 bits are still stored as i64
+    assert isinstance(loaded.model[12].counts.keys, memoryview)
+
+
+@pytest.mark.parametrize("novelty", ["set", "bloom"])
+def test_start_points_and_known_words_are_arrays(
+    tmp_path: Path, novelty: str, words: list[str]
+) -> None:
+    """Test that the words are stored as arrays, not in the metadata"""
+    words = words * 50 + ["würzburg"]
+    mm = markov_model.MarkovModel(words, order=3, prior=0, novelty=novelty)
+    data = mm.to_bytes()
+    metadata, _, arrays = serialization.read_model(data)
+    assert "startpoints" not in metadata
+    assert "words" not in metadata["known_words"]
+    assert len(json.dumps(metadata)) < 500
+    assert list(arrays["startpoint_counts"]) == (
+        [100, 100, 100, 50, 50, 50, 50, 50, 50, 1]
+    )
+    loaded = markov_model.MarkovModel.from_buffer(data)
+    assert loaded.valid_startpoints == mm.valid_startpoints
+    assert loaded.valid_startpoints.points == [
+        "ham", "ber", "hei", "bre", "bon", "bam", "han", "hal", "erl", "wür"
+    ]
+    assert all(not loaded.is_novel(word) for word in words)
+    assert loaded.is_novel("hamburgo")
+    # the read-only index is copied when learning
+    loaded.partial_fit(["hamburgo"])
+    assert not loaded.is_novel("hamburgo")
+
+
+def test_loaded_model_pickles(tmp_path: Path, words: list[str]) -> None:
+    """Test that loaded models and their views can be pickled"""
+    mm = markov_model.MarkovModel(words, order=2, prior=0.1, novelty="set")
+    mm.save(tmp_path / "model.bin")
+    loaded = markov_model.MarkovModel.load(tmp_path / "model.bin", rng=2)
+    copied = pickle.loads(pickle.dumps(loaded))
+    assert copied.to_bytes() == mm.to_bytes()
+    assert copied.known_words == set(words)
+    assert copied.generate_many(20, 12, seed=4) == loaded.generate_many(
+        20, 12, seed=4
+    )
+    counts = pickle.loads(pickle.dumps(loaded.model[2].counts))
+    assert dict(counts.items()).keys() == dict(mm.model[2].counts).keys()
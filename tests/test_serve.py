@@ -0,0 +1,284 @@
+"""
+Tests for the HTTP service generating names.
+"""
+import asyncio
+import contextlib
+import json
+import socket
+import sys
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import generate
+import loaders
+import markov_model
+import mixture
+import serve
+
+
+@pytest.fixture
+def train(words: list[str], greek_words: list[str]):
+    """Provide a trainer of models on the test words"""
+    datasets = {"test": words, "greek": greek_words}
+
+    def train(key: serve.ModelKey) -> markov_model.MarkovModel:
+        """Train a model on the test words, or fail for unknown datasets"""
+        if key.dataset not in datasets:
+            raise KeyError(f"Unknown dataset: {key.dataset}")
+        return markov_model.MarkovModel(
+            datasets[key.dataset], key.order, key.prior, key.max_backoff
+        )
+
+    return train
+
+
+@pytest.fixture
+def server_url(train):
+    """Run a server on a free localhost port in a background thread"""
+    started = threading.Event()
+    state = dict()
+
+    async def run() -> None:
+        server = serve.NameServer(train, threads=4, max_delay=0.05)
+        state["port"] = await server.start("127.0.0.1", 0)
+        state["task"] = asyncio.current_task()
+        state["loop"] = asyncio.get_running_loop()
+        started.set()
+        with contextlib.suppress(asyncio.CancelledError):
+            await server.serve_forever()
+
+    thread = threading.Thread(
+        target=asyncio.run, args=(run(),), daemon=True
+    )
+    thread.start()
+    assert started.wait(10)
+    yield f"http://127.0.0.1:{state['port']}"
+    state["loop"].call_soon_threadsafe(state["task"].cancel)
+    thread.join(10)
+
+
+def get(url: str) -> tuple[int, dict]:
+    """Send a GET request and return the status and the JSON body"""
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as error:
+        return error.code, json.load(error)
+
+
+def test_generate(server_url, words: list[str]) -> None:
+    """Test that names are generated from the resident model"""
+    status, body = get(
+        f"{server_url}/generate?dataset=test&order=2&n=20&max_length=8"
+    )
+    assert status == 200
+    assert len(body["names"]) == 20
+    assert all(len(name) <= 8 for name in body["names"])
+    # seeded requests are reproducible
+    url = f"{server_url}/generate?dataset=test&n=5&seed=3"
+    expected = markov_model.MarkovModel(words, 3, 0).generate_many(
+        5, 10, seed=3
+    )
+    assert get(url) == (200, {"names": expected})
+
+
+def test_blend(
+    server_url, words: list[str], greek_words: list[str]
+) -> None:
+    """Test that repeated datasets blend their models by the weights"""
+    url = (
+        f"{server_url}/generate?dataset=test&dataset=greek&order=2&n=5"
+        f"&seed=7&weights=3,1"
+    )
+    expected = mixture.MixtureModel(
+        [
+            markov_model.MarkovModel(words, 2, 0),
+            markov_model.MarkovModel(greek_words, 2, 0),
+        ],
+        [3, 1],
+        rng=7,
+    ).generate_batch(5, 10)
+    assert get(url) == (200, {"names": expected})
+    # the weights change per request, without training new models
+    status, body = get(
+        f"{server_url}/generate?dataset=test&dataset=greek&n=30"
+        f"&weights=0,1"
+    )
+    assert status == 200
+    assert len(body["names"]) == 30
+    url = f"{server_url}/generate?dataset=test&dataset=greek&weights=1"
+    assert get(url)[0] == 400
+    assert get(f"{server_url}/generate?dataset=test&dataset=nope")[0] == 404
+
+
+def test_invalid_requests(server_url) -> None:
+    """Test the errors of unknown datasets, paths and invalid parameters"""
+    status, body = get(f"{server_url}/generate?dataset=nope")
+    assert status == 404
+    assert body["error"] == "Unknown dataset: nope"
+    assert get(f"{server_url}/generate")[0] == 400
+    assert get(f"{server_url}/generate?dataset=test&n=x")[0] == 400
+    assert get(f"{server_url}/generate?dataset=test&n=-1")[0] == 400
+    for query in ("order=11", "order=-1", "order=2&backoff=3"):
+        url = f"{server_url}/generate?dataset=test&{query}"
+        assert get(url)[0] == 400
+    assert get(f"{server_url}/names")[0] == 404
+    request = urllib.request.Request(
+        f"{server_url}/generate?dataset=test", method="POST"
+    )
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(request, timeout=10)
+    assert error.value.code == 405
+
+
+def test_invalid_content_length(server_url) -> None:
+    """Test that an invalid Content-Length is answered, not dropped"""
+    port = int(server_url.rsplit(":", 1)[1])
+    for length in ("abc", "-5"):
+        with socket.create_connection(("127.0.0.1", port), 10) as client:
+            client.sendall(
+                f"GET /metrics HTTP/1.1\r\nContent-Length: {length}\r\n"
+                f"\r\n".encode("latin-1")
+            )
+            response = client.makefile("rb").read()
+        assert response.startswith(b"HTTP/1.1 400 Bad Request\r\n")
+        assert b"Connection: close" in response
+
+
+def test_languages_share_models_of_other_datasets(train) -> None:
+    """Test that datasets without languages are trained once"""
+    trained = []
+
+    def count(key: serve.ModelKey) -> markov_model.MarkovModel:
+        trained.append(key)
+        return train(key)
+
+    async def run() -> None:
+        server = serve.NameServer(count, threads=2)
+        key = serve.ModelKey("greek", "de", 2, 0.0, 1)
+        first = await server.get_batcher(key)
+        second = await server.get_batcher(key._replace(language="fr"))
+        assert first is second
+        await server.close()
+
+    asyncio.run(run())
+    assert trained == [serve.ModelKey("greek", None, 2, 0.0, 1)]
+
+
+def test_resident_models_are_bounded(train) -> None:
+    """Test that the least recently used models are dropped"""
+
+    async def run() -> None:
+        server = serve.NameServer(train, threads=2, max_models=2)
+        keys = [
+            serve.ModelKey("test", None, order, 0.0, 1) for order in (1, 2, 3)
+        ]
+        first = await server.get_batcher(keys[0])
+        second = await server.get_batcher(keys[1])
+        assert await server.get_batcher(keys[0]) is first
+        await server.get_batcher(keys[2])
+        assert list(server._batchers) == [keys[0], keys[2]]
+        await asyncio.sleep(0.1)
+        assert second._task.done()  # retired
+        # requests that got the batcher before it was dropped are served
+        assert len(await second.generate(3, 10)) == 3
+        second.close()
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_empty_training_set(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that datasets without names are rejected"""
+    filepath = tmp_path / "worldcities.csv"
+    filepath.write_text(
+        '"city","city_ascii","iso2"\n"Wien","Vienna","AT"\n'
+        '"Graz","Graz","AT"\n',
+        encoding="utf8",
+    )
+    monkeypatch.setattr(
+        generate,
+        "get_loader",
+        lambda dataset, language: (
+            loaders.WorldCitiesLoader(language), filepath
+        ),
+    )
+
+    async def run() -> None:
+        server = serve.NameServer(threads=2)
+        key = serve.ModelKey("cities", "at", 1, 0.0, 1)
+        assert len(await server.generate(key, 3, 10)) == 3
+        with pytest.raises(ValueError, match="No names"):
+            await server.generate(key._replace(language="de"), 3, 10)
+        assert list(server._batchers) == [key]
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_blend_waits_for_batches(train) -> None:
+    """Test that a blend never uses a model along with its batches"""
+
+    async def run() -> None:
+        server = serve.NameServer(train, threads=2)
+        key = serve.ModelKey("test", None, 2, 0.0, 1)
+        batcher = await server.get_batcher(key)
+        async with batcher.lock:  # as a running batch does
+            blend = asyncio.create_task(server.blend(
+                [key, key._replace(dataset="greek")], None, 5, 10
+            ))
+            await asyncio.sleep(0.1)
+            assert not blend.done()
+        assert len(await blend) == 5
+        await server.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_requests_and_metrics(server_url) -> None:
+    """Test that concurrent requests are served and reported"""
+    url = f"{server_url}/generate?dataset=test&order=3&prior=0.1&n=10"
+    with ThreadPoolExecutor(16) as executor:
+        results = list(executor.map(get, [url] * 32))
+    assert all(status == 200 for status, _ in results)
+    assert all(len(body["names"]) == 10 for _, body in results)
+    status, metrics = get(f"{server_url}/metrics")
+    assert status == 200
+    assert metrics["requests"] == 32
+    assert metrics["names"] == 320
+    assert metrics["errors"] == 0
+    assert 1 <= metrics["batches"] <= 32
+    latencies = metrics["latency_ms"]
+    assert 0 < latencies["p50"] <= latencies["p90"] <= latencies["p99"]
+    assert metrics["names_per_second"] > 0
+
+
+def test_batcher_coalesces_requests(words: list[str]) -> None:
+    """Test that concurrent requests of a model share a single batch"""
+    mm = markov_model.MarkovModel(words, 2, 0.1)
+
+    async def run() -> list[list[str]]:
+        metrics = serve.Metrics()
+        with ThreadPoolExecutor(2) as executor:
+            batcher = serve.Batcher(mm, executor, metrics, max_delay=0.1)
+            results = await asyncio.gather(
+                *(batcher.generate(n, 10) for n in range(1, 11)),
+                batcher.generate(3, 5),
+            )
+            batcher.close()
+        assert metrics.batches == 1
+        assert metrics.batched_requests == 11
+        return results
+
+    results = asyncio.run(run())
+    assert [len(names) for names in results] == list(range(1, 11)) + [3]
+    assert all(len(name) <= 5 for name in results[-1])
@@ -0,0 +1,99 @@
+"""
+Tests for models published in shared memory.
+"""
+import sys
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent))
+
+import batch
+import markov_model
+import novelty as novelty_index
+
+
+def test_attached_model_equals_shared_model(words: list[str]) -> None:
+    """Test that an attached model generates like the published one"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0.1, rng=3)
+    with mm.share() as shared_model:
+        attached = markov_model.MarkovModel.from_shared_memory(
+            shared_model.name, shared_model.layout, rng=3
+        )
+        assert attached.valid_startpoints == mm.valid_startpoints
+        for order, chain in attached.model.items():
+            assert chain.chain == mm.model[order].chain
+        assert attached.generate_batch(50, 12) == mm.generate_batch(50, 12)
+        assert attached.score_batch(words) == mm.score_batch(words)
+
+
+def test_attached_tables_are_shared(words: list[str]) -> None:
+    """Test that the tables of an attached model are read-only views"""
+    np = pytest.importorskip("numpy")
+    mm = markov_model.MarkovModel(words, order=3, prior=0.1)
+    with mm.share() as shared_model:
+        attached = markov_model.MarkovModel.from_shared_memory(
+            shared_model.name, shared_model.layout
+        )
+        generator = attached._batch_generator
+        arrays = [generator.start_codes_array] + [
+            values
+            for table in generator.tables
+            for values in table.arrays().values()
+        ]
+        for values in arrays:
+            assert isinstance(values, np.ndarray)
+            assert not values.flags.owndata
+            assert not values.flags.writeable
+
+
+@pytest.mark.parametrize("novelty", ["set", "bloom"])
+def test_attached_words_are_shared(novelty: str, words: list[str]) -> None:
+    """Test that start points and known words stay in the block"""
+    mm = markov_model.MarkovModel(words * 3, order=3, prior=0, novelty=novelty)
+    with mm.share() as shared_model:
+        attached = markov_model.MarkovModel.from_shared_memory(
+            shared_model.name, shared_model.layout
+        )
+        starts = attached.valid_startpoints
+        assert isinstance(starts.counts, memoryview)
+        assert starts.counts.readonly
+        assert len(starts.points) < len(starts) == 3 * len(words)
+        if novelty == "set":
+            assert isinstance(attached.known_words, novelty_index.PackedWords)
+            assert attached.known_words.data.readonly
+        else:
+            assert attached.known_words.bits.readonly
+        assert not any(attached.is_novel(word) for word in words)
+        assert attached.is_novel("hamburgo")
+
+
+def test_share_without_numpy(monkeypatch, words: list[str]) -> None:
+    """Test that models are shared without tables if NumPy is missing"""
+    monkeypatch.setattr(batch, "np", None)
+    mm = markov_model.MarkovModel(words, order=2, prior=0, rng=1)
+    with mm.share() as shared_model:
+        assert shared_model.layout["generator"] is None
+        attached = markov_model.MarkovModel.from_shared_memory(
+            shared_model.name, shared_model.layout, rng=1
+        )
+        assert attached.generate_batch(20, 10) == mm.generate_batch(20, 10)
+
+
+def test_close_releases_memory(words: list[str]) -> None:
+    """Test that closing the handle unlinks the shared memory block"""
+    mm = markov_model.MarkovModel(words, order=2, prior=0)
+    shared_model = mm.share()
+    shared_model.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=shared_model.name)
+
+
+def test_generate_many_shared_memory(words: list[str]) -> None:
+    """Test that workers attached to shared memory generate the same"""
+    mm = markov_model.MarkovModel(words, order=3, prior=0.1)
+    expected = mm.generate_many(300, 10, seed=2, chunk_size=64)
+    assert mm.generate_many(
+        300, 10, workers=2, seed=2, chunk_size=64, shared_memory=True
+    ) == expected